@@ -0,0 +1,105 @@
+"""
+Import-time benchmark for the CLI.
+
+Runs `python -X importtime cli.py ... --help` for each command line below
+and reports how long the project's own imports take, on top of a bare
+interpreter start. Exits non-zero if a command goes over the budget or
+pulls in one of the heavy modules that should only load on first use.
+
+    python benchmarks/import_time.py [--budget-ms 100] [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI_PATH = os.path.join(PROJECT_ROOT, "cli.py")
+
+COMMANDS = [
+    ["--help"],
+    ["analyze", "--help"],
+    ["batch", "--help"],
+    ["mastery", "--help"],
+    ["trace", "--help"],
+    ["results", "--help"],
+    ["summary", "--help"],
+    ["run", "--help"],
+]
+
+# Only commands that actually need data or the API may import these
+HEAVY_MODULES = ("pandas", "numpy", "pyarrow", "google.genai", "dotenv")
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int]]:
+    """(module, depth, cumulative microseconds) for every -X importtime line."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), depth, int(cumulative)))
+    return imports
+
+
+def run_once(args: list[str]) -> tuple[float, list[tuple[str, int, int]]]:
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=PROJECT_ROOT, capture_output=True, text=True)
+    return time.perf_counter() - start, parse_importtime(result.stderr)
+
+
+def measure(args: list[str], runs: int, baseline_modules: set[str]) -> tuple[float, float, set[str]]:
+    """Median wall time (s), median project import time (s), modules imported."""
+    walls, imports_times = [], []
+    modules: set[str] = set()
+
+    for _ in range(runs):
+        wall, imports = run_once(args)
+        walls.append(wall)
+        # Top-level imports after interpreter startup; site is environment noise
+        imports_times.append(sum(
+            cumulative for name, depth, cumulative in imports
+            if depth == 0 and name not in baseline_modules) / 1e6)
+        modules.update(name for name, _, _ in imports)
+
+    return statistics.median(walls), statistics.median(imports_times), modules
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=100.0,
+                        help="Max startup cost per command over a bare interpreter (default: 100)")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="Runs per command; the median is reported (default: 5)")
+    args = parser.parse_args()
+
+    _, baseline_imports = run_once(["-c", "pass"])
+    baseline_modules = {name for name, _, _ in baseline_imports}
+    baseline_wall = statistics.median(
+        run_once(["-c", "pass"])[0] for _ in range(args.runs))
+
+    print(f"Bare interpreter: {baseline_wall * 1000:.1f} ms")
+    print(f"{'command':<28}{'wall':>10}{'overhead':>10}{'imports':>10}  heavy modules")
+
+    failed = False
+    for command in COMMANDS:
+        wall, import_time, modules = measure([CLI_PATH, *command], args.runs, baseline_modules)
+        overhead = wall - baseline_wall
+        heavy = [m for m in HEAVY_MODULES if m in modules]
+        over_budget = max(overhead, import_time) * 1000 > args.budget_ms
+
+        print(f"{' '.join(command):<28}{wall * 1000:>8.1f}ms{overhead * 1000:>8.1f}ms"
+              f"{import_time * 1000:>8.1f}ms  {', '.join(heavy) or '-'}"
+              f"{'  OVER BUDGET' if over_budget else ''}")
+        failed = failed or over_budget or bool(heavy)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""
+Pipeline benchmark over synthetic ProgSnap2 exports.
+
+For each scale, generates (once) a synthetic dataset and times load_data,
+load_joined_datasets (cold and from the Parquet cache), get_best_attempts,
+format_submissions and analyze_all_submissions against the offline
+LocalBackend with the given latency. Each scale runs in its own process
+pointed at the synthetic data through KINTSUGI_DATASET_DIR, so the real
+dataset and caches are never touched.
+
+Results are written as JSON; pass an earlier file to --compare to flag
+stages that got slower between commits.
+
+    python benchmarks/pipeline.py [--scale 10k 1m 10m] [--latency 0.2]
+        [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCHMARK_DIR)
+DEFAULT_DATA_DIR = os.path.join(BENCHMARK_DIR, ".data")
+
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, BENCHMARK_DIR)
+
+from synthetic import SCALES  # noqa: E402
+
+# Stages slower than this ratio of the baseline are reported as regressions
+REGRESSION_RATIO = 1.2
+# ...and at least this many seconds slower, so millisecond stages don't flap
+REGRESSION_MIN_SECONDS = 0.05
+
+
+def timed(func, *args, **kwargs):
+    """Call func with its prints captured; returns (result, seconds)."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+    return result, elapsed
+
+
+def run_stages(repeat: int, latency: float, analyze_limit: int) -> dict:
+    """Time every stage in this process, which must already point at the synthetic data."""
+    from lib.attempts import get_best_attempts
+    from lib.backends import LocalBackend
+    from lib.llm_batch_analyzer import SUBMISSION_COLUMNS, analyze_all_submissions, use_backend
+    from lib.submission_prep import format_submissions
+    from utils.api_utils import RateLimitedExecutor
+    from utils.dataset import load_data, load_joined_datasets
+
+    stages = {}
+
+    def record(name: str, func, *args, **kwargs):
+        runs, result = [], None
+        for _ in range(repeat):
+            result, elapsed = timed(func, *args, **kwargs)
+            runs.append(elapsed)
+        stages[name] = {"seconds": statistics.median(runs), "runs": runs}
+        return result
+
+    main_table, _, _ = record("load_data", load_data)
+    events = len(main_table)
+    del main_table
+
+    record("load_joined_datasets.cold", load_joined_datasets, rebuild_cache=True)
+    spring = record("load_joined_datasets.cached", load_joined_datasets,
+                    terms=["spring-2019"], columns=SUBMISSION_COLUMNS)
+    best = record("get_best_attempts", get_best_attempts, spring)
+    submissions = best.to_dict(orient="records")
+    record("format_submissions", format_submissions, submissions)
+
+    sample = submissions[:analyze_limit]
+    backend = LocalBackend(latency=latency)
+    use_backend(backend)
+    executor = RateLimitedExecutor(backend, requests_per_minute=1_000_000,
+                                   tokens_per_minute=10**12)
+    results = record("analyze_all_submissions", analyze_all_submissions, sample, executor,
+                     use_cache=False, workers=1)
+
+    return {
+        "events": events,
+        "best_attempts": len(submissions),
+        "analyzed": len(sample),
+        "analyses_returned": len((results or {}).get("student_analysis", [])),
+        "requests": backend.calls // repeat,
+        # ru_maxrss is KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "stages": stages,
+    }
+
+
+def ensure_dataset(data_dir: str, scale: str) -> str:
+    from synthetic import generate_dataset
+
+    scale_dir = os.path.join(data_dir, scale)
+    if not os.path.exists(os.path.join(scale_dir, "CodeWorkout", "MainTable.csv")):
+        print(f"Generating {scale} synthetic dataset in {scale_dir}...", file=sys.stderr)
+        generate_dataset(scale_dir, SCALES[scale])
+    return scale_dir
+
+
+def run_scale(scale_dir: str, args: argparse.Namespace) -> dict:
+    env = {**os.environ, "KINTSUGI_DATASET_DIR": scale_dir}
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker",
+         "--repeat", str(args.repeat), "--latency", str(args.latency),
+         "--analyze-limit", str(args.analyze_limit)],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"benchmark worker failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def git_commit() -> str | None:
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                            cwd=PROJECT_ROOT, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+def compare(current: dict, baseline: dict, ratio: float) -> list[str]:
+    """Stages at least `ratio` times slower than in baseline, as report lines."""
+    regressions = []
+    for scale, measured in current["scales"].items():
+        before = baseline.get("scales", {}).get(scale)
+        if before is None:
+            continue
+        for stage, timing in measured["stages"].items():
+            old = before["stages"].get(stage)
+            if not old or not old["seconds"]:
+                continue
+            change = timing["seconds"] / old["seconds"]
+            print(f"  {scale:<5}{stage:<30}{old['seconds']:>9.3f}s -> {timing['seconds']:>9.3f}s  {change:>5.2f}x")
+            if change >= ratio and timing["seconds"] - old["seconds"] >= REGRESSION_MIN_SECONDS:
+                regressions.append(f"{scale} {stage}: {change:.2f}x slower")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", nargs="+", choices=list(SCALES), default=["10k"],
+                        help="Dataset sizes to run (default: 10k)")
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="Seconds per LocalBackend request (default: 0.2)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs per stage; the median is reported (default: 3)")
+    parser.add_argument("--analyze-limit", type=int, default=2_000,
+                        help="Best attempts sent through the analyzer (default: 2,000)")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR,
+                        help="Where synthetic datasets are generated and reused")
+    parser.add_argument("--output", default=None, help="Write the JSON results here (default: stdout)")
+    parser.add_argument("--compare", default=None, help="Earlier JSON results to compare against")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_stages(args.repeat, args.latency, args.analyze_limit)))
+        return 0
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "latency": args.latency,
+        "repeat": args.repeat,
+        "scales": {},
+    }
+
+    for scale in args.scale:
+        measured = run_scale(ensure_dataset(args.data_dir, scale), args)
+        report["scales"][scale] = measured
+        print(f"{scale}: {measured['events']:,} events, {measured['best_attempts']:,} best attempts, "
+              f"peak RSS {measured['peak_rss_mb']:,.0f} MB", file=sys.stderr)
+        for stage, timing in measured["stages"].items():
+            print(f"  {stage:<30}{timing['seconds']:>9.3f}s", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nAgainst {args.compare} (commit {baseline.get('commit')}):", file=sys.stderr)
+        with contextlib.redirect_stdout(sys.stderr):
+            regressions = compare(report, baseline, REGRESSION_RATIO)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
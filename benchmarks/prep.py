@@ -0,0 +1,116 @@
+"""
+Preparation-stage benchmark of the serial path against the process pool.
+
+Formats, fingerprints and token-sizes synthetic submissions both ways,
+checks that both produce identical output and reports the timings.
+
+    python benchmarks/prep.py [--submissions 20000] [--workers 4]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.batch_planner import TokenEstimator  # noqa: E402
+from lib.dedup import code_fingerprint  # noqa: E402
+from lib.submission_prep import PREP_SHARD_SIZE, format_submission, prepare_submissions  # noqa: E402
+
+TEMPLATES = [
+    """public int {f}(int[] {a}) {{
+    int {s} = 0;
+    for (int {i} = 0; {i} < {a}.length; {i}++) {{
+        if ({a}[{i}] % 2 == 0) {{
+            {s} += {a}[{i}];
+        }}
+    }}
+    return {s};
+}}""",
+    """public boolean {f}(String {a}) {{
+    // count the matches
+    int {s} = 0;
+    for (int {i} = 0; {i} < {a}.length() - 1; {i}++) {{
+        if ({a}.substring({i}, {i} + 2).equals("hi")) {s}++;
+    }}
+    return {s} > 1;
+}}""",
+    """public String {f}(String {a}, int {s}) {{
+    String {i} = "";
+    while ({s} > 0) {{
+        {i} = {i} + {a}.charAt({s} % {a}.length());
+        {s}--;
+    }}
+    return {i};
+}}""",
+]
+
+
+def make_submissions(count: int, seed: int = 0) -> list[dict]:
+    """Synthetic best attempts: a few templates with renamed variables."""
+    rng = random.Random(seed)
+    names = ["x", "y", "n", "count", "total", "str", "arr", "idx", "result", "k"]
+    submissions = []
+    for idx in range(count):
+        a, s, i = rng.sample(names, 3)
+        code = rng.choice(TEMPLATES).format(f=f"solve{rng.randint(1, 5)}", a=a, s=s, i=i)
+        submissions.append({
+            "SubjectID": 10_000 + idx // 50,
+            "ProblemID": rng.randint(1, 50),
+            "Attempt": rng.randint(1, 8),
+            "Score": rng.choice([0.0, 0.25, 0.5, 1.0]),
+            "Compile.Result": rng.choice(["Success", "Error", ""]),
+            "Code": code,
+        })
+    return submissions
+
+
+def serial_baseline(submissions: list[dict], estimator: TokenEstimator) -> tuple[list[str], list[int]]:
+    """The per-submission loop analyze_all_submissions used before."""
+    fingerprints = [code_fingerprint(sub.get("Code")) for sub in submissions]
+    sizes = [estimator.count(format_submission(0, sub)) for sub in submissions]
+    return fingerprints, sizes
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--submissions", type=int, default=20_000,
+                        help="Synthetic submissions to prepare (default: 20000)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes in the pool (default: one per CPU)")
+    parser.add_argument("--shard-size", type=int, default=PREP_SHARD_SIZE,
+                        help=f"Submissions per pool task (default: {PREP_SHARD_SIZE})")
+    args = parser.parse_args()
+
+    submissions = make_submissions(args.submissions)
+    estimator = TokenEstimator()
+
+    (fingerprints, sizes), baseline_time = timed(serial_baseline, submissions, estimator)
+    serial, serial_time = timed(prepare_submissions, submissions, workers=1)
+    pooled, pooled_time = timed(prepare_submissions, submissions, workers=args.workers,
+                                shard_size=args.shard_size)
+
+    identical = serial == pooled and serial.fingerprints == fingerprints
+    # Sizes are estimated from the body plus a fixed header, so allow the header digits
+    sizes_close = all(abs(a - b) <= 1 for a, b in zip(serial.sizes, sizes))
+
+    print(f"{args.submissions:,} submissions, {args.workers} workers "
+          f"(CPU count {os.cpu_count()}), shards of {args.shard_size:,}")
+    print(f"  serial baseline      {baseline_time:8.3f}s")
+    print(f"  prepare, 1 worker    {serial_time:8.3f}s")
+    print(f"  prepare, {args.workers} workers{' ' * (3 - len(str(args.workers)))}  {pooled_time:8.3f}s "
+          f"({baseline_time / pooled_time:.2f}x vs baseline)")
+    print(f"  identical output: {identical}, token sizes match baseline: {sizes_close}")
+
+    return 0 if identical and sizes_close else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""
+Synthetic ProgSnap2 exports shaped like the CodeWorkout dataset.
+
+Writes MainTable.csv, LinkTables/CodeStates.csv and LinkTables/Subject.csv
+with roughly the requested number of events, and copies the problem
+prompts and topics from the real dataset so the analyzer has its
+curriculum. Point the project at the result with KINTSUGI_DATASET_DIR.
+
+    python benchmarks/synthetic.py OUT_DIR [--events 1000000] [--seed 0]
+"""
+import argparse
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from prep import TEMPLATES  # noqa: E402
+
+SOURCE_DIR = os.path.join(PROJECT_ROOT, "dataset")
+COPIED_FILES = [
+    os.path.join("CodeWorkout", "Problem_Prompts", "problem_prompts.csv"),
+    os.path.join("Topics", "java_topics.json"),
+]
+
+MAIN_COLUMNS = [
+    "SubjectID", "AssignmentID", "ProblemID", "Attempt", "CodeStateID", "TermID",
+    "ServerTimestamp", "ToolInstances", "EventType", "Score", "EventID",
+    "Compile.Result", "CompileMessageType", "CompileMessageData",
+]
+
+SCALES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+
+TERMS = ["spring-2019", "fall-2019"]
+COMPILE_SUCCESS_RATE = 0.8
+MAX_ATTEMPTS = 6
+# Share of a student's problems they attempt at all
+PROBLEM_COVERAGE = 0.8
+# Distinct programs to draw code from; students often submit identical code
+CODE_VARIANTS = 2_000
+STUDENTS_PER_CHUNK = 2_000
+FIRST_SUBJECT_ID = 100_000
+
+
+def code_variants(count: int, rng: np.random.Generator) -> np.ndarray:
+    names = ["x", "y", "n", "count", "total", "str", "arr", "idx", "result", "k"]
+    variants = []
+    for _ in range(count):
+        a, s, i = rng.choice(names, 3, replace=False)
+        template = TEMPLATES[rng.integers(len(TEMPLATES))]
+        variants.append(template.format(f=f"solve{rng.integers(1, 6)}", a=a, s=s, i=i))
+    return np.array(variants, dtype=object)
+
+
+def _chunk_events(subject_ids: np.ndarray, problems: np.ndarray, variants: np.ndarray,
+                  rng: np.random.Generator, first_code_state: int, first_event: int) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """MainTable rows and CodeStates of one chunk of students."""
+    pair_students = np.repeat(subject_ids, len(problems))
+    pair_problems = np.tile(np.arange(len(problems)), len(subject_ids))
+    attempted = rng.random(len(pair_students)) < PROBLEM_COVERAGE
+    pair_students, pair_problems = pair_students[attempted], pair_problems[attempted]
+
+    # One row per attempt, numbered 1..n within its pair
+    attempts_per_pair = rng.integers(1, MAX_ATTEMPTS + 1, len(pair_students))
+    pair_of_attempt = np.repeat(np.arange(len(pair_students)), attempts_per_pair)
+    starts = np.repeat(np.cumsum(attempts_per_pair) - attempts_per_pair, attempts_per_pair)
+    attempt = np.arange(len(pair_of_attempt)) - starts + 1
+
+    n_attempts = len(pair_of_attempt)
+    code_state = first_code_state + np.arange(n_attempts)
+    compiled = rng.random(n_attempts) < COMPILE_SUCCESS_RATE
+    # Later attempts tend to score higher
+    score = np.clip(rng.random(n_attempts) + 0.15 * (attempt - 1), 0, 1)
+    score = np.where(compiled, np.round(score * 4) / 4, 0.0)
+
+    students = pair_students[pair_of_attempt]
+    problem_rows = problems[pair_problems[pair_of_attempt]]
+    term = np.where(students % 2 == 0, TERMS[0], TERMS[1])
+
+    # Run.Program, Compile and, for failed compiles, Compile.Error per attempt
+    kinds = [("Run.Program", np.ones(n_attempts, dtype=bool)),
+             ("Compile", np.ones(n_attempts, dtype=bool)),
+             ("Compile.Error", ~compiled)]
+    frames = []
+    for order, (event_type, mask) in enumerate(kinds):
+        frames.append(pd.DataFrame({
+            "_attempt": np.flatnonzero(mask),
+            "_order": order,
+            "EventType": event_type,
+        }))
+    events = pd.concat(frames, ignore_index=True).sort_values(
+        ["_attempt", "_order"], kind="stable", ignore_index=True)
+    rows = events["_attempt"].to_numpy()
+    is_run = (events["EventType"] == "Run.Program").to_numpy()
+    is_compile = (events["EventType"] == "Compile").to_numpy()
+    is_error = (events["EventType"] == "Compile.Error").to_numpy()
+
+    event_ids = first_event + np.arange(len(events))
+    main = pd.DataFrame({
+        "SubjectID": students[rows],
+        "AssignmentID": problem_rows[rows, 0],
+        "ProblemID": problem_rows[rows, 1],
+        "Attempt": attempt[rows],
+        "CodeStateID": code_state[rows],
+        "TermID": term[rows],
+        "ServerTimestamp": np.datetime64("2019-01-14T09:00:00") + event_ids.astype("timedelta64[s]") * 20,
+        "ToolInstances": "Java 8; CodeWorkout",
+        "EventType": events["EventType"].to_numpy(),
+        "Score": np.where(is_run, score[rows], np.nan),
+        "EventID": event_ids,
+        "Compile.Result": np.where(is_compile, np.where(compiled[rows], "Success", "Error"), ""),
+        "CompileMessageType": np.where(is_error, "error", ""),
+        "CompileMessageData": np.where(is_error, "cannot find symbol", ""),
+    }, columns=MAIN_COLUMNS)
+
+    code_states = pd.DataFrame({
+        "CodeStateID": code_state,
+        "Code": variants[rng.integers(len(variants), size=n_attempts)],
+    })
+    return main, code_states
+
+
+def generate_dataset(out_dir: str, events: int, seed: int = 0) -> dict:
+    """
+    Write a synthetic export of about `events` MainTable rows to out_dir.
+    Returns the row counts written.
+    """
+    rng = np.random.default_rng(seed)
+    variants = code_variants(CODE_VARIANTS, rng)
+
+    prompts = pd.read_csv(os.path.join(SOURCE_DIR, COPIED_FILES[0]))
+    problems = prompts[["AssignmentID", "ProblemID"]].to_numpy()
+
+    # Expected events per attempted (student, problem) pair
+    events_per_pair = (MAX_ATTEMPTS + 1) / 2 * (2 + (1 - COMPILE_SUCCESS_RATE))
+    n_students = max(1, round(events / (events_per_pair * PROBLEM_COVERAGE * len(problems))))
+
+    code_dir = os.path.join(out_dir, "CodeWorkout")
+    link_dir = os.path.join(code_dir, "LinkTables")
+    os.makedirs(link_dir, exist_ok=True)
+    for relative in COPIED_FILES:
+        target = os.path.join(out_dir, relative)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(os.path.join(SOURCE_DIR, relative), target)
+
+    main_path = os.path.join(code_dir, "MainTable.csv")
+    code_path = os.path.join(link_dir, "CodeStates.csv")
+    subject_ids = FIRST_SUBJECT_ID + np.arange(n_students)
+
+    written_events = written_codes = 0
+    for start in range(0, n_students, STUDENTS_PER_CHUNK):
+        main, code_states = _chunk_events(
+            subject_ids[start:start + STUDENTS_PER_CHUNK], problems, variants, rng,
+            first_code_state=written_codes + 1, first_event=written_events + 1)
+        first = start == 0
+        main.to_csv(main_path, mode="w" if first else "a", header=first, index=False)
+        code_states.to_csv(code_path, mode="w" if first else "a", header=first, index=False)
+        written_events += len(main)
+        written_codes += len(code_states)
+
+    pd.DataFrame({
+        "SubjectID": subject_ids,
+        "X-Grade": np.round(rng.uniform(0.3, 1.0, n_students), 2),
+    }).to_csv(os.path.join(link_dir, "Subject.csv"), index=False)
+
+    return {"events": written_events, "code_states": written_codes, "subjects": n_students}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("out_dir")
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = generate_dataset(args.out_dir, args.events, args.seed)
+    print(f"Wrote {counts['events']:,} events, {counts['code_states']:,} code states and "
+          f"{counts['subjects']:,} subjects to {args.out_dir} in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
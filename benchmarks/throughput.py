@@ -0,0 +1,101 @@
+"""
+Throughput and retry benchmark of the analyzer against the offline LocalBackend.
+
+Every combination of request concurrency and injected error rate analyzes
+the same synthetic submissions, and the wall time, requests, retries and
+analyses recovered are reported per run.
+
+    python benchmarks/throughput.py [--submissions 2000] [--latency 0.5]
+        [--concurrency 1 4 16] [--error-rate 0 0.2] [--output results.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from prep import make_submissions  # noqa: E402
+
+from lib.backends import LocalBackend  # noqa: E402
+from lib.llm_batch_analyzer import analyze_all_submissions, use_backend  # noqa: E402
+from utils.api_utils import RateLimitedExecutor  # noqa: E402
+from utils.telemetry import start_tracing, stop_tracing  # noqa: E402
+
+
+def run_once(submissions: list[dict], concurrency: int, error_rate: float, args: argparse.Namespace) -> dict:
+    backend = LocalBackend(latency=args.latency, error_rate=error_rate,
+                           truncate_rate=args.truncate_rate, seed=args.seed)
+    use_backend(backend)
+    executor = RateLimitedExecutor(backend, requests_per_minute=args.rpm,
+                                   tokens_per_minute=10**12, max_concurrency=concurrency)
+
+    tracer = start_tracing()
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        results = analyze_all_submissions(
+            submissions, executor, use_cache=False, max_prompt_tokens=args.max_tokens,
+            deduplicate=False, workers=1)
+        elapsed = time.perf_counter() - start
+    stop_tracing()
+
+    api = tracer.summary().get("api_call", {})
+    analyzed = len((results or {}).get("student_analysis", []))
+    return {
+        "concurrency": concurrency,
+        "error_rate": error_rate,
+        "seconds": elapsed,
+        "requests": api.get("count", 0),
+        "calls": backend.calls,
+        "retries": api.get("retries", 0),
+        "analyzed": analyzed,
+        "submissions_per_second": analyzed / elapsed if elapsed else 0.0,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--submissions", type=int, default=2_000,
+                        help="Synthetic submissions analyzed per run (default: 2000)")
+    parser.add_argument("--latency", type=float, default=0.5,
+                        help="Seconds per LocalBackend request (default: 0.5)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16],
+                        help="Concurrent request limits to run (default: 1 4 16)")
+    parser.add_argument("--error-rate", type=float, nargs="+", default=[0.0, 0.2],
+                        help="Injected 429/503 rates to run (default: 0 0.2)")
+    parser.add_argument("--truncate-rate", type=float, default=0.0,
+                        help="Share of responses cut off mid-JSON (default: 0)")
+    parser.add_argument("--rpm", type=int, default=1_000_000,
+                        help="Request quota; lower it to see the limiter dominate")
+    parser.add_argument("--max-tokens", type=int, default=20_000,
+                        help="Prompt token budget; smaller means more, smaller requests")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed for the submissions and the injected failures (default: 0)")
+    parser.add_argument("--output", default=None, help="Also write the rows as JSON here")
+    args = parser.parse_args()
+
+    submissions = make_submissions(args.submissions, args.seed)
+    rows = []
+
+    print(f"{args.submissions:,} submissions, {args.latency:g}s per request")
+    print(f"{'concurrency':>12}{'errors':>8}{'wall s':>9}{'requests':>10}{'retries':>9}"
+          f"{'analyzed':>10}{'subs/s':>9}")
+    for error_rate in args.error_rate:
+        for concurrency in args.concurrency:
+            row = run_once(submissions, concurrency, error_rate, args)
+            rows.append(row)
+            print(f"{concurrency:>12}{error_rate:>8.0%}{row['seconds']:>9.2f}{row['requests']:>10}"
+                  f"{row['retries']:>9}{row['analyzed']:>10,}{row['submissions_per_second']:>9.0f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"submissions": args.submissions, "latency": args.latency, "runs": rows}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
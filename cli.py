@@ -1,6 +1,14 @@
 import argparse
 
-from utils.constants import BATCH_SIZE
+from utils.constants import BATCH_SIZE, MAX_CONCURRENT_REQUESTS, MAX_PROMPT_TOKENS, PROGRESSION_TOKENS_PER_STUDENT, REQUESTS_PER_MINUTE, STREAM_CHUNK_SIZE, TOKENS_PER_MINUTE
+
+
+def backend_options(args: argparse.Namespace) -> dict:
+    """The analyze flags that apply to the chosen backend."""
+    if args.backend == "local":
+        return {"latency": args.latency, "error_rate": args.error_rate,
+                "truncate_rate": args.truncate_rate, "replay_path": args.replay, "seed": args.seed}
+    return {"record_path": args.record}
 
 
 def main() -> None:
@@ -13,15 +21,312 @@ def main() -> None:
         "analyze", help="Analyze code submissions using LLMs")
 
     analyze_parser.add_argument(
-        "--limit", type=int, default=BATCH_SIZE,
-        help="Limit the number of submissions to analyze (default: 50)")
+        "--limit", type=int, default=None,
+        help="Limit the number of submissions to analyze (default: all)")
+
+    analyze_parser.add_argument(
+        "--rebuild-cache", action="store_true",
+        help="Re-read the CSVs and rebuild the joined dataset cache")
+
+    analyze_parser.add_argument(
+        "--stream", action="store_true",
+        help="Stream MainTable in chunks and analyze batches as they fill up")
+
+    analyze_parser.add_argument(
+        "--chunk-size", type=int, default=STREAM_CHUNK_SIZE,
+        help=f"MainTable rows per chunk in --stream mode (default: {STREAM_CHUNK_SIZE:,})")
+
+    analyze_parser.add_argument(
+        "--rpm", type=int, default=REQUESTS_PER_MINUTE,
+        help=f"Gemini requests per minute quota (default: {REQUESTS_PER_MINUTE})")
+
+    analyze_parser.add_argument(
+        "--tpm", type=int, default=TOKENS_PER_MINUTE,
+        help=f"Gemini input tokens per minute quota (default: {TOKENS_PER_MINUTE:,})")
+
+    analyze_parser.add_argument(
+        "--concurrency", type=int, default=MAX_CONCURRENT_REQUESTS,
+        help=f"Max requests in flight at once (default: {MAX_CONCURRENT_REQUESTS})")
+
+    analyze_parser.add_argument(
+        "--no-cache", action="store_true",
+        help="Always call the API instead of reusing cached analyses")
+
+    analyze_parser.add_argument(
+        "--max-tokens", type=int, default=MAX_PROMPT_TOKENS,
+        help=f"Input token budget per request (default: {MAX_PROMPT_TOKENS:,})")
+
+    analyze_parser.add_argument(
+        "--no-dedup", action="store_true",
+        help="Analyze duplicate submissions separately instead of once per group")
+
+    analyze_parser.add_argument(
+        "--cluster", action="store_true",
+        help="Analyze one medoid per cluster of similar submissions and propagate "
+             "its analysis to the others, with a confidence score (full runs only)")
+
+    analyze_parser.add_argument(
+        "--triage", action="store_true",
+        help="Run static Java checks first: answer passing submissions and failures they "
+             "explain locally, and send the rest with the checks' hits as hints (full runs only)")
+
+    analyze_parser.add_argument(
+        "--no-context-cache", action="store_true",
+        help="Send the system instruction inline instead of as Gemini cached content")
+
+    analyze_parser.add_argument(
+        "--incremental", action="store_true",
+        help="Only analyze best attempts that changed since the last incremental run")
+
+    analyze_parser.add_argument(
+        "--workers", type=int, default=None,
+        help="Processes for preparing large inputs (default: CPU count, 1 = serial)")
+
+    analyze_parser.add_argument(
+        "--progression", action="store_true",
+        help="Send each best attempt with a compressed history of the attempts before it")
+
+    analyze_parser.add_argument(
+        "--progression-tokens", type=int, default=PROGRESSION_TOKENS_PER_STUDENT,
+        help=f"Attempt-history token budget per student (default: {PROGRESSION_TOKENS_PER_STUDENT:,})")
+
+    analyze_parser.add_argument(
+        "--no-save", action="store_true",
+        help="Don't record the results in the results store")
+
+    analyze_parser.add_argument(
+        "--trace-file", default=None,
+        help="Write the per-stage JSONL trace here (default: dataset/.cache/traces/)")
+
+    analyze_parser.add_argument(
+        "--profile", action="store_true",
+        help="Also profile the run with cProfile and tracemalloc")
+
+    backend_group = analyze_parser.add_argument_group(
+        "backend", "Where requests go; the local backend runs offline for load tests")
+
+    backend_group.add_argument(
+        "--backend", choices=["gemini", "local"], default="gemini",
+        help="LLM backend (default: gemini)")
+
+    backend_group.add_argument(
+        "--record", default=None, metavar="PATH",
+        help="gemini: append every response to this JSONL file for later replay")
+
+    backend_group.add_argument(
+        "--replay", default=None, metavar="PATH",
+        help="local: answer recorded prompts with their recorded responses")
+
+    backend_group.add_argument(
+        "--latency", type=float, default=0.0,
+        help="local: seconds per request (default: 0)")
+
+    backend_group.add_argument(
+        "--error-rate", type=float, default=0.0,
+        help="local: share of requests failing with a retryable 429/503 (default: 0)")
+
+    backend_group.add_argument(
+        "--truncate-rate", type=float, default=0.0,
+        help="local: share of responses cut short (default: 0)")
+
+    backend_group.add_argument(
+        "--seed", type=int, default=0,
+        help="local: seed for errors, truncation and synthesized analyses (default: 0)")
+
+    batch_parser = subparser.add_parser(
+        "batch", help="Analyze submissions with the Gemini Batch API (resumable)")
+
+    batch_parser.add_argument(
+        "run_name",
+        help="Name of the batch run; reuse it to resume polling and collect results")
+
+    batch_parser.add_argument(
+        "--limit", type=int, default=None,
+        help="Limit the number of submissions to analyze (default: all)")
+
+    batch_parser.add_argument(
+        "--shard-size", type=int, default=BATCH_SIZE,
+        help=f"Submissions per batch job (default: {BATCH_SIZE})")
+
+    batch_parser.add_argument(
+        "--no-wait", action="store_true",
+        help="Submit the jobs and exit without waiting for results")
+
+    batch_parser.add_argument(
+        "--no-save", action="store_true",
+        help="Don't record the results in the results store")
+
+    batch_parser.add_argument(
+        "--backend", choices=["gemini", "local"], default="gemini",
+        help="Where the jobs run; local answers them offline with synthesized analyses (default: gemini)")
+
+    mastery_parser = subparser.add_parser(
+        "mastery", help="Per-concept mastery from scores alone (no LLM)")
+
+    mastery_parser.add_argument(
+        "--student", default=None,
+        help="Show one student's mastery of every concept")
+
+    mastery_parser.add_argument(
+        "--concept", default=None,
+        help="Show every student's mastery of one concept (e.g. NestedFor)")
+
+    mastery_parser.add_argument(
+        "--threshold", type=float, default=1.0,
+        help="Score counted as solved (default: 1.0)")
+
+    mastery_parser.add_argument(
+        "--rebuild-cache", action="store_true",
+        help="Rebuild the joined dataset and concept index caches")
+
+    trace_parser = subparser.add_parser(
+        "trace", help="Knowledge tracing (BKT/PFA) over the attempt log (no LLM)")
+
+    trace_parser.add_argument(
+        "--model", choices=["bkt", "pfa"], default="bkt",
+        help="Bayesian Knowledge Tracing or Performance Factors Analysis (default: bkt)")
+
+    trace_parser.add_argument(
+        "--student", default=None,
+        help="Show one student's mastery and next-problem predictions")
+
+    trace_parser.add_argument(
+        "--all-attempts", action="store_true",
+        help="Use every run as an observation instead of first attempts only")
+
+    trace_parser.add_argument(
+        "--rebuild-cache", action="store_true",
+        help="Rebuild the joined dataset and concept index caches")
+
+    run_parser = subparser.add_parser(
+        "run", help="Analyze every term/assignment/problem slice of a TOML run spec concurrently")
+
+    run_parser.add_argument(
+        "spec", help="TOML run spec (e.g. run_specs/academic-year-2019.toml)")
+
+    run_parser.add_argument(
+        "--rebuild-cache", action="store_true",
+        help="Re-read the CSVs and rebuild the joined dataset cache")
+
+    run_parser.add_argument(
+        "--no-save", action="store_true",
+        help="Don't record the slices' results in the results store")
+
+    run_parser.add_argument(
+        "--workers", type=int, default=None,
+        help="Processes used to prepare large slices (default: CPU count)")
+
+    run_parser.add_argument(
+        "--trace-file", default=None,
+        help="Write the span trace here (default: a new file in dataset/.cache/traces)")
+
+    summary_parser = subparser.add_parser(
+        "summary", help="Class summary and dashboard plots from attempt statistics and saved results (no LLM)")
+
+    summary_parser.add_argument(
+        "--run", type=int, default=None,
+        help="Saved run whose knowledge gaps to include "
+             "(default: the latest analyze or batch run by a real model)")
+
+    summary_parser.add_argument(
+        "--output-dir", default=None,
+        help="Where to write summary.json and the plots (default: dataset/reports)")
+
+    summary_parser.add_argument(
+        "--threshold", type=float, default=1.0,
+        help="Score counted as solved (default: 1.0)")
+
+    summary_parser.add_argument(
+        "--top", type=int, default=10,
+        help="Entries per list and plot (default: 10)")
+
+    summary_parser.add_argument(
+        "--no-plots", action="store_true",
+        help="Only print and write summary.json")
+
+    summary_parser.add_argument(
+        "--rebuild-cache", action="store_true",
+        help="Rebuild the joined dataset and concept index caches")
+
+    results_parser = subparser.add_parser(
+        "results", help="Query saved analysis results (no LLM)")
+
+    results_actions = results_parser.add_subparsers(
+        dest="action", help="Queries")
+
+    results_actions.add_parser("runs", help="List saved runs")
+
+    gaps_parser = results_actions.add_parser(
+        "gaps", help="Knowledge gaps, e.g. critical gaps for one problem")
+    gaps_parser.add_argument("--problem", default=None, help="Only gaps on this problem")
+    gaps_parser.add_argument("--severity", default=None, help="Only gaps of this severity (e.g. critical)")
+    gaps_parser.add_argument("--concept", default=None, help="Only gaps missing this concept")
+    gaps_parser.add_argument("--student", default=None, help="Only this student's gaps")
+
+    at_risk_parser = results_actions.add_parser(
+        "at-risk", help="Students predicted to struggle with a topic")
+    at_risk_parser.add_argument("topic", help="Topic or concept, matched as a substring (e.g. NestedFor)")
+
+    student_parser = results_actions.add_parser(
+        "student", help="Every analysis of one student")
+    student_parser.add_argument("student", help="SubjectID")
+
+    for action_parser in (gaps_parser, at_risk_parser, student_parser):
+        action_parser.add_argument(
+            "--run", type=int, default=None,
+            help="Run to query (default: the latest)")
 
     args = parser.parse_args()
 
     match args.command:
         case "analyze":
             from commands.analyze import analyze_command
-            analyze_command(args.limit)
+            analyze_command(args.limit, rebuild_cache=args.rebuild_cache,
+                            stream=args.stream, chunk_size=args.chunk_size,
+                            requests_per_minute=args.rpm, tokens_per_minute=args.tpm,
+                            max_concurrency=args.concurrency,
+                            use_cache=not args.no_cache, max_prompt_tokens=args.max_tokens,
+                            deduplicate=not args.no_dedup,
+                            context_cache=not args.no_context_cache,
+                            incremental=args.incremental, workers=args.workers,
+                            save=not args.no_save, trace_path=args.trace_file,
+                            profile=args.profile, backend=args.backend,
+                            backend_options=backend_options(args),
+                            progression=args.progression,
+                            progression_tokens=args.progression_tokens,
+                            cluster=args.cluster,
+                            triage=args.triage)
+        case "batch":
+            from commands.batch import batch_command
+            batch_command(args.run_name, args.limit, args.shard_size,
+                          wait=not args.no_wait, save=not args.no_save, backend=args.backend)
+        case "mastery":
+            from commands.mastery import mastery_command
+            mastery_command(args.student, args.concept, args.threshold,
+                            rebuild_cache=args.rebuild_cache)
+        case "trace":
+            from commands.trace import trace_command
+            trace_command(args.model, args.student, args.all_attempts,
+                          rebuild_cache=args.rebuild_cache)
+        case "run":
+            from commands.run import run_command
+            run_command(args.spec, args.rebuild_cache, save=not args.no_save,
+                        workers=args.workers, trace_path=args.trace_file)
+        case "summary":
+            from commands.summary import summary_command
+            summary_command(args.run, args.output_dir, args.threshold, args.top,
+                            plots=not args.no_plots, rebuild_cache=args.rebuild_cache)
+        case "results":
+            if args.action is None:
+                results_parser.print_help()
+                return
+            from commands.results import results_command
+            results_command(args.action, getattr(args, "run", None),
+                            problem_id=getattr(args, "problem", None),
+                            severity=getattr(args, "severity", None),
+                            concept=getattr(args, "concept", None),
+                            student=getattr(args, "student", None),
+                            topic=getattr(args, "topic", None))
         case _:
             parser.print_help()
 
@@ -1,22 +1,221 @@
-from lib.llm_batch_analyzer import analyze_batch_submissions, print_analysis_results
-from utils.constants import BATCH_SIZE
-from utils.dataset import load_joined_datasets
+from itertools import islice
+from typing import TYPE_CHECKING
 
+from utils.constants import MAX_CONCURRENT_REQUESTS, MAX_PROMPT_TOKENS, PROGRESSION_TOKENS_PER_STUDENT, REQUESTS_PER_MINUTE, STREAM_CHUNK_SIZE, TOKENS_PER_MINUTE
 
-def analyze_command(limit: int = BATCH_SIZE) -> None:
-    data = load_joined_datasets()
-    if data is None:
+# pandas, the dataset helpers and the Gemini SDK are imported inside the
+# commands so that `cli.py --help` stays fast
+if TYPE_CHECKING:
+    from utils.api_utils import RateLimitedExecutor
+    from utils.results_store import ResultsStore
+
+
+def load_best_attempts(limit: int | None = None, rebuild_cache: bool = False) -> list[dict] | None:
+    """Spring 2019 best attempts as submission dicts, optionally capped at limit."""
+    from lib.attempts import get_best_attempts
+    from lib.llm_batch_analyzer import SUBMISSION_COLUMNS
+    from utils.dataset import load_joined_datasets
+
+    spring_2019 = load_joined_datasets(
+        terms=["spring-2019"], columns=SUBMISSION_COLUMNS, rebuild_cache=rebuild_cache)
+    if spring_2019 is None:
+        return None
+
+    submissions = get_best_attempts(spring_2019).to_dict(orient="records")
+    return submissions if limit is None else submissions[:limit]
+
+
+def load_progressions(limit: int | None = None, rebuild_cache: bool = False,
+                      tokens_per_student: int = PROGRESSION_TOKENS_PER_STUDENT) -> list[dict] | None:
+    """
+    Spring 2019 best attempts, each with its compressed attempt history
+    under "Trajectory", optionally capped at limit.
+    """
+    from lib.attempts import PAIR_KEYS, get_best_attempts
+    from lib.llm_batch_analyzer import SUBMISSION_COLUMNS, token_estimator
+    from lib.trajectories import compress_trajectories
+    from utils.dataset import load_joined_datasets
+
+    spring_2019 = load_joined_datasets(
+        terms=["spring-2019"], columns=SUBMISSION_COLUMNS, rebuild_cache=rebuild_cache)
+    if spring_2019 is None:
+        return None
+
+    best = get_best_attempts(spring_2019)
+    if limit is not None:
+        best = best.head(limit)
+        wanted = best[PAIR_KEYS].drop_duplicates()
+        spring_2019 = spring_2019.merge(wanted, on=PAIR_KEYS)
+
+    trajectories, stats = compress_trajectories(
+        spring_2019, tokens_per_student, token_estimator.chars_per_token)
+    print(f"Trajectories: {stats['attempts']:,} attempts in {stats['pairs']:,} histories, "
+          f"{stats['kept']:,} kept; ~{stats['tokens']:,} tokens vs ~{stats['full_tokens']:,} "
+          f"for every attempt's full code")
+
+    submissions = best.to_dict(orient="records")
+    for sub in submissions:
+        sub["Trajectory"] = trajectories.get((str(sub["SubjectID"]), str(sub["ProblemID"])))
+    return submissions
+
+
+def analyze_command(limit: int | None = None, rebuild_cache: bool = False,
+                    stream: bool = False, chunk_size: int = STREAM_CHUNK_SIZE,
+                    requests_per_minute: int = REQUESTS_PER_MINUTE,
+                    tokens_per_minute: int = TOKENS_PER_MINUTE,
+                    max_concurrency: int = MAX_CONCURRENT_REQUESTS,
+                    use_cache: bool = True, max_prompt_tokens: int = MAX_PROMPT_TOKENS,
+                    deduplicate: bool = True, context_cache: bool = True,
+                    incremental: bool = False, workers: int | None = None,
+                    save: bool = True, trace_path: str | None = None, profile: bool = False,
+                    backend: str = "gemini", backend_options: dict | None = None,
+                    progression: bool = False,
+                    progression_tokens: int = PROGRESSION_TOKENS_PER_STUDENT,
+                    cluster: bool = False, triage: bool = False) -> None:
+    """
+    Analyze Spring 2019 best attempts, printing per-stage timings at the end.
+
+    Args:
+        backend: "gemini", or "local" for the offline stand-in (lib.backends)
+        backend_options: Keyword arguments for the backend, e.g. latency and error_rate
+        progression: Send each best attempt with its compressed attempt history
+        progression_tokens: Attempt-history token budget per student
+        cluster: Analyze one medoid per cluster of similar submissions
+            and propagate its analysis to the rest (lib.clustering)
+        triage: Answer passing submissions and rule-explained failures
+            locally, sending the rest with rule hits as hints (lib.java_rules)
+        trace_path: JSONL file for the span trace (default: a new file in TRACE_DIR)
+        profile: Also run under cProfile and tracemalloc and report the hot spots
+    """
+    import contextlib
+    import os
+    import time
+
+    from utils.constants import TRACE_DIR
+    from utils.telemetry import profiled, span, start_tracing, stop_tracing
+
+    run_name = f"analyze-{time.strftime('%Y%m%d-%H%M%S')}"
+    tracer = start_tracing(trace_path or os.path.join(TRACE_DIR, f"{run_name}.jsonl"))
+    profiler = profiled(os.path.join(TRACE_DIR, run_name)) if profile else contextlib.nullcontext()
+    try:
+        with profiler, span("analyze", backend=backend, incremental=incremental, stream=stream):
+            _analyze(limit, rebuild_cache, stream, chunk_size, requests_per_minute, tokens_per_minute,
+                     max_concurrency, use_cache, max_prompt_tokens, deduplicate, context_cache,
+                     incremental, workers, save, backend, backend_options or {},
+                     progression, progression_tokens, cluster, triage)
+    finally:
+        stop_tracing()
+        tracer.print_summary()
+
+
+def _analyze(limit: int | None, rebuild_cache: bool, stream: bool, chunk_size: int,
+             requests_per_minute: int, tokens_per_minute: int, max_concurrency: int,
+             use_cache: bool, max_prompt_tokens: int, deduplicate: bool, context_cache: bool,
+             incremental: bool, workers: int | None, save: bool, backend: str, backend_options: dict,
+             progression: bool, progression_tokens: int, cluster: bool, triage: bool) -> None:
+    from lib.backends import create_backend
+    from lib.llm_batch_analyzer import analyze_all_submissions, get_backend, get_instruction_cache, print_student_analysis, use_backend
+    from utils.api_utils import RateLimitedExecutor
+    from utils.results_store import ResultsStore
+
+    store = ResultsStore() if save else None
+    params = {"limit": limit, "stream": stream, "incremental": incremental,
+              "max_prompt_tokens": max_prompt_tokens, "deduplicate": deduplicate,
+              "progression": progression, "cluster": cluster,
+              "triage": triage}
+
+    if progression and (stream or incremental):
+        print("--progression works on the full dataset; it can't be combined with --stream or --incremental.")
         return
 
-    spring_2019 = data[data["TermID"] == "spring-2019"]
+    use_backend(create_backend(backend, **backend_options))
+    model = get_backend().model
+    executor = RateLimitedExecutor(
+        get_backend(), requests_per_minute, tokens_per_minute, max_concurrency)
+    get_instruction_cache().enabled = context_cache
 
-    submissions = spring_2019.to_dict(orient="records")
+    if incremental:
+        from lib.incremental import checkpoint_path, run_incremental_analysis
+        from utils.checkpoint_store import CheckpointStore
 
-    print(f"\nAnalyzing {len(submissions):,} submissions from Spring 2019...")
+        checkpoint = CheckpointStore(checkpoint_path(backend))
+        print(f"Checkpoint: {checkpoint.path}")
+        results = run_incremental_analysis(
+            checkpoint, terms=["spring-2019"], executor=executor, use_cache=use_cache,
+            max_prompt_tokens=max_prompt_tokens, deduplicate=deduplicate)
+        if results:
+            print_student_analysis(results)
+            if store:
+                store.save_run("analyze", results, model, params)
+        return
 
-    results = analyze_batch_submissions(submissions, limit)
+    if stream:
+        run_id = store.start_run("analyze", model, params) if store else None
+        stream_command(limit, rebuild_cache, chunk_size,
+                       executor, use_cache, max_prompt_tokens, store, run_id)
+        if store:
+            print(f"Saved streamed analyses as run {run_id} in {store.path}")
+        return
+
+    if progression:
+        submissions = load_progressions(limit, rebuild_cache, progression_tokens)
+        # Identical final code can come from different histories
+        deduplicate = cluster = False
+    else:
+        submissions = load_best_attempts(limit, rebuild_cache)
+    if submissions is None:
+        return
+
+    print(f"\nAnalyzing {len(submissions):,} best attempts from Spring 2019"
+          f"{' with their attempt histories' if progression else ''}...")
+
+    results = analyze_all_submissions(
+        submissions, executor, use_cache, max_prompt_tokens, deduplicate=deduplicate, workers=workers,
+        cluster=cluster, triage=triage)
 
     if results:
-        print_analysis_results(results)
+        print_student_analysis(results)
+        if store:
+            store.save_run("analyze", results, model, params)
     else:
         print("Failed to get analysis results.")
+
+
+def stream_command(limit: int | None, rebuild_cache: bool, chunk_size: int,
+                   executor: "RateLimitedExecutor", use_cache: bool, max_prompt_tokens: int,
+                   store: "ResultsStore | None" = None, run_id: int | None = None) -> None:
+    """
+    Analyze the Spring 2019 best attempts while streaming MainTable in chunks, one
+    token-budgeted batch at a time. Each batch's results are added to run_id in
+    store as they arrive.
+
+    A first pass over the event log alone finds the best attempt of every
+    (SubjectID, ProblemID) pair; the second joins and analyzes only those
+    rows, so each pair is analyzed once.
+    """
+    from lib.attempts import best_attempt_events
+    from lib.llm_batch_analyzer import SUBMISSION_COLUMNS, analyze_submission_batches, plan_submission_stream, print_student_analysis
+    from utils.dataset import build_codestate_index, iter_event_chunks, iter_submissions
+
+    if build_codestate_index(rebuild=rebuild_cache, chunk_size=chunk_size) is None:
+        return
+
+    best_events = best_attempt_events(iter_event_chunks(
+        terms=["spring-2019"], chunk_size=chunk_size,
+        columns=["SubjectID", "ProblemID", "EventType", "Score", "Attempt", "EventID"]))
+    print(f"\nStreaming {len(best_events):,} Spring 2019 best attempts...")
+
+    submissions = islice(iter_submissions(
+        terms=["spring-2019"], columns=SUBMISSION_COLUMNS, chunk_size=chunk_size,
+        event_ids=best_events), limit)
+    batches = plan_submission_stream(submissions, max_prompt_tokens)
+
+    analyzed = 0
+    for results in analyze_submission_batches(batches, executor, use_cache):
+        print_student_analysis(results)
+        if store:
+            store.add_results(run_id, results)
+        analyzed += 1
+
+    if not analyzed:
+        print("Failed to get analysis results.")
@@ -0,0 +1,38 @@
+from commands.analyze import load_best_attempts
+from utils.constants import BATCH_SIZE
+
+
+def batch_command(run_name: str, limit: int | None = None, shard_size: int = BATCH_SIZE,
+                  wait: bool = True, rebuild_cache: bool = False, save: bool = True,
+                  backend: str = "gemini") -> None:
+    """
+    Analyze Spring 2019 best attempts through the Gemini Batch API (or the
+    offline local backend). Re-running with the same run name resumes the
+    saved jobs.
+    """
+    from lib.backends import BatchBackend, create_backend
+    from lib.llm_batch_analyzer import print_student_analysis
+    from lib.llm_individual_analyzer import load_manifest, run_batch_analysis
+
+    batch_backend = create_backend(backend)
+    if not isinstance(batch_backend, BatchBackend):
+        print(f"Error: the {backend} backend doesn't support batch jobs.")
+        return
+
+    submissions = []
+    if load_manifest(run_name) is None:
+        submissions = load_best_attempts(limit, rebuild_cache)
+        if not submissions:
+            print("No submissions found.")
+            return
+
+    results = run_batch_analysis(submissions, run_name, shard_size, wait, batch_backend)
+
+    if results:
+        print_student_analysis(results)
+        if results["missing"]:
+            print(f"Missing analyses: {', '.join(results['missing'])}")
+        if save:
+            from utils.results_store import ResultsStore
+            ResultsStore().save_run("batch", results, batch_backend.model,
+                                    {"run_name": run_name, "limit": limit, "shard_size": shard_size})
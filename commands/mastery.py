@@ -0,0 +1,37 @@
+def mastery_command(student: str | None = None, concept: str | None = None,
+                    threshold: float = 1.0, rebuild_cache: bool = False) -> None:
+    """
+    Concept mastery for Spring 2019 from best attempts and the concept
+    flags in problem_prompts.csv, no LLM calls.
+    """
+    from commands.analyze import load_best_attempts
+    from lib.concept_index import build_concept_index, concept_mastery
+    import pandas as pd
+
+    index = build_concept_index(rebuild=rebuild_cache)
+    submissions = load_best_attempts(rebuild_cache=rebuild_cache)
+    if index is None or not submissions:
+        print("No submissions found.")
+        return
+
+    mastery = concept_mastery(pd.DataFrame(submissions), index, threshold)
+
+    if concept is not None:
+        if concept not in mastery.columns:
+            print(f"Unknown concept '{concept}'. Known: {', '.join(index.concepts)}")
+            return
+        print(f"\nProblems exercising {concept}: {index.problems_for(concept)}")
+        print(mastery[concept].dropna().sort_values().to_string())
+        return
+
+    if student is not None:
+        rows = mastery[mastery.index.astype(str) == student]
+        if rows.empty:
+            print(f"No attempts for student {student}.")
+            return
+        print(f"\nConcept mastery for student {student}:")
+        print(rows.iloc[0].dropna().sort_values().to_string())
+        return
+
+    print(f"\nClass concept mastery ({len(mastery)} students, solved = score >= {threshold:g}):")
+    print(mastery.mean().sort_values().to_string(float_format="{:.1%}".format))
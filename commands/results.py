@@ -0,0 +1,80 @@
+import time
+from datetime import datetime
+
+
+def _resolve_run(store, run_id: int | None) -> int | None:
+    run_id = run_id if run_id is not None else store.latest_run()
+    if run_id is None:
+        print("No saved runs. Run `analyze` or `batch` first.")
+    return run_id
+
+
+def results_command(action: str | None, run_id: int | None = None, problem_id: str | None = None,
+                    severity: str | None = None, concept: str | None = None,
+                    student: str | None = None, topic: str | None = None) -> None:
+    """
+    Query saved analysis results without calling the LLM.
+
+    Args:
+        action: "runs", "gaps", "at-risk" or "student"
+        run_id: Run to query (default: the latest)
+        problem_id, severity, concept, student: Filters for "gaps"; student is also the "student" target
+        topic: Topic or concept for "at-risk"
+    """
+    from utils.results_store import ResultsStore
+
+    store = ResultsStore()
+    start = time.perf_counter()
+
+    if action == "runs":
+        runs = store.runs()
+        if not runs:
+            print("No saved runs.")
+        for run in runs:
+            started = datetime.fromtimestamp(run["started_at"]).strftime("%Y-%m-%d %H:%M")
+            print(f"{run['id']:>5}  {started}  {run['command']:<14} {run['model'] or '-':<20}"
+                  f"{run['analyses']:>8,} analyses")
+        store.close()
+        return
+
+    run_id = _resolve_run(store, run_id)
+    if run_id is None:
+        store.close()
+        return
+
+    if action == "gaps":
+        rows = store.query_gaps(run_id, problem_id, severity, concept, student)
+        elapsed = time.perf_counter() - start
+        for row in rows:
+            print(f"[{row['severity'] or '-'}] student {row['subject_id']}, problem {row['problem_id']}: "
+                  f"{row['gap']} ({row['missing_concept'] or 'no concept'})")
+        print(f"\n{len(rows):,} gaps in run {run_id} ({elapsed * 1000:.1f} ms)")
+
+    elif action == "at-risk":
+        rows = store.students_at_risk(run_id, topic)
+        elapsed = time.perf_counter() - start
+        for row in rows:
+            print(f"Student {row['subject_id']}: {row['mentions']} mentions "
+                  f"(problems {row['problems']}; {row['topics']})")
+        print(f"\n{len(rows):,} students at risk for '{topic}' in run {run_id} ({elapsed * 1000:.1f} ms)")
+
+    elif action == "student":
+        analyses = store.student_results(run_id, student)
+        elapsed = time.perf_counter() - start
+        if not analyses:
+            print(f"No analyses for student {student} in run {run_id}.")
+        for analysis in analyses:
+            duplicate = f" (same code as {analysis['duplicate_of']})" if analysis["duplicate_of"] else ""
+            if analysis["cluster_of"]:
+                duplicate = (f" (from similar code of {analysis['cluster_of']}, "
+                             f"confidence {analysis['confidence']:.2f})")
+            print(f"\nProblem {analysis['problem_id']}: score {analysis['score']}{duplicate}")
+            for gap in analysis["knowledge_gaps"]:
+                print(f"  - [{gap['severity'] or '-'}] {gap['gap']}")
+            for prediction in analysis["future_predictions"]:
+                print(f"  > at risk: {prediction['at_risk_topic']} ({prediction['reason']})")
+            if analysis["recommended_intervention"]:
+                print(f"  Intervention: {analysis['recommended_intervention']}")
+        print(f"\n({elapsed * 1000:.1f} ms)")
+
+    store.close()
@@ -0,0 +1,90 @@
+def run_command(spec_path: str, rebuild_cache: bool = False, save: bool = True,
+                workers: int | None = None, trace_path: str | None = None) -> None:
+    """
+    Analyze every slice of a TOML run spec (lib.run_spec) in one go: the
+    joined data is loaded once, then the slices are analyzed concurrently
+    through one rate-limited executor, so they share the API quota.
+
+    Writes each slice's results and a report.json to the spec's output_dir
+    (default: REPORTS_DIR/<spec name>) and saves each slice as a run in the
+    results store.
+
+    Args:
+        spec_path: TOML run spec
+        rebuild_cache: Re-read the CSVs and rebuild the joined dataset cache
+        save: Record each slice's results in the results store
+        workers: Processes used to prepare large slices (default: CPU count)
+        trace_path: JSONL file for the span trace (default: a new file in TRACE_DIR)
+    """
+    import asyncio
+    import os
+    import time
+
+    from lib.backends import create_backend
+    from lib.llm_batch_analyzer import get_backend, use_backend
+    from lib.run_spec import load_run_spec, load_slice_data, run_slices_async, slice_submissions, write_run_report
+    from utils.api_utils import RateLimitedExecutor
+    from utils.constants import REPORTS_DIR, TRACE_DIR
+    from utils.results_store import ResultsStore
+    from utils.telemetry import start_tracing, stop_tracing
+
+    try:
+        spec = load_run_spec(spec_path)
+    except (OSError, ValueError) as e:
+        print(f"Error reading run spec {spec_path}: {e}")
+        return
+
+    settings = spec.settings
+    print(f"Run {spec.name}: {len(spec.slices)} slices, up to {settings['parallel_slices']} at once, "
+          f"{settings['requests_per_minute']:,} RPM shared")
+
+    tracer = start_tracing(trace_path or os.path.join(
+        TRACE_DIR, f"run-{spec.name}-{time.strftime('%Y%m%d-%H%M%S')}.jsonl"))
+    try:
+        data = load_slice_data(spec, rebuild_cache)
+        if data is None:
+            return
+        submissions = {s.name: slice_submissions(data, s) for s in spec.slices}
+        del data
+
+        use_backend(create_backend(settings["backend"], **settings["backend_options"]))
+        executor = RateLimitedExecutor(
+            get_backend(), settings["requests_per_minute"], settings["tokens_per_minute"],
+            settings["max_concurrency"])
+
+        start = time.perf_counter()
+        outcomes = asyncio.run(run_slices_async(spec, submissions, executor, workers))
+        elapsed = time.perf_counter() - start
+    finally:
+        stop_tracing()
+
+    api = tracer.summary().get("api_call", {})
+    requests = api.get("count", 0)
+    # Share of the request quota used over the analysis wall time
+    utilization = requests / (settings["requests_per_minute"] * elapsed / 60) if elapsed else 0.0
+
+    print(f"\n{'slice':<24}{'submissions':>12}{'analyses':>10}{'seconds':>9}")
+    for slice_ in spec.slices:
+        outcome = outcomes[slice_.name]
+        analyses = len((outcome["results"] or {}).get("student_analysis", []))
+        print(f"{slice_.name:<24}{outcome['submissions']:>12,}{analyses:>10,}{outcome['seconds']:>9.1f}")
+    print(f"\n{requests:,} requests in {elapsed:.1f}s ({utilization:.0%} of the request quota), "
+          f"{api.get('retries', 0):,} retries, ~{api.get('prompt_tokens', 0):,} prompt tokens")
+
+    output_dir = settings["output_dir"] or os.path.join(REPORTS_DIR, spec.name)
+    report_path = write_run_report(spec, outcomes, output_dir, {
+        "seconds": round(elapsed, 3), "requests": requests, "quota_utilization": round(utilization, 3)})
+    print(f"Slice results and report written to {output_dir}")
+
+    if save:
+        store = ResultsStore()
+        for slice_ in spec.slices:
+            results = outcomes[slice_.name]["results"]
+            if results:
+                store.save_run(f"run {spec.name}/{slice_.name}", results, get_backend().model,
+                               {"spec": os.path.abspath(spec_path), "terms": slice_.terms,
+                                "assignments": slice_.assignments, "problems": slice_.problems,
+                                **slice_.options})
+        store.close()
+    tracer.print_summary()
+    print(f"Report: {report_path}")
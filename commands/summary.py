@@ -0,0 +1,105 @@
+def summary_command(run_id: int | None = None, output_dir: str | None = None, threshold: float = 1.0,
+                    top: int = 10, plots: bool = True, rebuild_cache: bool = False) -> None:
+    """
+    Class summary of Spring 2019 from attempt statistics and the stored
+    analyses of a run, no LLM calls: concept failure rates, a risk ranking
+    against X-Grade, and early vs late assignments. Writes summary.json and
+    the dashboard plots into output_dir.
+
+    Args:
+        run_id: Results store run whose gaps to include (default: the latest
+            analyze or batch run by a real model, if any)
+        output_dir: Where to write the report (default: REPORTS_DIR)
+        threshold: Score counted as solved
+        top: Entries per summary list and plot
+        plots: Render the matplotlib dashboard
+        rebuild_cache: Re-read the CSVs and rebuild the joined dataset cache
+    """
+    import json
+    import os
+    import time
+
+    import pandas as pd
+
+    from lib.attempts import get_best_attempts
+    from lib.class_stats import (concept_failure_rates, early_late_split, gap_counts, grade_correlation,
+                                 render_dashboard, risk_ranking, summarize)
+    from lib.concept_index import build_concept_index
+    from utils.constants import EARLY_ASSIGNMENTS, LATE_ASSIGNMENTS, REPORTS_DIR
+    from utils.dataset import load_joined_datasets
+    from utils.results_store import ResultsStore
+
+    start = time.perf_counter()
+    index = build_concept_index(rebuild=rebuild_cache)
+    spring_2019 = load_joined_datasets(
+        terms=["spring-2019"], rebuild_cache=rebuild_cache,
+        columns=["SubjectID", "AssignmentID", "ProblemID", "Attempt", "CodeStateID",
+                 "EventType", "Score", "X-Grade"])
+    if index is None or spring_2019 is None:
+        return
+    best = get_best_attempts(spring_2019)
+    del spring_2019
+
+    store = ResultsStore()
+    # Only these commands analyze the Spring 2019 best attempts loaded above
+    run_id = run_id or store.latest_run(["analyze", "batch"], exclude_models=["local"])
+    run = store.get_run(run_id) if run_id else None
+    gaps = pd.DataFrame(store.query_gaps(run_id) if run else [],
+                        columns=["subject_id", "problem_id", "severity", "missing_concept"])
+    store.close()
+
+    if run:
+        print(f"Gaps from run {run_id} ({run['command']}, {run['model'] or 'no model'})")
+        # Drop gaps of pairs outside the loaded best attempts, e.g. from another term
+        loaded = pd.MultiIndex.from_arrays([best["SubjectID"].astype(str), best["ProblemID"].astype(str)])
+        known = pd.MultiIndex.from_arrays([gaps["subject_id"], gaps["problem_id"]]).isin(loaded)
+        if not known.all():
+            print(f"  Ignoring {(~known).sum():,} gaps of pairs outside the Spring 2019 best attempts")
+            gaps = gaps[known]
+    elif run_id:
+        print(f"Run {run_id} not found; summarizing without stored gaps")
+        run_id = None
+    else:
+        print("No analyze or batch run by a real model saved; summarizing without stored gaps")
+
+    concepts = concept_failure_rates(best, index, threshold)
+    missing = gap_counts(gaps)
+    risk = risk_ranking(best, gaps, threshold)
+    students, assignments = early_late_split(best, EARLY_ASSIGNMENTS, LATE_ASSIGNMENTS, threshold)
+    summary = summarize(concepts, risk, missing, top)
+    elapsed = time.perf_counter() - start
+
+    print(f"\nConcept failure rates ({len(best):,} best attempts, solved = score >= {threshold:g}):")
+    print(concepts.head(top).to_string(float_format="{:.2f}".format))
+
+    if not missing.empty:
+        print(f"\nMissing concepts in run {run_id} ({len(gaps):,} gaps):")
+        print(missing.head(top).to_string())
+
+    print(f"\nHighest risk ({len(risk):,} students; Spearman with X-Grade {grade_correlation(risk):.2f}):")
+    print(risk.head(top).to_string(float_format="{:.2f}".format))
+
+    print(f"\nEarly {EARLY_ASSIGNMENTS} vs late {LATE_ASSIGNMENTS} assignments:")
+    print(assignments.to_string(float_format="{:.2f}".format))
+    both = students.dropna()
+    if len(both):
+        print(f"Students with both: {len(both):,}; mean solved early {both['early'].mean():.1%}, "
+              f"late {both['late'].mean():.1%}; {(both['late'] < both['early']).mean():.1%} did worse late")
+
+    print("\nClass summary:")
+    for key, values in summary.items():
+        print(f"  {key}: {', '.join(map(str, values)) or '-'}")
+    print(f"\n({elapsed:.2f}s)")
+
+    output_dir = output_dir or REPORTS_DIR
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "summary.json"), "w") as f:
+        json.dump({"run_id": run_id, "threshold": threshold, "class_summary": summary,
+                   "concepts": concepts.reset_index().to_dict(orient="records"),
+                   "assignments": assignments.reset_index().to_dict(orient="records")},
+                  f, indent=2, default=str)
+    print(f"Summary written to {os.path.join(output_dir, 'summary.json')}")
+
+    if plots:
+        for path in render_dashboard(output_dir, concepts, risk, students, assignments, missing, top):
+            print(f"Plot written to {path}")
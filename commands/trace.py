@@ -0,0 +1,54 @@
+import time
+
+
+def trace_command(model: str = "bkt", student: str | None = None, all_attempts: bool = False,
+                  rebuild_cache: bool = False) -> None:
+    """
+    Fit knowledge tracing over the Spring 2019 attempt log and report
+    per-concept parameters, mastery and next-problem predictions, no LLM calls.
+    """
+    from lib.concept_index import build_concept_index
+    from lib.knowledge_tracing import BKT, PFA, TRACE_COLUMNS, ambiguous_cases, build_observations
+    from utils.dataset import load_joined_datasets
+
+    index = build_concept_index(rebuild=rebuild_cache)
+    spring_2019 = load_joined_datasets(
+        terms=["spring-2019"], columns=TRACE_COLUMNS, rebuild_cache=rebuild_cache)
+    if index is None or spring_2019 is None:
+        return
+
+    observations = build_observations(
+        spring_2019, first_attempt_only=not all_attempts)
+
+    start = time.perf_counter()
+    tracer = BKT(index) if model == "bkt" else PFA(index)
+    tracer.fit(observations)
+    fitted = time.perf_counter()
+    predictions = tracer.predict()
+    print(f"Fit in {fitted - start:.2f}s, predicted {predictions.size:,} "
+          f"student-problem pairs in {(time.perf_counter() - fitted) * 1000:.1f} ms")
+
+    print(f"\n{model.upper()} parameters per concept:")
+    print(tracer.parameters().to_string(float_format="{:.3f}".format))
+
+    if student is not None:
+        rows = predictions[predictions.index.astype(str) == student]
+        if rows.empty:
+            print(f"No attempts for student {student}.")
+            return
+        if model == "bkt":
+            mastery = tracer.mastery()
+            print(f"\nP(known) for student {student}:")
+            print(mastery[mastery.index.astype(str) == student].iloc[0].sort_values().to_string(
+                float_format="{:.1%}".format))
+        print(f"\nP(next attempt correct) for student {student}, hardest first:")
+        print(rows.iloc[0].sort_values().head(10).to_string(float_format="{:.1%}".format))
+        return
+
+    if model == "bkt":
+        print("\nClass mean P(known):")
+        print(tracer.mastery().mean().sort_values().to_string(float_format="{:.1%}".format))
+
+    ambiguous = ambiguous_cases(predictions)
+    print(f"\n{len(ambiguous):,} of {predictions.size:,} student-problem pairs are ambiguous "
+          f"(35-65% predicted success) and worth an LLM analysis")
@@ -0,0 +1,157 @@
+from collections.abc import Iterable
+
+import numpy as np
+import pandas as pd
+
+from utils.telemetry import span
+
+PAIR_KEYS = ["SubjectID", "ProblemID"]
+
+# Submission outcome classes, best first
+STATUS_PRIORITY = {
+    "Success": 1,
+    "Ran But Failed Tests": 2,
+    "Compile Error": 3,
+    "Not Run": 4,
+}
+
+
+def _select_best(df: pd.DataFrame, keys: list[str], criteria: list[tuple[str, bool]]) -> pd.DataFrame:
+    """
+    Pick one row per group by lexicographic (column, maximize) criteria.
+
+    Each criterion but the last keeps the rows matching the group max/min
+    (a hash groupby transform), the last one resolves ties with idxmax/idxmin.
+    Nothing is sorted and no Python runs per group. Missing values lose.
+    """
+    df = df.reset_index(drop=True)
+    for idx, (col, maximize) in enumerate(criteria):
+        fill = -np.inf if maximize else np.inf
+        values = df[col].astype("float64").fillna(fill)
+        grouped = values.groupby([df[k] for k in keys], observed=True, sort=True)
+
+        if idx == len(criteria) - 1:
+            rows = grouped.idxmax() if maximize else grouped.idxmin()
+            return df.loc[rows.to_numpy()]
+
+        target = grouped.transform("max" if maximize else "min")
+        df = df[values == target]
+
+    return df
+
+
+def count_attempts(df: pd.DataFrame) -> pd.Series:
+    """Number of distinct code states submitted per (SubjectID, ProblemID)."""
+    return df.groupby(PAIR_KEYS, observed=True)["CodeStateID"].nunique().rename("AttemptCount")
+
+
+def get_best_attempts(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns a DataFrame with only the best attempt (highest Score)
+    for each student-problem pair, plus an AttemptCount column.
+
+    If there are ties, takes the latest attempt (highest Attempt number).
+    """
+    with span("best_attempts", input_rows=len(df)) as s:
+        # Filter to only Run.Program events (these have the Score)
+        run_events = df[df["EventType"] == "Run.Program"]
+
+        best_attempts = _select_best(
+            run_events, PAIR_KEYS, [("Score", True), ("Attempt", True)])
+
+        best_attempts = best_attempts.join(
+            count_attempts(df), on=PAIR_KEYS).reset_index(drop=True)
+        s.set(rows=len(best_attempts))
+
+    print(f"Best attempts: {len(best_attempts):,} rows")
+    print(f"  Unique students: {best_attempts['SubjectID'].nunique()}")
+    print(f"  Unique problems: {best_attempts['ProblemID'].nunique()}")
+
+    return best_attempts
+
+
+def best_attempt_events(chunks: Iterable[pd.DataFrame]) -> set[int]:
+    """
+    EventIDs of the best attempts (same rule as get_best_attempts) over a
+    stream of MainTable chunks. Each chunk's Run.Program rows are reduced
+    together with the best seen so far, so memory is bounded by the number
+    of (SubjectID, ProblemID) pairs, not by the length of the log.
+
+    Args:
+        chunks: Frames with SubjectID, ProblemID, EventType, Score, Attempt and EventID
+    """
+    best = None
+    for chunk in chunks:
+        runs = chunk.loc[chunk["EventType"] == "Run.Program", PAIR_KEYS + ["Score", "Attempt", "EventID"]]
+        if best is not None:
+            # The best so far goes first so ties keep the earliest event, as in get_best_attempts
+            runs = pd.concat([best, runs], ignore_index=True)
+        if not runs.empty:
+            best = _select_best(runs, PAIR_KEYS, [("Score", True), ("Attempt", True)])
+
+    return set() if best is None else set(best["EventID"].tolist())
+
+
+def classify_submissions(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Collapse the event log to one row per CodeStateID.
+
+    The row kept is the first Run.Program event (or the first event if the
+    code was never run). Adds:
+        Status: Success / Ran But Failed Tests / Compile Error / Not Run
+        ErrorMessage: first compile error message, if any
+    """
+    codes, _ = pd.factorize(df["CodeStateID"], sort=True)
+    event_type = df["EventType"].astype(str).to_numpy()
+    is_run = event_type == "Run.Program"
+    is_compile_error = event_type == "Compile.Error"
+    positions = np.arange(len(df))
+
+    n = codes.max() + 1 if len(codes) else 0
+    has_run = np.bincount(codes, weights=is_run, minlength=n) > 0
+    has_compile_error = np.bincount(
+        codes, weights=is_compile_error, minlength=n) > 0
+
+    run_scores = pd.Series(df["Score"].to_numpy(dtype="float64")[is_run])
+    max_run_score = run_scores.groupby(codes[is_run]).max().reindex(
+        range(n)).to_numpy()
+
+    # First Run.Program row per code state, falling back to its first row
+    first_row = np.full(n, len(df))
+    np.minimum.at(first_row, codes, positions)
+    first_run = np.full(n, len(df))
+    np.minimum.at(first_run, codes[is_run], positions[is_run])
+    rows = np.where(has_run, first_run, first_row)
+
+    submissions = df.iloc[rows].reset_index(drop=True)
+    submissions["Status"] = np.select(
+        [~has_run, max_run_score == 1.0, has_compile_error],
+        ["Not Run", "Success", "Compile Error"],
+        default="Ran But Failed Tests",
+    )
+
+    if "CompileMessageData" in df.columns:
+        messages = df.loc[is_compile_error, "CompileMessageData"]
+        first_message = messages.groupby(codes[is_compile_error]).first()
+        submissions["ErrorMessage"] = first_message.reindex(
+            range(n)).to_numpy()
+
+    return submissions
+
+
+def get_best_submissions(submissions: pd.DataFrame) -> pd.DataFrame:
+    """
+    Best classified submission per (SubjectID, ProblemID): best Status,
+    then highest Score, then latest Attempt.
+
+    Args:
+        submissions: Output of classify_submissions
+    """
+    ranked = submissions.assign(
+        Priority=submissions["Status"].map(STATUS_PRIORITY))
+
+    best = _select_best(ranked, PAIR_KEYS, [
+        ("Priority", False), ("Score", True), ("Attempt", True)])
+
+    return best.drop(columns="Priority").join(
+        count_attempts(submissions), on=PAIR_KEYS).reset_index(drop=True)
@@ -0,0 +1,350 @@
+import abc
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+from typing import NamedTuple
+
+from google.genai import errors, types
+
+# Severity the synthesized analyses give a gap, by score below
+SYNTHETIC_SEVERITY = [(0.5, "critical"), (0.8, "moderate"), (1.0, "minor")]
+
+# Concepts the synthesized analyses pick gaps and risks from
+SYNTHETIC_CONCEPTS = ["For", "NestedFor", "While", "If/Else", "NestedIf", "StringIndex",
+                      "StringLen", "ArrayIndex", "LogicAndNotOr", "Math%", "DefFunction"]
+
+SUBMISSION_PATTERN = re.compile(
+    r"Student ID: (\S+)\nProblem ID: (\S+)\nScore: (\S+)%")
+
+
+class BatchJob(NamedTuple):
+    name: str
+    state: str | None  # JOB_STATE_* name
+    result_file: str | None  # Output file to download once succeeded
+    error: str | None
+
+
+def contents_key(contents) -> str:
+    """Key identifying a request's contents in recordings."""
+    return hashlib.sha256(str(contents).encode()).hexdigest()
+
+
+class Backend(abc.ABC):
+    """
+    What the analyzers need from an LLM provider. Subclasses implement the
+    abstract async methods; generate() and batch() are blocking wrappers.
+
+    Failures are raised as google.genai errors.APIError (code 429 and 5xx
+    are retried by RateLimitedExecutor) whatever the provider, so retry and
+    salvage behavior is the same on every backend.
+
+    Args:
+        model: Model name, also part of every response cache key
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+
+    @abc.abstractmethod
+    async def generate_async(self, contents: str, config: types.GenerateContentConfig | None = None):
+        """One request; returns an object with .text and .usage_metadata."""
+
+    @abc.abstractmethod
+    async def count_tokens_async(self, contents: str) -> int:
+        """Prompt tokens of contents."""
+
+    @abc.abstractmethod
+    async def create_cache_async(self, system_instruction: str, ttl_seconds: int, display_name: str) -> str:
+        """Register system_instruction as cached content; returns its name."""
+
+    def generate(self, contents: str, config: types.GenerateContentConfig | None = None):
+        return asyncio.run(self.generate_async(contents, config))
+
+    async def batch_async(self, requests: list[tuple[str, types.GenerateContentConfig | None]],
+                          max_concurrency: int = 8) -> list:
+        """
+        Send (contents, config) requests concurrently, without quotas or
+        retries. Returns responses in request order; a failed request's
+        entry is its exception.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def send(contents, config):
+            async with semaphore:
+                return await self.generate_async(contents, config)
+
+        return await asyncio.gather(*(send(c, cfg) for c, cfg in requests), return_exceptions=True)
+
+    def batch(self, requests: list[tuple[str, types.GenerateContentConfig | None]],
+              max_concurrency: int = 8) -> list:
+        return asyncio.run(self.batch_async(requests, max_concurrency))
+
+
+class BatchBackend(Backend):
+    """
+    Backend that can also run file-backed batch jobs (the batch command):
+    upload a JSONL request file, start a job over it, poll the job and
+    download its output file.
+    """
+
+    @abc.abstractmethod
+    def upload_batch_file(self, path: str, display_name: str) -> str:
+        """Upload a JSONL file of batch requests; returns its file name."""
+
+    @abc.abstractmethod
+    def create_batch_job(self, file_name: str, display_name: str) -> str:
+        """Start a batch job over an uploaded request file; returns the job name."""
+
+    @abc.abstractmethod
+    def get_batch_job(self, job_name: str) -> BatchJob:
+        """Current state of a batch job."""
+
+    @abc.abstractmethod
+    def download_file(self, file_name: str) -> bytes:
+        """Contents of a batch job's output file."""
+
+
+class GeminiBackend(BatchBackend):
+    """
+    Gemini through the google-genai SDK.
+
+    Args:
+        client: genai.Client to send requests with
+        model: Gemini model name
+        record_path: Append every response to this JSONL file, for
+            LocalBackend to replay later
+    """
+
+    def __init__(self, client, model: str, record_path: str | None = None):
+        super().__init__(model)
+        self.client = client
+        self.record_path = record_path
+
+    def _record(self, contents, response) -> None:
+        if self.record_path and response is not None and response.text:
+            os.makedirs(os.path.dirname(self.record_path) or ".", exist_ok=True)
+            with open(self.record_path, "a") as f:
+                f.write(json.dumps({"key": contents_key(contents), "text": response.text}) + "\n")
+
+    async def generate_async(self, contents, config=None):
+        response = await self.client.aio.models.generate_content(
+            model=self.model, contents=contents, config=config)
+        self._record(contents, response)
+        return response
+
+    def generate(self, contents, config=None):
+        response = self.client.models.generate_content(
+            model=self.model, contents=contents, config=config)
+        self._record(contents, response)
+        return response
+
+    async def count_tokens_async(self, contents: str) -> int:
+        response = await self.client.aio.models.count_tokens(model=self.model, contents=contents)
+        return response.total_tokens
+
+    async def create_cache_async(self, system_instruction: str, ttl_seconds: int, display_name: str) -> str:
+        cached = await self.client.aio.caches.create(
+            model=self.model,
+            config=types.CreateCachedContentConfig(
+                system_instruction=system_instruction,
+                display_name=display_name,
+                ttl=f"{ttl_seconds}s",
+            ),
+        )
+        return cached.name
+
+    def upload_batch_file(self, path: str, display_name: str) -> str:
+        uploaded = self.client.files.upload(
+            file=path, config={"display_name": display_name, "mime_type": "jsonl"})
+        return uploaded.name
+
+    def create_batch_job(self, file_name: str, display_name: str) -> str:
+        job = self.client.batches.create(
+            model=self.model, src=file_name, config={"display_name": display_name})
+        return job.name
+
+    def get_batch_job(self, job_name: str) -> BatchJob:
+        job = self.client.batches.get(name=job_name)
+        return BatchJob(job.name, job.state.name if job.state else None,
+                        job.dest.file_name if job.dest else None,
+                        str(job.error) if job.error else None)
+
+    def download_file(self, file_name: str) -> bytes:
+        return self.client.files.download(file=file_name)
+
+
+class LocalResponse:
+    __slots__ = ("text", "usage_metadata")
+
+    def __init__(self, text: str, prompt_tokens: int, response_tokens: int):
+        self.text = text
+        self.usage_metadata = types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_tokens, candidates_token_count=response_tokens)
+
+
+def synthesize_analysis(contents: str, seed: int = 0) -> str:
+    """
+    Schema-valid analysis JSON for every submission block in contents,
+    derived only from the blocks' IDs and scores.
+    """
+    students = []
+    for student_id, problem_id, percent in SUBMISSION_PATTERN.findall(str(contents)):
+        score = float(percent) / 100
+        score = 0.0 if score != score else score  # NaN scores are formatted as "nan%"
+        rng = random.Random(f"{seed}:{student_id}:{problem_id}")
+        gaps, predictions = [], []
+        if score < 1.0:
+            concept = rng.choice(SYNTHETIC_CONCEPTS)
+            severity = next(level for bound, level in SYNTHETIC_SEVERITY if score < bound)
+            gaps.append({"gap": f"Incomplete use of {concept}", "evidence": f"Problem {problem_id} scored {percent}%",
+                         "missing_concept": concept, "severity": severity})
+            predictions.append({"at_risk_topic": rng.choice(SYNTHETIC_CONCEPTS),
+                                "reason": f"Builds on {concept}", "prerequisite_gap": concept})
+        students.append({
+            "student_id": student_id,
+            "problem_id": problem_id,
+            "score": score,
+            "knowledge_gaps": gaps,
+            "future_predictions": predictions,
+            "recommended_intervention": f"Review {gaps[0]['missing_concept']}" if gaps else "",
+        })
+
+    at_risk = sorted(students, key=lambda s: s["score"])[:5]
+    return json.dumps({
+        "student_analysis": students,
+        "class_summary": {
+            "common_gaps": sorted({g["missing_concept"] for s in students for g in s["knowledge_gaps"]}),
+            "highest_risk_students": [s["student_id"] for s in at_risk if s["score"] < 1.0],
+            "suggested_review_topics": [],
+        },
+    })
+
+
+class LocalBackend(BatchBackend):
+    """
+    Offline stand-in for load tests and benchmarks, deterministic for a
+    given seed: the same request always gets the same response, errors
+    and truncation regardless of concurrency.
+
+    Batch jobs run when they are created: the output file is written next
+    to the request file and the job name points at it, so jobs can still
+    be looked up after a restart.
+
+    Args:
+        latency: Seconds each generate call takes
+        error_rate: Share of calls failing with a retryable 429 or 503
+        truncate_rate: Share of responses cut short (exercises salvaging)
+        replay_path: JSONL recorded by GeminiBackend(record_path=...);
+            recorded contents get their recorded response, the rest are synthesized
+        chars_per_token: Ratio used for token counts and usage metadata
+        seed: Seed for the error, truncation and synthesis choices
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, truncate_rate: float = 0.0,
+                 replay_path: str | None = None, chars_per_token: float = 4.0, seed: int = 0):
+        super().__init__("local")
+        self.latency = latency
+        self.error_rate = error_rate
+        self.truncate_rate = truncate_rate
+        self.chars_per_token = chars_per_token
+        self.seed = seed
+        self.recordings: dict[str, str] = {}
+        self.calls = 0
+        self.failures = 0
+        self._attempts: dict[str, int] = {}
+        if replay_path:
+            with open(replay_path) as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.recordings[record["key"]] = record["text"]
+
+    def _tokens(self, text: str) -> int:
+        return int(len(text) / self.chars_per_token) + 1
+
+    async def generate_async(self, contents, config=None):
+        key = contents_key(contents)
+        attempt = self._attempts.get(key, 0)
+        self._attempts[key] = attempt + 1
+        self.calls += 1
+        # Seeded per request and attempt, so outcomes don't depend on scheduling
+        rng = random.Random(f"{self.seed}:{key}:{attempt}")
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if rng.random() < self.error_rate:
+            self.failures += 1
+            if rng.random() < 0.5:
+                raise errors.ClientError(429, {"error": {"message": "Local rate limit", "status": "RESOURCE_EXHAUSTED"}})
+            raise errors.ServerError(503, {"error": {"message": "Local overload", "status": "UNAVAILABLE"}})
+
+        text = self._respond(contents, rng)
+        return LocalResponse(text, self._tokens(str(contents)), self._tokens(text))
+
+    async def count_tokens_async(self, contents: str) -> int:
+        return self._tokens(contents)
+
+    async def create_cache_async(self, system_instruction: str, ttl_seconds: int, display_name: str) -> str:
+        return f"cachedContents/{display_name}"
+
+    def _respond(self, contents: str, rng: random.Random) -> str:
+        text = self.recordings.get(contents_key(contents))
+        if text is None:
+            text = synthesize_analysis(contents, self.seed)
+        if rng.random() < self.truncate_rate:
+            text = text[:rng.randint(len(text) // 4, len(text) * 3 // 4)]
+        return text
+
+    def upload_batch_file(self, path: str, display_name: str) -> str:
+        return os.path.abspath(path)
+
+    def create_batch_job(self, file_name: str, display_name: str) -> str:
+        """Answer every request line now; failed lines get an error instead of a response."""
+        output = os.path.splitext(file_name)[0] + ".local-output.jsonl"
+        with open(file_name) as requests, open(output, "w") as f:
+            for line in requests:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                contents = "".join(part.get("text", "") for content in record["request"]["contents"]
+                                   for part in content["parts"])
+                self.calls += 1
+                rng = random.Random(f"{self.seed}:{record['key']}")
+                if rng.random() < self.error_rate:
+                    self.failures += 1
+                    result = {"error": {"code": 500, "message": "Local batch failure"}}
+                else:
+                    text = self._respond(contents, rng)
+                    result = {"response": {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]}}
+                f.write(json.dumps({"key": record["key"], **result}) + "\n")
+        return f"local-batch:{output}"
+
+    def get_batch_job(self, job_name: str) -> BatchJob:
+        output = job_name.removeprefix("local-batch:")
+        if os.path.exists(output):
+            return BatchJob(job_name, "JOB_STATE_SUCCEEDED", output, None)
+        return BatchJob(job_name, "JOB_STATE_FAILED", None, f"No output file {output}")
+
+    def download_file(self, file_name: str) -> bytes:
+        with open(file_name, "rb") as f:
+            return f.read()
+
+
+def create_backend(name: str = "gemini", **options) -> Backend:
+    """
+    Backend by CLI name.
+
+    Args:
+        name: "gemini" or "local"
+        options: Keyword arguments of the backend; for "gemini", record_path
+    """
+    if name == "local":
+        return LocalBackend(**options)
+    if name == "gemini":
+        from lib.llm_batch_analyzer import MODEL_NAME, get_client
+        return GeminiBackend(get_client(), MODEL_NAME, **options)
+    raise ValueError(f"Unknown backend '{name}' (expected 'gemini' or 'local')")
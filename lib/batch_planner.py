@@ -0,0 +1,136 @@
+from collections import Counter
+from collections.abc import Callable, Iterable, Iterator
+
+from google.genai import errors
+
+from utils.constants import MAX_PROMPT_TOKENS, MAX_SUBMISSIONS_PER_REQUEST
+
+# How many entries each class_summary list keeps
+SUMMARY_TOP_N = 10
+
+
+class TokenEstimator:
+    """
+    Character-based token estimate, optionally calibrated once against the
+    SDK's count_tokens so batches can be packed without an API call each.
+    """
+
+    def __init__(self, chars_per_token: float = 4.0):
+        self.chars_per_token = chars_per_token
+        self.calibrated = False
+
+    def count(self, text: str) -> int:
+        return int(len(text) / self.chars_per_token) + 1
+
+    async def calibrate(self, backend, sample: str) -> None:
+        """Fit chars_per_token on sample using the backend's token counter."""
+        self.calibrated = True
+        try:
+            total_tokens = await backend.count_tokens_async(sample)
+        except errors.APIError as e:
+            print(
+                f"Warning: token calibration failed, assuming {self.chars_per_token} chars/token: {e}")
+            return
+
+        if total_tokens:
+            self.chars_per_token = len(sample) / total_tokens
+            print(
+                f"Calibrated token estimate: {self.chars_per_token:.2f} chars/token")
+
+
+def plan_batches(sizes: list[int], budget: int = MAX_PROMPT_TOKENS,
+                 max_items: int = MAX_SUBMISSIONS_PER_REQUEST) -> list[list[int]]:
+    """
+    Pack items into as few batches as possible (first-fit decreasing).
+
+    Args:
+        sizes: Token size of each item
+        budget: Max total tokens per batch
+        max_items: Max items per batch (bounds the response size)
+
+    Returns lists of item indices; each batch keeps the items' input order.
+    Items larger than the budget get a batch of their own.
+    """
+    batches: list[list[int]] = []
+    remaining: list[int] = []
+
+    for idx in sorted(range(len(sizes)), key=lambda i: -sizes[i]):
+        for b, batch in enumerate(batches):
+            if sizes[idx] <= remaining[b] and len(batch) < max_items:
+                batch.append(idx)
+                remaining[b] -= sizes[idx]
+                break
+        else:
+            if sizes[idx] > budget:
+                print(
+                    f"Warning: item {idx} needs ~{sizes[idx]:,} tokens, over the {budget:,} budget")
+            batches.append([idx])
+            remaining.append(budget - sizes[idx])
+
+    batches = [sorted(batch) for batch in batches]
+    return sorted(batches, key=lambda batch: batch[0])
+
+
+def pack_stream(items: Iterable, size: Callable[[object], int], budget: int = MAX_PROMPT_TOKENS,
+                max_items: int = MAX_SUBMISSIONS_PER_REQUEST) -> Iterator[list]:
+    """
+    Lazily group a stream into batches under the token budget (next-fit).
+    Only the batch being filled is held in memory.
+    """
+    batch: list = []
+    used = 0
+
+    for item in items:
+        item_size = size(item)
+        if batch and (used + item_size > budget or len(batch) >= max_items):
+            yield batch
+            batch, used = [], 0
+        batch.append(item)
+        used += item_size
+
+    if batch:
+        yield batch
+
+
+def summarize_class(student_analysis: list[dict]) -> dict:
+    """
+    Build class_summary from per-student analyses, so it covers every
+    batch instead of whichever one the model happened to see.
+    """
+    concept_students: dict[str, set] = {}
+    review_topics = Counter()
+    risk = Counter()
+
+    for student in student_analysis:
+        student_id = student.get("student_id", "Unknown")
+        for gap in student.get("knowledge_gaps", []):
+            concept = gap.get("missing_concept")
+            if concept:
+                concept_students.setdefault(concept, set()).add(student_id)
+                review_topics[concept] += 1
+            if gap.get("severity") == "critical":
+                risk[student_id] += 1
+        for pred in student.get("future_predictions", []):
+            if pred.get("at_risk_topic"):
+                review_topics[pred["at_risk_topic"]] += 1
+
+    common = sorted(
+        ((c, len(s)) for c, s in concept_students.items() if len(s) > 1),
+        key=lambda item: -item[1])
+
+    return {
+        "common_gaps": [c for c, _ in common[:SUMMARY_TOP_N]],
+        "highest_risk_students": [s for s, _ in risk.most_common(SUMMARY_TOP_N)],
+        "suggested_review_topics": [t for t, _ in review_topics.most_common(SUMMARY_TOP_N)],
+    }
+
+
+def merge_batch_results(results: list[dict]) -> dict:
+    """Concatenate per-batch student_analysis lists and recompute class_summary."""
+    student_analysis = [
+        student for result in results for student in result.get("student_analysis", [])]
+
+    return {
+        "student_analysis": student_analysis,
+        "class_summary": summarize_class(student_analysis),
+    }
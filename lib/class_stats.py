@@ -0,0 +1,190 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from lib.concept_index import ConceptIndex
+
+# Concepts in the summary lists and bars in the plots
+DASHBOARD_TOP_N = 10
+
+
+def _failed(best: pd.DataFrame, threshold: float) -> np.ndarray:
+    """Best attempts below threshold; never-run (NaN) scores count as failed."""
+    return ~(best["Score"].to_numpy(dtype="float64") >= threshold)
+
+
+def concept_failure_rates(best: pd.DataFrame, index: ConceptIndex, threshold: float = 1.0) -> pd.DataFrame:
+    """
+    Per concept: (student, problem) pairs exercising it, the share whose
+    best attempt is below threshold, students with at least one such
+    failure, and mean attempts per pair. Sorted by failure rate.
+
+    Args:
+        best: Best attempts (get_best_attempts), with AttemptCount
+        index: Concept index of the problems
+        threshold: Score counted as solved
+    """
+    rows = index.rows(best["ProblemID"].to_numpy())
+    known = rows >= 0
+    flags = index.matrix[rows[known]]
+    failed = _failed(best, threshold)[known]
+    attempts = best["AttemptCount"].to_numpy(dtype="float64")[known]
+
+    pairs = flags.sum(axis=0)
+    failing = flags & failed[:, None]
+    students_failing = pd.DataFrame(failing, columns=index.concepts).groupby(
+        best["SubjectID"].to_numpy()[known]).any().sum()
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rates = pd.DataFrame({
+            "pairs": pairs,
+            "failure_rate": failing.sum(axis=0) / pairs,
+            "students_failing": students_failing.to_numpy(),
+            "mean_attempts": (flags * attempts[:, None]).sum(axis=0) / pairs,
+        }, index=pd.Index(index.concepts, name="concept"))
+    return rates[rates["pairs"] > 0].sort_values("failure_rate", ascending=False)
+
+
+def gap_counts(gaps: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per missing concept in stored analyses: students, gaps and critical
+    gaps, concepts compared case-insensitively. Sorted by students.
+
+    Args:
+        gaps: Rows of ResultsStore.query_gaps (subject_id, missing_concept, severity)
+    """
+    if gaps.empty:
+        return pd.DataFrame(columns=["students", "gaps", "critical"])
+    concept = gaps["missing_concept"].fillna("").str.strip()
+    gaps = gaps.assign(concept=concept.str.lower(), label=concept,
+                       critical=gaps["severity"].eq("critical"))[concept != ""]
+    counts = gaps.groupby("concept").agg(
+        label=("label", "first"), students=("subject_id", "nunique"),
+        gaps=("subject_id", "size"), critical=("critical", "sum"))
+    return counts.set_index("label").rename_axis("concept").sort_values(
+        ["students", "critical"], ascending=False)
+
+
+def risk_ranking(best: pd.DataFrame, gaps: pd.DataFrame | None = None, threshold: float = 1.0) -> pd.DataFrame:
+    """
+    Per student: problems attempted, failure rate and mean attempts of
+    their best attempts, critical gaps in stored analyses, X-Grade, and
+    risk = failure rate + critical gaps per problem attempted. Sorted by
+    risk, then mean attempts.
+    """
+    per_student = best.assign(Failed=_failed(best, threshold)).groupby("SubjectID", observed=True).agg(
+        problems=("ProblemID", "size"), failure_rate=("Failed", "mean"),
+        mean_attempts=("AttemptCount", "mean"), grade=("X-Grade", "first"))
+    per_student.index = per_student.index.astype(str)
+
+    critical = pd.Series(0, index=per_student.index)
+    if gaps is not None and not gaps.empty:
+        critical = gaps[gaps["severity"].eq("critical")].groupby("subject_id").size().reindex(
+            per_student.index, fill_value=0)
+    per_student["critical_gaps"] = critical.astype(int)
+    per_student["risk"] = per_student["failure_rate"] + per_student["critical_gaps"] / per_student["problems"]
+    return per_student.sort_values(["risk", "mean_attempts"], ascending=False)
+
+
+def grade_correlation(risk: pd.DataFrame) -> float:
+    """Spearman correlation of risk with X-Grade (NaN if grades are missing)."""
+    ranked = risk[["risk", "grade"]].dropna().rank()
+    return float(ranked["risk"].corr(ranked["grade"])) if len(ranked) > 2 else float("nan")
+
+
+def early_late_split(best: pd.DataFrame, early: list[int], late: list[int], threshold: float = 1.0
+                     ) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Solve rates of the early assignments vs the late ones.
+
+    Returns:
+        students: Per student, early and late solve rates
+        assignments: Per assignment, its phase, solve rate and mean attempts
+    """
+    assignment = best["AssignmentID"].astype("int64")
+    phase = np.select([assignment.isin(early), assignment.isin(late)], ["early", "late"], "")
+    split = best.assign(Phase=phase, Solved=~_failed(best, threshold))[phase != ""]
+
+    students = split.groupby(["SubjectID", "Phase"], observed=True)["Solved"].mean().unstack()
+    students = students.reindex(columns=["early", "late"])
+    students.index = students.index.astype(str)
+
+    assignments = split.groupby(split["AssignmentID"].astype("int64")).agg(
+        phase=("Phase", "first"), solve_rate=("Solved", "mean"), mean_attempts=("AttemptCount", "mean"))
+    return students, assignments
+
+
+def summarize(concepts: pd.DataFrame, risk: pd.DataFrame, gaps: pd.DataFrame,
+              top: int = DASHBOARD_TOP_N) -> dict:
+    """
+    class_summary in the analyses' schema, computed over the whole class:
+    common gaps from stored analyses (failure rates if there are none),
+    highest-risk students, and the concepts failed most as review topics.
+    """
+    if not gaps.empty:
+        common = gaps[gaps["students"] > 1].index[:top].tolist()
+    else:
+        common = concepts[concepts["students_failing"] > 1].index[:top].tolist()
+    return {
+        "common_gaps": common,
+        "highest_risk_students": risk[risk["risk"] > 0].index[:top].tolist(),
+        "suggested_review_topics": concepts.index[:top].tolist(),
+    }
+
+
+def render_dashboard(out_dir: str, concepts: pd.DataFrame, risk: pd.DataFrame, students: pd.DataFrame,
+                     assignments: pd.DataFrame, gaps: pd.DataFrame, top: int = DASHBOARD_TOP_N) -> list[str]:
+    """Write the dashboard plots as PNGs into out_dir. Returns their paths."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+
+    def save(fig, name: str) -> None:
+        path = os.path.join(out_dir, name)
+        fig.tight_layout()
+        fig.savefig(path, dpi=120)
+        plt.close(fig)
+        paths.append(path)
+
+    fig, ax = plt.subplots(figsize=(8, 6))
+    shown = concepts.iloc[::-1]
+    ax.barh(shown.index, shown["failure_rate"] * 100)
+    ax.set_xlabel("Best attempts below threshold (%)")
+    ax.set_title("Failure rate by concept")
+    save(fig, "concept_failure_rates.png")
+
+    fig, ax = plt.subplots(figsize=(7, 5))
+    ax.scatter(risk["grade"], risk["risk"], s=12, alpha=0.6)
+    ax.set_xlabel("X-Grade")
+    ax.set_ylabel("Risk")
+    ax.set_title(f"Risk vs final grade (Spearman {grade_correlation(risk):.2f})")
+    save(fig, "risk_vs_grade.png")
+
+    fig, (left, right) = plt.subplots(1, 2, figsize=(12, 5))
+    left.scatter(students["early"], students["late"], s=12, alpha=0.6)
+    left.plot([0, 1], [0, 1], linestyle="--", color="gray")
+    left.set_xlabel("Early assignments solved")
+    left.set_ylabel("Late assignments solved")
+    left.set_title("Early vs late, per student")
+    colors = assignments["phase"].map({"early": "tab:blue", "late": "tab:orange"})
+    right.bar(assignments.index.astype(str), assignments["solve_rate"] * 100, color=colors)
+    right.set_xlabel("Assignment")
+    right.set_ylabel("Best attempts solved (%)")
+    right.set_title("Solve rate per assignment (early blue, late orange)")
+    save(fig, "early_vs_late.png")
+
+    if not gaps.empty:
+        fig, ax = plt.subplots(figsize=(8, 6))
+        shown = gaps.head(top).iloc[::-1]
+        ax.barh(shown.index, shown["students"], label="students")
+        ax.barh(shown.index, shown["critical"], label="critical gaps")
+        ax.set_xlabel("Count")
+        ax.set_title("Missing concepts in stored analyses")
+        ax.legend()
+        save(fig, "analysis_gaps.png")
+
+    return paths
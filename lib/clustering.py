@@ -0,0 +1,184 @@
+import math
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from lib.dedup import deduplicate_submissions, normalize_code
+
+# Hashed feature columns per code vector
+CLUSTER_FEATURES = 2**10
+# Token n-gram lengths hashed into the vectors
+CLUSTER_NGRAMS = (1, 2, 3)
+# Target members per cluster, so ~1 request in CLUSTER_SIZE
+CLUSTER_SIZE = 10
+# Members less cosine-similar than this to their medoid are analyzed themselves
+CLUSTER_MIN_SIMILARITY = 0.8
+MINIBATCH_SIZE = 256
+MINIBATCH_ITERATIONS = 50
+
+
+def code_vectors(codes: list[str], features: int = CLUSTER_FEATURES) -> np.ndarray:
+    """
+    L2-normalized TF-IDF vectors of hashed token n-grams, one row per code,
+    computed over normalize_code() so renamed variables and reformatting
+    don't move a submission.
+    """
+    counts = np.zeros((len(codes), features), dtype=np.float32)
+    for row, code in enumerate(codes):
+        tokens = normalize_code(code).split()
+        grams = Counter(
+            zlib.crc32(" ".join(tokens[i:i + n]).encode()) % features
+            for n in CLUSTER_NGRAMS for i in range(len(tokens) - n + 1))
+        if grams:
+            columns = np.fromiter(grams.keys(), dtype=np.int64, count=len(grams))
+            counts[row, columns] = np.fromiter(grams.values(), dtype=np.float32, count=len(grams))
+
+    present = counts > 0
+    idf = np.log((1 + len(codes)) / (1 + present.sum(axis=0))) + 1
+    vectors = np.where(present, 1 + np.log(np.maximum(counts, 1)), 0) * idf
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.where(norms > 0, norms, 1)).astype(np.float32)
+
+
+def minibatch_kmeans(vectors: np.ndarray, k: int, seed: int = 0,
+                     batch_size: int = MINIBATCH_SIZE, iterations: int = MINIBATCH_ITERATIONS
+                     ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Spherical mini-batch k-means (Sculley, 2010) over unit-length rows.
+
+    Returns each row's cluster label and the unit-length centroids.
+    """
+    n = len(vectors)
+    if k >= n:
+        return np.arange(n), vectors.copy()
+
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(n, k, replace=False)].copy()
+    seen = np.zeros(k)
+
+    for _ in range(iterations):
+        batch = vectors[rng.choice(n, min(batch_size, n), replace=False)]
+        nearest = (batch @ centroids.T).argmax(axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, nearest, batch)
+        hits = np.bincount(nearest, minlength=k)
+
+        # Per-centroid learning rate 1/count, applied to the batch mean
+        moved = hits > 0
+        seen[moved] += hits[moved]
+        rate = (hits[moved] / seen[moved])[:, None]
+        centroids[moved] = (1 - rate) * centroids[moved] + rate * sums[moved] / hits[moved, None]
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        centroids /= np.where(norms > 0, norms, 1)
+
+    return (vectors @ centroids.T).argmax(axis=1), centroids
+
+
+def _score_key(score) -> float | None:
+    try:
+        score = float(score)
+    except (TypeError, ValueError):
+        return None
+    return None if score != score else round(score, 2)
+
+
+def cluster_submissions(submissions: list[dict], fingerprints: list[str] | None = None,
+                        cluster_size: int = CLUSTER_SIZE, min_similarity: float = CLUSTER_MIN_SIMILARITY,
+                        seed: int = 0) -> tuple[list[dict], dict[tuple[str, str], list[dict]],
+                                                dict[tuple[str, str], float]]:
+    """
+    Group submissions to the same problem with the same score whose code is
+    similar, so only one medoid per group needs analyzing.
+
+    Exact duplicates are grouped first (deduplicate_submissions), then the
+    distinct code of each (ProblemID, Score) is clustered with mini-batch
+    k-means into ~1 cluster per cluster_size. The medoid is the member
+    closest to its centroid; members below min_similarity to it are split
+    off to be analyzed on their own.
+
+    Returns:
+        medoids: One submission per cluster, in input order
+        clusters: (SubjectID, ProblemID) of each medoid -> all members, medoid first
+        confidence: (SubjectID, ProblemID) of every submission -> cosine
+            similarity of its code to its medoid's (1.0 for medoids and
+            exact duplicates)
+    """
+    representatives, duplicates = deduplicate_submissions(submissions, fingerprints)
+
+    groups: dict[tuple, list[int]] = {}
+    for idx, rep in enumerate(representatives):
+        groups.setdefault((str(rep.get("ProblemID")), _score_key(rep.get("Score"))), []).append(idx)
+
+    # Index of each representative's medoid representative, and its similarity
+    medoid_of = list(range(len(representatives)))
+    similarity = [1.0] * len(representatives)
+
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        vectors = code_vectors([representatives[idx].get("Code") for idx in members])
+        labels, centroids = minibatch_kmeans(
+            vectors, math.ceil(len(members) / cluster_size), seed)
+
+        for label in np.unique(labels):
+            rows = np.flatnonzero(labels == label)
+            medoid_row = rows[(vectors[rows] @ centroids[label]).argmax()]
+            scores = vectors[rows] @ vectors[medoid_row]
+            for row, score in zip(rows, scores):
+                if row != medoid_row and score >= min_similarity:
+                    medoid_of[members[row]] = members[medoid_row]
+                    similarity[members[row]] = float(score)
+
+    def key(sub: dict) -> tuple[str, str]:
+        return str(sub.get("SubjectID")), str(sub.get("ProblemID"))
+
+    # The representatives' own order keeps the medoids in input order
+    clusters: dict[tuple[str, str], list[dict]] = {}
+    confidence: dict[tuple[str, str], float] = {}
+    for idx, rep in enumerate(representatives):
+        medoid = representatives[medoid_of[idx]]
+        members = duplicates[key(rep)]
+        clusters.setdefault(key(medoid), []).extend(members)
+        for member in members:
+            confidence[key(member)] = round(similarity[idx], 3)
+
+    medoids = [rep for idx, rep in enumerate(representatives) if medoid_of[idx] == idx]
+    for medoid in medoids:
+        # A medoid can come after members of its cluster in input order
+        members = clusters[key(medoid)]
+        members.remove(medoid)
+        members.insert(0, medoid)
+
+    return medoids, clusters, confidence
+
+
+def cluster_report(clusters: dict[tuple[str, str], list[dict]],
+                   confidence: dict[tuple[str, str], float]) -> dict:
+    """Submissions vs clusters, overall and per problem, with the mean propagated confidence."""
+    per_problem: dict[str, dict] = {}
+    propagated = []
+    for (_, problem_id), members in clusters.items():
+        stats = per_problem.setdefault(problem_id, {"submissions": 0, "clusters": 0})
+        stats["submissions"] += len(members)
+        stats["clusters"] += 1
+        propagated.extend(confidence[(str(m.get("SubjectID")), str(m.get("ProblemID")))]
+                          for m in members[1:])
+
+    total = sum(s["submissions"] for s in per_problem.values())
+    medoids = sum(s["clusters"] for s in per_problem.values())
+    return {
+        "submissions": total,
+        "clusters": medoids,
+        "reduction": 1 - medoids / total if total else 0.0,
+        "mean_confidence": sum(propagated) / len(propagated) if propagated else 1.0,
+        "per_problem": per_problem,
+    }
+
+
+def print_cluster_report(report: dict) -> None:
+    print(f"Clustered {report['submissions']:,} submissions into {report['clusters']:,} medoids "
+          f"({report['reduction']:.1%} fewer to analyze, mean confidence {report['mean_confidence']:.2f})")
+    for problem_id, stats in sorted(report["per_problem"].items()):
+        ratio = 1 - stats["clusters"] / stats["submissions"]
+        print(f"  Problem {problem_id}: {stats['submissions']} -> {stats['clusters']} ({ratio:.0%})")
@@ -0,0 +1,164 @@
+import functools
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.constants import CACHE_DIR, PROBLEM_PROMPT_PATH
+from utils.dataset import _source_fingerprint
+
+# problem_prompts.csv columns that are not concept flags
+PROMPT_COLUMNS = ["AssignmentID", "ProblemID", "Requirement"]
+
+# Curriculum chapters (java_topics.json) that teach each concept flag
+CONCEPT_CHAPTERS = {
+    "If/Else": [3],
+    "NestedIf": [3],
+    "While": [4],
+    "For": [4],
+    "NestedFor": [4],
+    "Math+-*/": [2],
+    "Math%": [2],
+    "LogicAndNotOr": [3],
+    "LogicCompareNum": [3],
+    "LogicBoolean": [3],
+    "StringFormat": [9],
+    "StringConcat": [2, 9],
+    "StringIndex": [9],
+    "StringLen": [9],
+    "StringEqual": [9],
+    "CharEqual": [2, 9],
+    "ArrayIndex": [6],
+    "DefFunction": [5],
+}
+
+
+class ConceptIndex:
+    """
+    Which concepts each problem exercises, from problem_prompts.csv.
+
+    Stored as a bitset matrix (one row per problem, one bit per concept,
+    packed with np.packbits) plus the inverted concept -> problems map.
+
+    Args:
+        problem_ids: ProblemID of each matrix row, ascending
+        concepts: Concept name of each bit column
+        bits: Packed (problems x ceil(concepts / 8)) uint8 matrix
+    """
+
+    def __init__(self, problem_ids: np.ndarray, concepts: list[str], bits: np.ndarray):
+        self.problem_ids = problem_ids
+        self.concepts = concepts
+        self.bits = bits
+        self.matrix = np.unpackbits(
+            bits, axis=1, count=len(concepts)).astype(bool)
+        self.problems_by_concept = {
+            concept: problem_ids[self.matrix[:, col]]
+            for col, concept in enumerate(concepts)}
+
+    @classmethod
+    def from_frame(cls, prompts: pd.DataFrame) -> "ConceptIndex":
+        concepts = [c for c in prompts.columns if c not in PROMPT_COLUMNS]
+        prompts = prompts.sort_values("ProblemID")
+        flags = prompts[concepts].fillna(0).to_numpy(dtype=float) > 0
+        return cls(prompts["ProblemID"].to_numpy(dtype=np.int32), concepts,
+                   np.packbits(flags, axis=1))
+
+    def rows(self, problem_ids) -> np.ndarray:
+        """Matrix row of each problem id, -1 for problems not in the index."""
+        problem_ids = np.asarray(problem_ids, dtype=np.int64)
+        if not len(self.problem_ids):
+            return np.full(len(problem_ids), -1)
+        rows = np.searchsorted(self.problem_ids, problem_ids)
+        rows = np.minimum(rows, len(self.problem_ids) - 1)
+        return np.where(self.problem_ids[rows] == problem_ids, rows, -1)
+
+    def concepts_for(self, problem_ids) -> list[str]:
+        """Union of the concepts exercised by problem_ids, in column order."""
+        rows = self.rows(problem_ids)
+        mask = self.matrix[rows[rows >= 0]].any(axis=0)
+        return [c for c, used in zip(self.concepts, mask) if used]
+
+    def problems_for(self, concept: str) -> list[int]:
+        return self.problems_by_concept.get(concept, np.array([], dtype=np.int32)).tolist()
+
+    def chapters_for(self, problem_ids) -> list[int]:
+        """Curriculum chapters covering the concepts of problem_ids."""
+        return sorted({chapter for concept in self.concepts_for(problem_ids)
+                       for chapter in CONCEPT_CHAPTERS.get(concept, [])})
+
+
+def _concept_cache_path() -> str | None:
+    fingerprint = _source_fingerprint((PROBLEM_PROMPT_PATH,))
+    if fingerprint is None:
+        return None
+    return os.path.join(CACHE_DIR, f"concepts-{fingerprint}.npz")
+
+
+def build_concept_index(rebuild: bool = False) -> ConceptIndex | None:
+    """
+    Load the concept index, building it from problem_prompts.csv on the
+    first call. Like the joined cache, it is keyed by the CSV's size and mtime.
+
+    Returns None if problem_prompts.csv is missing.
+    """
+    cache_path = _concept_cache_path()
+    if cache_path is None:
+        print(f"Error: {PROBLEM_PROMPT_PATH} not found.")
+        return None
+
+    if not rebuild and os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            return ConceptIndex(cached["problem_ids"], cached["concepts"].tolist(), cached["bits"])
+
+    index = ConceptIndex.from_frame(pd.read_csv(PROBLEM_PROMPT_PATH))
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    for name in os.listdir(CACHE_DIR):
+        if name.startswith("concepts-"):
+            os.remove(os.path.join(CACHE_DIR, name))
+    tmp_path = cache_path + ".tmp.npz"
+    np.savez(tmp_path, problem_ids=index.problem_ids,
+             concepts=np.array(index.concepts), bits=index.bits)
+    os.replace(tmp_path, cache_path)
+
+    print(
+        f"Built concept index: {len(index.problem_ids)} problems x {len(index.concepts)} concepts")
+    return index
+
+
+@functools.cache
+def get_concept_index() -> ConceptIndex | None:
+    return build_concept_index()
+
+
+def concept_mastery(attempts: pd.DataFrame, index: ConceptIndex, threshold: float = 1.0) -> pd.DataFrame:
+    """
+    Per-student mastery of every concept, without any LLM call.
+
+    Mastery is the share of a student's attempted problems exercising the
+    concept that they solved (best Score >= threshold); NaN where the
+    student attempted none.
+
+    Args:
+        attempts: One row per (SubjectID, ProblemID) with Score, e.g. best attempts
+        index: Concept index of the problems
+        threshold: Score counted as solved
+    """
+    rows = index.rows(attempts["ProblemID"].to_numpy())
+    known = rows >= 0
+    students, student_pos = np.unique(
+        attempts["SubjectID"].to_numpy()[known], return_inverse=True)
+
+    scores = attempts["Score"].to_numpy(dtype=float)[known]
+    attempted = np.zeros((len(students), len(index.problem_ids)))
+    solved = np.zeros_like(attempted)
+    np.maximum.at(attempted, (student_pos, rows[known]), 1.0)
+    np.maximum.at(solved, (student_pos, rows[known]),
+                  (np.nan_to_num(scores) >= threshold).astype(float))
+
+    concept_matrix = index.matrix.astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mastery = (solved @ concept_matrix) / (attempted @ concept_matrix)
+
+    return pd.DataFrame(mastery, index=pd.Index(students, name="SubjectID"), columns=index.concepts)
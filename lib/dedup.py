@@ -0,0 +1,128 @@
+import copy
+import hashlib
+
+from lib.batch_planner import summarize_class
+from lib.java_tokens import tokenize
+
+
+def normalize_code(code: str) -> str:
+    """
+    Canonical form of a Java submission: comments and whitespace removed,
+    local identifiers renamed v0, v1, ... in order of first use.
+
+    Names that carry meaning are kept: keywords, members after '.'
+    (length, substring, ...), method names (followed by '(') and
+    capitalized type names (String, Math, ...).
+    """
+    if not isinstance(code, str):
+        return ""
+
+    tokens = tokenize(code)
+    renamed: dict[str, str] = {}
+    parts = []
+
+    for idx, token in enumerate(tokens):
+        text = token.text
+        if token.kind == "identifier":
+            after_dot = idx > 0 and tokens[idx - 1].text == "."
+            is_call = idx + 1 < len(tokens) and tokens[idx + 1].text == "("
+            if not (after_dot or is_call or text[0].isupper()):
+                text = renamed.setdefault(text, f"v{len(renamed)}")
+        parts.append(text)
+
+    return " ".join(parts)
+
+
+def code_fingerprint(code: str) -> str:
+    return hashlib.sha1(normalize_code(code).encode()).hexdigest()
+
+
+def deduplicate_submissions(submissions: list[dict], fingerprints: list[str] | None = None
+                            ) -> tuple[list[dict], dict[tuple[str, str], list[dict]]]:
+    """
+    Group submissions whose normalized code is identical for the same problem.
+    Pass fingerprints (code_fingerprint of each submission) if already computed.
+
+    Returns:
+        representatives: First submission of each cluster, in input order
+        clusters: (SubjectID, ProblemID) of each representative -> all members
+    """
+    if fingerprints is None:
+        fingerprints = [code_fingerprint(sub.get("Code")) for sub in submissions]
+
+    by_fingerprint: dict[tuple, list[dict]] = {}
+    for sub, fingerprint in zip(submissions, fingerprints):
+        key = (str(sub.get("ProblemID")), fingerprint)
+        by_fingerprint.setdefault(key, []).append(sub)
+
+    representatives = []
+    clusters = {}
+    for members in by_fingerprint.values():
+        rep = members[0]
+        representatives.append(rep)
+        clusters[(str(rep.get("SubjectID")), str(rep.get("ProblemID")))] = members
+
+    return representatives, clusters
+
+
+def dedup_report(clusters: dict[tuple[str, str], list[dict]]) -> dict:
+    """Submissions vs unique code states, overall and per problem."""
+    per_problem: dict[str, dict] = {}
+    for (_, problem_id), members in clusters.items():
+        stats = per_problem.setdefault(
+            problem_id, {"submissions": 0, "unique": 0})
+        stats["submissions"] += len(members)
+        stats["unique"] += 1
+
+    total = sum(s["submissions"] for s in per_problem.values())
+    unique = sum(s["unique"] for s in per_problem.values())
+
+    return {
+        "submissions": total,
+        "unique": unique,
+        "dedup_ratio": 1 - unique / total if total else 0.0,
+        "per_problem": per_problem,
+    }
+
+
+def print_dedup_report(report: dict) -> None:
+    print(f"Deduplicated {report['submissions']:,} submissions into {report['unique']:,} unique "
+          f"({report['dedup_ratio']:.1%} fewer to analyze)")
+    for problem_id, stats in sorted(report["per_problem"].items()):
+        ratio = 1 - stats["unique"] / stats["submissions"]
+        print(
+            f"  Problem {problem_id}: {stats['submissions']} -> {stats['unique']} ({ratio:.0%})")
+
+
+def expand_cluster_results(results: dict, clusters: dict[tuple[str, str], list[dict]],
+                           confidence: dict[tuple[str, str], float] | None = None) -> dict:
+    """
+    Copy each representative's analysis to every member of its cluster
+    and recompute class_summary over the expanded list.
+
+    Members are marked duplicate_of the representative, or with
+    confidence (from cluster_submissions) cluster_of it with their score.
+    """
+    student_analysis = []
+    for student in results.get("student_analysis", []):
+        key = (str(student.get("student_id")), str(student.get("problem_id")))
+        members = clusters.get(key)
+        if not members:
+            student_analysis.append(student)
+            continue
+
+        for member in members:
+            entry = copy.deepcopy(student)
+            entry["student_id"] = str(member.get("SubjectID"))
+            if confidence is not None:
+                entry["confidence"] = confidence.get((entry["student_id"], key[1]), 1.0)
+                if member is not members[0]:
+                    entry["cluster_of"] = key[0]
+            elif member is not members[0]:
+                entry["duplicate_of"] = key[0]
+            student_analysis.append(entry)
+
+    return {
+        "student_analysis": student_analysis,
+        "class_summary": summarize_class(student_analysis),
+    }
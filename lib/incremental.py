@@ -0,0 +1,108 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from lib.attempts import get_best_attempts
+from lib.batch_planner import summarize_class
+from lib.llm_batch_analyzer import SUBMISSION_COLUMNS, analyze_all_submissions
+from utils.api_utils import RateLimitedExecutor
+from utils.checkpoint_store import CheckpointStore
+from utils.constants import CHECKPOINT_PATH, MAX_PROMPT_TOKENS, STATE_DIR
+from utils.dataset import load_new_events
+
+# Submission columns plus the event cursor
+INCREMENTAL_COLUMNS = SUBMISSION_COLUMNS + ["EventID", "ServerTimestamp"]
+
+
+def checkpoint_path(backend: str) -> str:
+    """
+    Checkpoint of a backend's incremental runs. Only "gemini" uses
+    CHECKPOINT_PATH, so offline backends never advance its event cursor or
+    mix synthetic analyses into its state.
+    """
+    return CHECKPOINT_PATH if backend == "gemini" else os.path.join(STATE_DIR, f"checkpoint-{backend}.sqlite")
+
+
+def changed_best_attempts(events: pd.DataFrame, store: CheckpointStore) -> list[dict]:
+    """
+    Best attempts among the new events that beat the stored best attempt
+    of their (SubjectID, ProblemID) pair, by the get_best_attempts rule
+    (highest Score, then highest Attempt). New pairs always count.
+    """
+    best = get_best_attempts(events)
+    if best.empty:
+        return []
+
+    pairs = list(zip(best["SubjectID"].astype(str), best["ProblemID"].astype(str)))
+    stored = store.best_attempts(pairs)
+
+    def as_float(value) -> float:
+        return -np.inf if value is None or pd.isna(value) else float(value)
+
+    changed = [
+        pair not in stored or (as_float(score), as_float(attempt))
+        > (as_float(stored[pair][0]), as_float(stored[pair][1]))
+        for pair, score, attempt in zip(pairs, best["Score"], best["Attempt"])]
+
+    best = best[changed].drop(columns=["AttemptCount", "EventID", "ServerTimestamp"], errors="ignore")
+    print(f"{len(best):,} of {len(pairs):,} touched (SubjectID, ProblemID) pairs have a new best attempt")
+    return best.to_dict(orient="records")
+
+
+def run_incremental_analysis(store: CheckpointStore | None = None, terms: list[str] | None = None,
+                             executor: RateLimitedExecutor | None = None, use_cache: bool = True,
+                             max_prompt_tokens: int = MAX_PROMPT_TOKENS,
+                             deduplicate: bool = True) -> dict | None:
+    """
+    Analyze only what changed since the last run and merge it into the
+    stored state.
+
+    Loads MainTable events after the checkpointed EventID, finds the pairs
+    whose best attempt improved, analyzes those (plus any left pending by a
+    failed run) and regenerates class_summary over every stored analysis.
+
+    Args:
+        store: Checkpoint store (defaults to the one at CHECKPOINT_PATH)
+        terms: Only consider events from these TermIDs
+        executor: Rate-limited executor to send the requests through
+        use_cache: Reuse previous responses for identical requests
+        max_prompt_tokens: Input token budget per request
+        deduplicate: Analyze duplicate submissions once per group
+    """
+    store = store or CheckpointStore()
+    last_event_id, last_timestamp = store.last_event()
+    if last_event_id is None:
+        print("No checkpoint yet, analyzing the full history")
+    else:
+        print(f"Resuming after EventID {last_event_id} ({last_timestamp})")
+
+    events = load_new_events(last_event_id, terms, INCREMENTAL_COLUMNS)
+    if events is None:
+        return None
+
+    if not events.empty:
+        changed = changed_best_attempts(events, store)
+        latest = events.loc[events["EventID"].idxmax()]
+        store.record_events(changed, int(latest["EventID"]), latest["ServerTimestamp"])
+
+    pending = store.pending_submissions()
+    if pending:
+        print(f"\nAnalyzing {len(pending):,} changed submissions...")
+        results = analyze_all_submissions(
+            pending, executor, use_cache, max_prompt_tokens, deduplicate=deduplicate)
+
+        wanted = {(str(sub["SubjectID"]), str(sub["ProblemID"])) for sub in pending}
+        analyzed = [entry for entry in (results or {}).get("student_analysis", [])
+                    if (str(entry.get("student_id")), str(entry.get("problem_id"))) in wanted]
+        store.save_analyses(analyzed)
+        if len(analyzed) < len(wanted):
+            print(f"Warning: {len(wanted) - len(analyzed):,} submissions left pending for the next run")
+    else:
+        print("No new best attempts; nothing to analyze.")
+
+    student_analysis = store.analyses()
+    return {
+        "student_analysis": student_analysis,
+        "class_summary": summarize_class(student_analysis),
+    }
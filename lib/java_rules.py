@@ -0,0 +1,361 @@
+from collections import Counter
+from collections.abc import Callable
+from typing import NamedTuple
+
+from lib.java_tokens import Token, tokenize
+
+BRACKETS = {"(": ")", "[": "]", "{": "}"}
+
+
+class Rule(NamedTuple):
+    name: str
+    concept: str  # Concept tag of problem_prompts.csv the pattern shows is missing
+    severity: str  # critical / moderate / minor, as in the model's analyses
+    gap: str
+    at_risk_topic: str
+    risk_reason: str
+    intervention: str
+    decisive: bool  # A hit on failing code explains the failure without the model
+    check: Callable[["Source"], list[str]]  # Evidence snippet of every hit
+
+
+class RuleHit(NamedTuple):
+    rule: str
+    concept: str
+    severity: str
+    gap: str
+    evidence: str
+    decisive: bool
+
+
+class Source:
+    """Tokens of one submission, with bracket matches and declared names for the rules."""
+
+    def __init__(self, code: str):
+        self.code = code
+        self.tokens = tokenize(code)
+        self.pairs = _match_brackets(self.tokens)
+        self.strings = self._declared(lambda i: self.tokens[i].text == "String")
+        self.arrays = self._declared(lambda i: self.tokens[i].text == "]")
+
+    def text(self, i: int) -> str:
+        return self.tokens[i].text if 0 <= i < len(self.tokens) else ""
+
+    def _declared(self, is_type: Callable[[int], bool]) -> set[str]:
+        return {self.tokens[i + 1].text for i in range(len(self.tokens) - 1)
+                if is_type(i) and self.tokens[i + 1].kind == "identifier"}
+
+    def snippet(self, first: int, last: int) -> str:
+        """Source text from token first through token last, with its line number."""
+        start = self.tokens[first].start
+        end = self.tokens[last].start + len(self.tokens[last].text)
+        line = self.code.count("\n", 0, start) + 1
+        return f"line {line}: {' '.join(self.code[start:end].split())}"
+
+    def statement_end(self, i: int) -> int:
+        """Index of the token ending the statement starting at i."""
+        last = len(self.tokens) - 1
+        if self.text(i) == "{":
+            return self.pairs.get(i, last)
+        if self.text(i) == "else":
+            return self.statement_end(i + 1)
+        if self.text(i) in ("if", "for", "while") and self.text(i + 1) == "(":
+            close = self.pairs.get(i + 1)
+            if close is None or close >= last:
+                return last
+            end = self.statement_end(close + 1)
+            # An else belongs to the nearest if, which is this one once its branch is skipped
+            if self.text(i) == "if" and self.text(end + 1) == "else":
+                end = self.statement_end(end + 1)
+            return end
+        while i < len(self.tokens) and self.text(i) != ";":
+            i = self.pairs.get(i, i) + 1 if self.text(i) in BRACKETS else i + 1
+        return min(i, len(self.tokens) - 1)
+
+    def statements(self, opening: int) -> list[int]:
+        """First token of each statement directly inside the block opened at opening."""
+        starts, i, close = [], opening + 1, self.pairs.get(opening, len(self.tokens))
+        while i < close:
+            starts.append(i)
+            i = self.statement_end(i) + 1
+        return starts
+
+    def always_returns(self, i: int) -> bool:
+        """True if the statement starting at i returns on every path."""
+        if self.text(i) == "return":
+            return True
+        if self.text(i) == "{":
+            return any(self.always_returns(j) for j in self.statements(i))
+        if self.text(i) == "if" and self.text(i + 1) == "(" and i + 1 in self.pairs:
+            branch = self.pairs[i + 1] + 1
+            branch_end = self.statement_end(branch)
+            return (self.text(branch_end + 1) == "else" and self.always_returns(branch)
+                    and self.always_returns(branch_end + 2))
+        return False
+
+    def loops(self) -> list[tuple[int, int, int, int]]:
+        """(keyword, header close paren, body start, body end) of every for/while loop."""
+        loops = []
+        for i, token in enumerate(self.tokens):
+            if token.text not in ("for", "while") or self.text(i + 1) != "(":
+                continue
+            close = self.pairs.get(i + 1)
+            if close is None or self.text(close + 1) in (";", ""):
+                continue  # do-while tail or truncated code
+            loops.append((i, close, close + 1, self.statement_end(close + 1)))
+        return loops
+
+
+def _match_brackets(tokens: list[Token]) -> dict[int, int]:
+    pairs, stacks = {}, {opening: [] for opening in BRACKETS}
+    closing = {v: k for k, v in BRACKETS.items()}
+    for i, token in enumerate(tokens):
+        if token.text in BRACKETS:
+            stacks[token.text].append(i)
+        elif token.text in closing and stacks[closing[token.text]]:
+            opening = stacks[closing[token.text]].pop()
+            pairs[opening], pairs[i] = i, opening
+    return pairs
+
+
+RULES: list[Rule] = []
+
+
+def rule(name: str, concept: str, severity: str, gap: str, at_risk_topic: str,
+         risk_reason: str, intervention: str, decisive: bool = False):
+    """
+    Register a check in RULES. The decorated function takes a Source and
+    returns an evidence snippet per hit, e.g.:
+
+        @rule("name", "StringLen", "moderate", "Gap description", ...)
+        def check_name(source: Source) -> list[str]:
+            ...
+    """
+    def register(check: Callable[[Source], list[str]]) -> Callable[[Source], list[str]]:
+        RULES.append(Rule(name, concept, severity, gap, at_risk_topic, risk_reason,
+                          intervention, decisive, check))
+        return check
+    return register
+
+
+@rule("string_length_property", "StringLen", "critical",
+      "Uses String length as a property (str.length) instead of calling the method str.length()",
+      "ArrayList.size() and other String methods",
+      "Confuses methods with fields, so other method calls will fail to compile too",
+      "Contrast array.length with str.length() side by side", decisive=True)
+def check_string_length_property(source: Source) -> list[str]:
+    return [source.snippet(i, i + 2) for i, token in enumerate(source.tokens)
+            if token.text in source.strings and source.text(i + 1) == "."
+            and source.text(i + 2) == "length" and source.text(i + 3) != "("]
+
+
+@rule("array_length_call", "ArrayIndex", "critical",
+      "Calls length() on an array, whose length is the field array.length",
+      "Array traversal",
+      "Array bounds are written in terms of array.length",
+      "Contrast array.length with str.length() side by side", decisive=True)
+def check_array_length_call(source: Source) -> list[str]:
+    return [source.snippet(i, i + 4) for i, token in enumerate(source.tokens)
+            if token.text in source.arrays and source.text(i + 1) == "."
+            and source.text(i + 2) == "length" and source.text(i + 3) == "("]
+
+
+@rule("premature_return", "For", "critical",
+      "Returns from both branches of an if inside a loop, so only the first iteration runs",
+      "Counting and searching loops",
+      "Any problem that needs every element looked at before answering",
+      "Trace the loop by hand and show that the return ends it; move the fallback return after the loop",
+      decisive=True)
+def check_premature_return(source: Source) -> list[str]:
+    hits = []
+    for keyword, _, body_start, body_end in source.loops():
+        # Only statements every iteration reaches; a skipped iteration can move on
+        statements = source.statements(body_start) if source.text(body_start) == "{" else [body_start]
+        for start in statements:
+            end = source.statement_end(start)
+            if any(source.text(j) == "continue" for j in range(start, end + 1)):
+                break
+            if source.text(start) == "if" and source.always_returns(start):
+                hits.append(source.snippet(start, end))
+    return hits
+
+
+def _loop_bound(source: Source, close: int) -> tuple[str, str, str] | None:
+    """(variable, operator, bounded name) of a `for (...; v < s.length...; ...)` header."""
+    opening = source.pairs.get(close, close)
+    semicolons = [j for j in range(opening + 1, close) if source.text(j) == ";"]
+    if len(semicolons) != 2:
+        return None
+    condition = [source.text(j) for j in range(semicolons[0] + 1, semicolons[1])]
+    # Only the bare bound; "length() - 1" and the like already leave room
+    if (len(condition) >= 5 and condition[1] in ("<", "<=") and condition[3:5] == [".", "length"]
+            and condition[5:] in ([], ["(", ")"])):
+        return condition[0], condition[1], condition[2]
+    return None
+
+
+@rule("unguarded_offset_index", "StringIndex", "moderate",
+      "Reads past the current index (i + k) in a loop that runs to the last index, "
+      "so the last iterations go out of bounds",
+      "Loops over pairs or windows of characters and arrays",
+      "Loop bounds must leave room for the widest index used in the body",
+      "Have the student trace the last iteration and adjust the bound to length() - k")
+def check_unguarded_offset_index(source: Source) -> list[str]:
+    hits = []
+    for keyword, close, body_start, body_end in source.loops():
+        bound = _loop_bound(source, close) if source.text(keyword) == "for" else None
+        if bound is None or bound[1] != "<":
+            continue
+        variable = bound[0]
+        for i in range(body_start, body_end):
+            if source.text(i) not in ("charAt", "substring") or source.text(i + 1) != "(":
+                continue
+            arguments = [source.text(j) for j in range(i + 2, source.pairs.get(i + 1, i + 2))]
+            for j in range(len(arguments) - 2):
+                if arguments[j:j + 2] == [variable, "+"]:
+                    hits.append(source.snippet(i, source.pairs.get(i + 1, i + 1)))
+                    break
+    return hits
+
+
+@rule("inclusive_length_bound", "StringIndex", "moderate",
+      "Loops while the index is <= length, one past the last valid index",
+      "Array and string traversal",
+      "Zero-based indexing ends at length - 1",
+      "Trace indexes 0..length - 1 on a short string and compare with the loop bound")
+def check_inclusive_length_bound(source: Source) -> list[str]:
+    hits = []
+    for keyword, close, body_start, body_end in source.loops():
+        bound = _loop_bound(source, close) if source.text(keyword) == "for" else None
+        if bound is None or bound[1] != "<=":
+            continue
+        variable, _, name = bound
+        for i in range(body_start, body_end):
+            indexed = (source.text(i) == "charAt" and source.text(i + 2) == variable
+                       and source.text(i + 3) == ")")
+            subscripted = (source.text(i) == name and source.text(i + 1) == "["
+                           and source.text(i + 2) == variable and source.text(i + 3) == "]")
+            if indexed or subscripted:
+                hits.append(source.snippet(keyword, close))
+                break
+    return hits
+
+
+@rule("string_reference_equality", "StringEqual", "moderate",
+      "Compares Strings with == or !=, which compares references, not contents",
+      "String comparison and object equality",
+      "Every object comparison (String, wrapper types) needs equals()",
+      "Show two equal Strings built differently failing ==, then use equals()")
+def check_string_reference_equality(source: Source) -> list[str]:
+    hits = []
+    for i, token in enumerate(source.tokens):
+        if token.text not in ("==", "!="):
+            continue
+        before, after = source.tokens[i - 1] if i else None, source.tokens[i + 1] if i + 1 < len(source.tokens) else None
+        if before is None or after is None:
+            continue
+        literal = before.kind == "string" or after.kind == "string"
+        names = before.text in source.strings and after.text in source.strings
+        if (literal or names) and "null" not in (before.text, after.text):
+            hits.append(source.snippet(i - 1, i + 1))
+    return hits
+
+
+@rule("empty_statement_after_condition", "If/Else", "moderate",
+      "A semicolon right after an if/for/while condition makes its body an empty statement",
+      "Control flow with conditions and loops",
+      "The code meant as the body runs unconditionally (or once)",
+      "Point out the stray semicolon and what Java treats as the body")
+def check_empty_statement_after_condition(source: Source) -> list[str]:
+    hits = []
+    for i, token in enumerate(source.tokens):
+        if token.text not in ("if", "for", "while") or source.text(i + 1) != "(":
+            continue
+        close = source.pairs.get(i + 1)
+        if close is None or source.text(close + 1) != ";":
+            continue
+        if token.text == "while" and source.text(i - 1) == "}":
+            opening = source.pairs.get(i - 1, 0)
+            if source.text(opening - 1) == "do":
+                continue
+        hits.append(source.snippet(i, close + 1))
+    return hits
+
+
+def check_code(code, rules: list[Rule] | None = None) -> list[RuleHit]:
+    """Every rule hit in one submission's code; never raises on malformed code."""
+    if not isinstance(code, str) or not code.strip():
+        return []
+    source = Source(code)
+    hits = []
+    for r in RULES if rules is None else rules:
+        # Nested loops can report the same spot twice
+        for evidence in dict.fromkeys(r.check(source)):
+            hits.append(RuleHit(r.name, r.concept, r.severity, r.gap, evidence, r.decisive))
+    return hits
+
+
+def format_hints(hits: list[RuleHit]) -> str:
+    """Hint lines appended to a submission block sent to the model."""
+    lines = [f"- {hit.gap} ({hit.evidence})" for hit in hits]
+    return "Static checks found (confirm against the code before using):\n" + "\n".join(lines)
+
+
+def _score(sub: dict) -> float:
+    try:
+        score = float(sub.get("Score"))
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if score != score else score
+
+
+def rule_analysis(sub: dict, hits: list[RuleHit]) -> dict:
+    """A student_analysis entry built from rule hits alone."""
+    by_name = {r.name: r for r in RULES}
+    rules = list({hit.rule: by_name[hit.rule] for hit in hits}.values())
+    return {
+        "student_id": str(sub.get("SubjectID")),
+        "problem_id": str(sub.get("ProblemID")),
+        "score": _score(sub),
+        "knowledge_gaps": [{"gap": hit.gap, "evidence": hit.evidence,
+                            "missing_concept": hit.concept, "severity": hit.severity}
+                           for hit in hits],
+        "future_predictions": [{"at_risk_topic": r.at_risk_topic, "reason": r.risk_reason,
+                                "prerequisite_gap": r.concept} for r in rules],
+        "recommended_intervention": "; ".join(r.intervention for r in rules),
+    }
+
+
+def triage_submissions(submissions: list[dict], hits: list[list[RuleHit]]
+                       ) -> tuple[list[int], list[dict], dict]:
+    """
+    Split submissions into those the model needs to see and those already
+    accounted for: full scores (no gaps) and failures a decisive rule explains.
+
+    Returns:
+        pending: Indexes of the submissions to send to the model
+        analyses: student_analysis entries of the rest
+        report: Counts of passing, explained and pending submissions, and of hits per rule
+    """
+    pending, analyses = [], []
+    report = {"passing": 0, "explained": 0, "pending": 0, "rules": Counter()}
+    for idx, (sub, sub_hits) in enumerate(zip(submissions, hits)):
+        report["rules"].update(hit.rule for hit in sub_hits)
+        if _score(sub) >= 1.0:
+            report["passing"] += 1
+            analyses.append(rule_analysis(sub, []))
+        elif any(hit.decisive for hit in sub_hits):
+            report["explained"] += 1
+            analyses.append(rule_analysis(sub, [hit for hit in sub_hits if hit.decisive]))
+        else:
+            report["pending"] += 1
+            pending.append(idx)
+    return pending, analyses, report
+
+
+def print_triage_report(report: dict) -> None:
+    total = report["passing"] + report["explained"] + report["pending"]
+    print(f"Triage: {total:,} submissions, {report['passing']:,} passing and "
+          f"{report['explained']:,} explained by static rules; {report['pending']:,} sent to the model")
+    for name, count in report["rules"].most_common():
+        print(f"  {name}: {count:,} hits")
@@ -0,0 +1,46 @@
+import re
+from typing import NamedTuple
+
+JAVA_KEYWORDS = frozenset("""
+    abstract assert boolean break byte case catch char class const continue
+    default do double else enum extends final finally float for goto if
+    implements import instanceof int interface long native new package
+    private protected public return short static strictfp super switch
+    synchronized this throw throws transient try void volatile while
+    true false null var
+""".split())
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<string>"(?:\\.|[^"\\\n])*"?)
+  | (?P<char>'(?:\\.|[^'\\\n])*'?)
+  | (?P<number>(?:\d[\d_]*\.?[\d_]*|\.\d[\d_]*)(?:[eE][+-]?\d+)?[lLfFdD]?)
+  | (?P<identifier>[A-Za-z_$][\w$]*)
+  | (?P<operator>>>>=|<<=|>>=|>>>|\+\+|--|&&|\|\||->|::|[=!<>+\-*/%&|^]=|[{}()\[\];,.@?:~!<>=+\-*/%&|^])
+  | (?P<whitespace>\s+)
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+
+class Token(NamedTuple):
+    kind: str  # comment, string, char, number, identifier, keyword, operator, other
+    text: str
+    start: int  # offset into the source
+
+
+def tokenize(code: str, keep_comments: bool = False) -> list[Token]:
+    """
+    Split Java source into tokens. Whitespace is dropped, comments too
+    unless keep_comments is set. Never raises on malformed code: anything
+    unrecognized becomes an "other" token.
+    """
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(code):
+        kind = match.lastgroup
+        text = match.group()
+        if kind == "whitespace" or (kind == "comment" and not keep_comments):
+            continue
+        if kind == "identifier" and text in JAVA_KEYWORDS:
+            kind = "keyword"
+        tokens.append(Token(kind, text, match.start()))
+    return tokens
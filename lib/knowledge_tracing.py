@@ -0,0 +1,336 @@
+import numpy as np
+import pandas as pd
+
+from lib.attempts import PAIR_KEYS
+from lib.concept_index import ConceptIndex
+
+# Joined-dataset columns needed to build observation sequences
+TRACE_COLUMNS = ["SubjectID", "ProblemID",
+                 "EventType", "Score", "EventID", "ServerTimestamp"]
+
+# Guess/slip above this make "known" and "unknown" swap meaning
+MAX_GUESS = 0.3
+MAX_SLIP = 0.3
+PROB_EPSILON = 1e-4
+
+
+def build_observations(df: pd.DataFrame, first_attempt_only: bool = True) -> pd.DataFrame:
+    """
+    Chronological Run.Program outcomes per student.
+
+    Args:
+        df: Joined event log with TRACE_COLUMNS
+        first_attempt_only: One observation per (SubjectID, ProblemID), the
+            first run, instead of one per run
+
+    Returns SubjectID, ProblemID, Correct (score of 1) ordered by time.
+    """
+    runs = df[df["EventType"] == "Run.Program"]
+    runs = runs.sort_values(["SubjectID", "ServerTimestamp", "EventID"])
+    if first_attempt_only:
+        runs = runs.drop_duplicates(PAIR_KEYS, keep="first")
+
+    return pd.DataFrame({
+        "SubjectID": runs["SubjectID"].to_numpy(),
+        "ProblemID": runs["ProblemID"].to_numpy(),
+        "Correct": (runs["Score"].fillna(0).to_numpy() >= 1.0).astype(np.int8),
+    })
+
+
+def _concept_opportunities(observations: pd.DataFrame, index: ConceptIndex) -> pd.DataFrame:
+    """One row per (observation, concept the problem exercises), in time order."""
+    rows = index.rows(observations["ProblemID"].to_numpy())
+    known = np.flatnonzero(rows >= 0)
+    obs_idx, concept = np.nonzero(index.matrix[rows[known]])
+
+    return pd.DataFrame({
+        "SubjectID": observations["SubjectID"].to_numpy()[known[obs_idx]],
+        "Concept": concept,
+        "Correct": observations["Correct"].to_numpy()[known[obs_idx]],
+        "Order": known[obs_idx],
+    })
+
+
+def _pad_sequences(opportunities: pd.DataFrame) -> tuple[pd.DataFrame, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Right-padded (sequences x max length) arrays, one sequence per
+    (SubjectID, Concept).
+
+    Returns (sequence keys, concept of each sequence, outcomes, mask).
+    """
+    opportunities = opportunities.sort_values(
+        ["SubjectID", "Concept", "Order"], kind="stable")
+    keys = opportunities[["SubjectID", "Concept"]]
+    new_seq = (keys.ne(keys.shift())).any(axis=1).to_numpy()
+    seq_id = np.cumsum(new_seq) - 1
+    starts = np.flatnonzero(new_seq)
+    position = np.arange(len(seq_id)) - starts[seq_id]
+
+    n_seq = len(starts)
+    max_len = int(position.max()) + 1 if len(position) else 0
+    obs = np.zeros((n_seq, max_len), dtype=np.int8)
+    mask = np.zeros((n_seq, max_len), dtype=bool)
+    obs[seq_id, position] = opportunities["Correct"].to_numpy()
+    mask[seq_id, position] = True
+
+    seq_keys = keys.iloc[starts].reset_index(drop=True)
+    return seq_keys, seq_keys["Concept"].to_numpy(), obs, mask
+
+
+class BKT:
+    """
+    Bayesian Knowledge Tracing, one parameter set per concept.
+
+    Every (student, concept) sequence is fitted at once: sequences are
+    padded into a single array and EM runs forward-backward over all of
+    them in lockstep, gathering each sequence's parameters by concept.
+
+    Args:
+        index: Concept index mapping problems to concepts
+        n_iter: Max EM iterations
+        tol: Stop once the log-likelihood improves by less than this
+    """
+
+    def __init__(self, index: ConceptIndex, n_iter: int = 50, tol: float = 1e-4):
+        self.index = index
+        self.n_iter = n_iter
+        self.tol = tol
+        n_concepts = len(index.concepts)
+        self.p_init = np.full(n_concepts, 0.3)
+        self.p_learn = np.full(n_concepts, 0.1)
+        self.p_guess = np.full(n_concepts, 0.2)
+        self.p_slip = np.full(n_concepts, 0.1)
+        self.log_likelihood = None
+        self._mastery = None
+
+    def _emissions(self, concept: np.ndarray, obs: np.ndarray) -> np.ndarray:
+        """P(obs | unknown), P(obs | known) per step: (sequences, steps, 2)."""
+        guess = self.p_guess[concept][:, None]
+        slip = self.p_slip[concept][:, None]
+        correct = obs.astype(bool)
+        return np.stack([np.where(correct, guess, 1 - guess),
+                         np.where(correct, 1 - slip, slip)], axis=-1)
+
+    def _forward(self, concept: np.ndarray, obs: np.ndarray, mask: np.ndarray):
+        """Scaled forward pass. Returns (alpha, scale, emissions)."""
+        n_seq, max_len = obs.shape
+        emissions = self._emissions(concept, obs)
+        learn = self.p_learn[concept]
+        alpha = np.zeros((n_seq, max_len, 2))
+        scale = np.ones((n_seq, max_len))
+
+        prior = np.stack([1 - self.p_init[concept], self.p_init[concept]], axis=-1)
+        for t in range(max_len):
+            if t > 0:
+                prev = alpha[:, t - 1]
+                prior = np.stack(
+                    [prev[:, 0] * (1 - learn), prev[:, 1] + prev[:, 0] * learn], axis=-1)
+            joint = prior * emissions[:, t]
+            total = joint.sum(axis=1)
+            active = mask[:, t]
+            scale[active, t] = total[active]
+            # Padded steps carry the last filtered state forward
+            alpha[:, t] = np.where(active[:, None], joint / total[:, None], alpha[:, t - 1] if t else prior)
+
+        return alpha, scale, emissions
+
+    def _backward(self, concept: np.ndarray, mask: np.ndarray, scale: np.ndarray,
+                  emissions: np.ndarray) -> np.ndarray:
+        n_seq, max_len = mask.shape
+        learn = self.p_learn[concept]
+        beta = np.ones((n_seq, max_len, 2))
+
+        for t in range(max_len - 2, -1, -1):
+            weighted = emissions[:, t + 1] * beta[:, t + 1] / scale[:, t + 1, None]
+            step = np.stack([(1 - learn) * weighted[:, 0] + learn * weighted[:, 1],
+                             weighted[:, 1]], axis=-1)
+            beta[:, t] = np.where(mask[:, t + 1, None], step, 1.0)
+
+        return beta
+
+    def _m_step(self, concept: np.ndarray, obs: np.ndarray, mask: np.ndarray,
+                alpha: np.ndarray, beta: np.ndarray, scale: np.ndarray, emissions: np.ndarray) -> None:
+        n_concepts = len(self.index.concepts)
+        learn = self.p_learn[concept]
+
+        gamma = alpha * beta
+        gamma /= gamma.sum(axis=-1, keepdims=True)
+        gamma *= mask[..., None]
+
+        # Expected unknown -> known transitions between consecutive steps
+        transitions = mask[:, 1:]
+        learned = (alpha[:, :-1, 0] * learn[:, None] * emissions[:, 1:, 1]
+                   * beta[:, 1:, 1] / scale[:, 1:]) * transitions
+        unknown_before = gamma[:, :-1, 0] * transitions
+
+        def per_concept(values: np.ndarray) -> np.ndarray:
+            return np.bincount(concept, weights=values.reshape(len(concept), -1).sum(axis=1),
+                               minlength=n_concepts)
+
+        def ratio(num: np.ndarray, den: np.ndarray, current: np.ndarray) -> np.ndarray:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return np.where(den > 0, num / den, current)
+
+        correct = obs * mask
+        self.p_init = ratio(per_concept(gamma[:, 0, 1]),
+                            per_concept(mask[:, 0].astype(float)), self.p_init)
+        self.p_learn = ratio(per_concept(learned), per_concept(unknown_before), self.p_learn)
+        self.p_guess = ratio(per_concept(gamma[..., 0] * correct),
+                             per_concept(gamma[..., 0]), self.p_guess)
+        self.p_slip = ratio(per_concept(gamma[..., 1] * (mask - correct)),
+                            per_concept(gamma[..., 1]), self.p_slip)
+
+        self.p_init = np.clip(self.p_init, PROB_EPSILON, 1 - PROB_EPSILON)
+        self.p_learn = np.clip(self.p_learn, PROB_EPSILON, 1 - PROB_EPSILON)
+        self.p_guess = np.clip(self.p_guess, PROB_EPSILON, MAX_GUESS)
+        self.p_slip = np.clip(self.p_slip, PROB_EPSILON, MAX_SLIP)
+
+    def fit(self, observations: pd.DataFrame) -> "BKT":
+        """Fit every concept's parameters with EM over build_observations() output."""
+        seq_keys, concept, obs, mask = _pad_sequences(
+            _concept_opportunities(observations, self.index))
+        if not len(concept):
+            print("No observations to trace.")
+            return self
+
+        previous = -np.inf
+        for iteration in range(1, self.n_iter + 1):
+            alpha, scale, emissions = self._forward(concept, obs, mask)
+            self.log_likelihood = float(np.log(scale).sum())
+            if self.log_likelihood - previous < self.tol:
+                break
+            previous = self.log_likelihood
+            beta = self._backward(concept, mask, scale, emissions)
+            self._m_step(concept, obs, mask, alpha, beta, scale, emissions)
+
+        print(f"BKT fitted {len(concept):,} sequences in {iteration} EM iterations "
+              f"(log-likelihood {self.log_likelihood:,.1f})")
+
+        # P(known) before the next opportunity: last filtered state, then a chance to learn
+        alpha, _, _ = self._forward(concept, obs, mask)
+        known = alpha[:, -1, 1]
+        known = known + (1 - known) * self.p_learn[concept]
+        self._mastery = seq_keys.assign(Mastery=known).pivot(
+            index="SubjectID", columns="Concept", values="Mastery")
+        return self
+
+    def mastery(self) -> pd.DataFrame:
+        """
+        P(concept known) per student (rows) and concept (columns). Concepts
+        a student never practiced fall back to the concept's initial prior.
+        """
+        mastery = self._mastery.reindex(columns=range(len(self.index.concepts)))
+        mastery = mastery.fillna(pd.Series(self.p_init, index=mastery.columns))
+        mastery.columns = self.index.concepts
+        return mastery
+
+    def predict(self, problem_ids: list[int] | None = None) -> pd.DataFrame:
+        """
+        P(next attempt correct) per student and problem: the mean over the
+        problem's concepts of P(known)(1 - slip) + P(unknown) guess.
+        """
+        problem_ids = self.index.problem_ids if problem_ids is None else np.asarray(problem_ids)
+        rows = self.index.rows(problem_ids)
+        concept_matrix = self.index.matrix[np.maximum(rows, 0)].T.astype(float)
+        concept_matrix[:, rows < 0] = 0
+
+        known = self.mastery().to_numpy()
+        correct = known * (1 - self.p_slip) + (1 - known) * self.p_guess
+        with np.errstate(invalid="ignore", divide="ignore"):
+            predictions = (correct @ concept_matrix) / concept_matrix.sum(axis=0)
+
+        return pd.DataFrame(predictions, index=self._mastery.index, columns=list(problem_ids))
+
+    def parameters(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            "p_init": self.p_init, "p_learn": self.p_learn,
+            "p_guess": self.p_guess, "p_slip": self.p_slip,
+        }, index=pd.Index(self.index.concepts, name="Concept"))
+
+
+class PFA:
+    """
+    Performance Factors Analysis: logistic regression on, per concept of
+    the problem, an easiness term plus weights on the student's prior
+    successes and failures with that concept. Fitted with ridge-penalized
+    Newton steps (IRLS) over all observations at once.
+
+    Args:
+        index: Concept index mapping problems to concepts
+        n_iter: Max Newton iterations
+        l2: Ridge penalty on the coefficients
+    """
+
+    def __init__(self, index: ConceptIndex, n_iter: int = 25, l2: float = 1.0):
+        self.index = index
+        self.n_iter = n_iter
+        self.l2 = l2
+        self.coef = np.zeros(3 * len(index.concepts))
+        self._counts = None
+
+    def _features(self, concepts: np.ndarray, successes: np.ndarray, failures: np.ndarray) -> np.ndarray:
+        """(observations x concepts) indicators and counts -> design matrix."""
+        return np.hstack([concepts, concepts * successes, concepts * failures])
+
+    def fit(self, observations: pd.DataFrame) -> "PFA":
+        """Fit on build_observations() output."""
+        rows = self.index.rows(observations["ProblemID"].to_numpy())
+        observations = observations[rows >= 0]
+        concepts = self.index.matrix[rows[rows >= 0]].astype(float)
+        correct = observations["Correct"].to_numpy(dtype=float)
+
+        # Prior successes/failures per (student, concept), excluding the current attempt
+        students = observations["SubjectID"].to_numpy()
+        outcome = concepts * correct[:, None]
+        successes = pd.DataFrame(outcome).groupby(students).cumsum().to_numpy() - outcome
+        seen = pd.DataFrame(concepts).groupby(students).cumsum().to_numpy() - concepts
+        failures = seen - successes
+
+        X = self._features(concepts, successes, failures)
+        penalty = self.l2 * np.eye(X.shape[1])
+        for _ in range(self.n_iter):
+            p = 1 / (1 + np.exp(-(X @ self.coef)))
+            gradient = X.T @ (correct - p) - self.l2 * self.coef
+            hessian = (X * (p * (1 - p))[:, None]).T @ X + penalty
+            step = np.linalg.solve(hessian, gradient)
+            self.coef += step
+            if np.abs(step).max() < 1e-6:
+                break
+
+        # Totals so far are the features for each student's next attempt
+        self._counts = [pd.DataFrame(values).groupby(students).sum()
+                        for values in (concepts * correct[:, None], concepts * (1 - correct[:, None]))]
+        print(f"PFA fitted {len(correct):,} observations")
+        return self
+
+    def predict(self, problem_ids: list[int] | None = None) -> pd.DataFrame:
+        """P(next attempt correct) per student and problem."""
+        problem_ids = self.index.problem_ids if problem_ids is None else np.asarray(problem_ids)
+        rows = self.index.rows(problem_ids)
+        concept_matrix = self.index.matrix[np.maximum(rows, 0)].T.astype(float)
+        concept_matrix[:, rows < 0] = 0
+
+        successes, failures = (counts.to_numpy() for counts in self._counts)
+        n_concepts = len(self.index.concepts)
+        easiness, success_w, failure_w = (self.coef[i * n_concepts:(i + 1) * n_concepts] for i in range(3))
+        logits = (easiness[None, :] + successes * success_w + failures * failure_w) @ concept_matrix
+
+        return pd.DataFrame(1 / (1 + np.exp(-logits)), index=self._counts[0].index.rename("SubjectID"),
+                            columns=list(problem_ids))
+
+    def parameters(self) -> pd.DataFrame:
+        n_concepts = len(self.index.concepts)
+        return pd.DataFrame(self.coef.reshape(3, n_concepts).T,
+                            columns=["easiness", "success_weight", "failure_weight"],
+                            index=pd.Index(self.index.concepts, name="Concept"))
+
+
+def ambiguous_cases(predictions: pd.DataFrame, low: float = 0.35, high: float = 0.65) -> pd.DataFrame:
+    """
+    (SubjectID, ProblemID) pairs whose predicted success falls between low
+    and high, the cases worth an LLM call. Sorted most uncertain first.
+    """
+    long = predictions.stack().rename("Prediction").reset_index()
+    long.columns = ["SubjectID", "ProblemID", "Prediction"]
+    long = long[(long["Prediction"] >= low) & (long["Prediction"] <= high)]
+    return long.iloc[np.argsort(np.abs(long["Prediction"].to_numpy() - 0.5), kind="stable")].reset_index(drop=True)
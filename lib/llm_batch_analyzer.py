@@ -1,45 +1,175 @@
+import asyncio
+import functools
 import json
+from collections import deque
+from collections.abc import Iterable, Iterator
 from typing import Hashable
 from google import genai
-from google.genai import types
-from utils.constants import GEMINI_API_KEY
-from utils.dataset import load_topics_json, load_problem_descriptions, load_joined_datasets, get_best_attempts
+from utils.api_utils import RateLimitedExecutor, SystemInstructionCache, estimate_tokens
+from lib.backends import Backend, GeminiBackend
+from utils.constants import MAX_PROMPT_TOKENS, MAX_SUBMISSIONS_PER_REQUEST, get_gemini_api_key
+from utils.response_cache import ResponseCache
+from utils.telemetry import span
+from lib.attempts import get_best_attempts
+from lib.batch_planner import TokenEstimator, merge_batch_results, pack_stream, plan_batches
+from lib.concept_index import get_concept_index
+from lib.clustering import cluster_report, cluster_submissions, print_cluster_report
+from lib.dedup import deduplicate_submissions, dedup_report, expand_cluster_results, print_dedup_report
+from lib.java_rules import print_triage_report, triage_submissions
+from lib.results import clean_json_response, parse_analysis_response
+from lib.submission_prep import SUBMISSIONS_FOOTER, SUBMISSIONS_HEADER, format_submission, format_submissions, prepare_submissions
+from utils.dataset import load_topics_json, load_problem_descriptions, load_joined_datasets
 
 
-client = genai.Client(api_key=GEMINI_API_KEY)
+# Analyses already paid for, reused across runs (opened on first use)
+default_cache = ResponseCache()
 
-# Load curriculum and problems
-topics = load_topics_json()
-problems = load_problem_descriptions()
+# Calibrated against count_tokens on first use
+token_estimator = TokenEstimator()
+
+MODEL_NAME = "gemini-2.5-flash"
+GENERATION_CONFIG = {
+    "temperature": 0.3,
+    "response_mime_type": "application/json",
+}
+
+
+# Nothing below touches the network or the dataset until first use, so
+# importing this module stays cheap.
+
+@functools.cache
+def get_client() -> genai.Client:
+    return genai.Client(api_key=get_gemini_api_key())
+
+
+_backend: Backend | None = None
+
+
+def get_backend() -> Backend:
+    """Backend every request goes to: Gemini, unless use_backend() chose another."""
+    global _backend
+    if _backend is None:
+        _backend = GeminiBackend(get_client(), MODEL_NAME)
+    return _backend
+
+
+def use_backend(backend: Backend) -> None:
+    """Send every request from now on to backend (e.g. a LocalBackend for offline runs)."""
+    global _backend
+    _backend = backend
+    get_default_executor.cache_clear()
+    get_instruction_cache.cache_clear()
+
+
+@functools.cache
+def get_default_executor() -> RateLimitedExecutor:
+    """Shared quota for every request from this process."""
+    return RateLimitedExecutor(get_backend())
+
+
+@functools.cache
+def get_instruction_cache() -> SystemInstructionCache:
+    """System instruction registered once as cached content, shared by all requests."""
+    return SystemInstructionCache(get_backend())
+
+
+@functools.cache
+def get_topics() -> dict | None:
+    return load_topics_json()
+
+
+@functools.cache
+def get_problems() -> dict[str, str]:
+    return load_problem_descriptions()
+
+
+# Extra rounds for submissions a response left out before giving up
+REQUEUE_ROUNDS = 2
+
+# Explains the attempt histories of progression mode (analyze --progression)
+PROGRESSION_INSTRUCTION = """ATTEMPT HISTORIES:
+Some submissions show how the student got to their best attempt instead of its code: the first
+attempt in full, then a unified diff for each later attempt where the score or compile status
+changed. Use the history to judge learning behavior (persistent misconceptions, trial-and-error
+edits, recovering from errors) as well as the final code.
+
+"""
 
 # Problems to focus on (keep token size low)
 FOCUS_PROBLEMS = [32, 33, 34]  # Adjust based on your data
 
+# Joined-dataset columns needed to pick best attempts and format submissions
+SUBMISSION_COLUMNS = ["SubjectID", "AssignmentID", "ProblemID", "Attempt", "CodeStateID",
+                      "EventType", "Score", "Compile.Result", "Code"]
+
+
+def batch_problem_ids(submissions: list[dict]) -> tuple[int, ...]:
+    """Sorted distinct ProblemIDs of a batch, the key for its problem context."""
+    return tuple(sorted({int(sub["ProblemID"]) for sub in submissions if sub.get("ProblemID") is not None}))
 
+
+@functools.cache
+def create_problem_context(problem_ids: tuple[int, ...]) -> str:
+    """
+    Contents block describing the problems of one batch: their descriptions,
+    their concept tags and the curriculum chapters teaching those concepts.
+
+    It goes in the request contents rather than the system instruction, so
+    every batch of a run shares one cached instruction.
+
+    Args:
+        problem_ids: Problems in the batch (see batch_problem_ids)
+    """
+    concept_index = get_concept_index()
+
+    # Concept tags come from problem_prompts.csv, so the model doesn't re-derive them
+    batch_problems = {}
+    for k, v in get_problems().items():
+        if int(k) not in problem_ids:
+            continue
+        batch_problems[k] = {
+            "requirement": v,
+            "concepts": concept_index.concepts_for([int(k)]) if concept_index else [],
+        }
+    chapters = set(concept_index.chapters_for(problem_ids)) if concept_index else set()
+    focus = [f"{t['chapter']}. {t.get('chapter_name', '')}"
+             for t in (get_topics() or {}).get("topics", []) if t.get("chapter") in chapters]
+
+    return f"""PROBLEMS IN THIS BATCH:
+{json.dumps(batch_problems, separators=(",", ":"))}
+Focus curriculum chapters: {"; ".join(focus) if focus else "all"}
+
+"""
+
+
+@functools.cache
 def create_system_instruction() -> str:
     """
     Create system instruction with curriculum embedded.
     Focuses on individual student gaps + future predictions.
-    """
 
-    # Filter problems to only focused ones
-    focused_problems = {k: v for k,
-                        v in problems.items() if int(k) in FOCUS_PROBLEMS}
+    Built once per process and the same for every batch, with or without
+    attempt histories, so a single cached content handle serves all requests. The JSON is
+    serialized compactly since the whole prefix is sent (or cached).
+    """
+    topics = get_topics()
+    problems = {k: {"requirement": v} for k, v in get_problems().items()}
 
     return f"""You are an expert CS1 instructor analyzing individual student code submissions to identify knowledge gaps and predict future struggles.
 
 COURSE CURRICULUM:
-{json.dumps(topics, indent=2)}
+{json.dumps(topics, separators=(",", ":"))}
 
 PROBLEM DESCRIPTIONS:
-{json.dumps(focused_problems, indent=2)}
+{json.dumps(problems, separators=(",", ":"))}
 
 YOUR TASK:
-For each student, analyze their code submission and:
+Each request starts with the problems of its batch, their concept tags and the curriculum
+chapters to focus on. For each student, analyze their code submission and:
 1. Identify specific knowledge gaps based on errors in their code
 2. Predict which future topics/problems they may struggle with based on current gaps
 
-ANALYSIS APPROACH:
+{PROGRESSION_INSTRUCTION}ANALYSIS APPROACH:
 1. Look at what the student attempted vs. what was required
 2. Identify misconceptions (not just syntax errors)
 3. Determine prerequisite concepts the student is missing
@@ -131,16 +261,15 @@ def get_focused_best_attempts(problem_ids: list[int] = FOCUS_PROBLEMS) -> list[d
     Load data, get best attempts, filter to focused problems.
     Returns list of submission dicts ready for analysis.
     """
-    df = load_joined_datasets()
+    # Only the focused problems are read from disk
+    focused_df = load_joined_datasets(
+        problems=problem_ids, columns=SUBMISSION_COLUMNS)
 
-    if df is None:
+    if focused_df is None:
         return []
 
     # Get best attempts
-    best_df = get_best_attempts(df)
-
-    # Filter to focused problems
-    focused_df = best_df[best_df['ProblemID'].isin(problem_ids)]
+    focused_df = get_best_attempts(focused_df)
 
     print(f"Focused submissions: {len(focused_df)} rows")
     print(f"  Problems: {focused_df['ProblemID'].unique().tolist()}")
@@ -152,14 +281,31 @@ def get_focused_best_attempts(problem_ids: list[int] = FOCUS_PROBLEMS) -> list[d
     return submissions
 
 
-def analyze_student_submissions(submissions: list[dict], limit: int = 30) -> dict | None:
+def analyze_student_submissions(submissions: list[dict], limit: int = 30,
+                                executor: RateLimitedExecutor | None = None,
+                                use_cache: bool = True) -> dict | None:
     """
     Analyze student submissions with focus on individual gaps and predictions.
 
     Args:
         submissions: List of submission dicts (best attempts only)
         limit: Max submissions to analyze (token management)
+        executor: Rate-limited executor to send the request through
+            (defaults to the module-wide one)
+        use_cache: Reuse a previous response for an identical request
+    """
+    return asyncio.run(analyze_student_submissions_async(submissions, limit, executor, use_cache))
+
+
+async def analyze_student_submissions_async(submissions: list[dict], limit: int = 30,
+                                            executor: RateLimitedExecutor | None = None,
+                                            use_cache: bool = True,
+                                            bodies: list[str] | None = None) -> dict | None:
+    """
+    Async version of analyze_student_submissions.
+    bodies are the submissions' pre-formatted blocks, if already prepared.
     """
+    executor = executor or get_default_executor()
 
     # Limit submissions
     submissions = submissions[:limit]
@@ -168,78 +314,257 @@ def analyze_student_submissions(submissions: list[dict], limit: int = 30) -> dic
         print("No submissions to analyze.")
         return None
 
-    formatted_input = format_submissions(submissions)
-    system_instruction = create_system_instruction()
+    with span("prompt_build", rows=len(submissions)) as s:
+        formatted_input = create_problem_context(batch_problem_ids(submissions)) + format_submissions(
+            submissions, None if bodies is None else bodies[:limit])
+        system_instruction = create_system_instruction()
+        estimated_tokens = estimate_tokens(
+            formatted_input) + estimate_tokens(system_instruction)
+        s.set(estimated_tokens=estimated_tokens)
 
     print(f"Analyzing {len(submissions)} submissions...")
-    print(
-        f"Estimated tokens: ~{len(formatted_input.split()) + len(system_instruction.split())} words")
 
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
+    cache_key = ResponseCache.make_key(
+        executor.backend.model, system_instruction, GENERATION_CONFIG, formatted_input)
+    if use_cache:
+        with span("response_cache", cache_hits=0) as s:
+            cached = default_cache.get(cache_key)
+            if cached is not None:
+                s.set(cache_hits=1)
+        if cached is not None:
+            print("Using cached analysis.")
+            return json.loads(cached)
+
+    print(f"Estimated tokens: ~{estimated_tokens:,}")
+
+    response = await executor.generate_content(
         contents=formatted_input,
-        config=types.GenerateContentConfig(
-            system_instruction=system_instruction,
-            temperature=0.3,
-            response_mime_type="application/json"
-        )
+        config=await get_instruction_cache().request_config(
+            system_instruction, **GENERATION_CONFIG),
+        estimated_tokens=estimated_tokens,
     )
 
-    if response.text:
-        result = clean_json_response(response.text)
-        try:
-            return json.loads(result)
-        except json.JSONDecodeError as e:
-            print(f"Error parsing JSON: {e}")
-            print(f"Raw response: {response.text[:500]}...")
-            return None
-    return None
+    if response is None or not response.text:
+        return None
 
+    with span("parse", rows=len(submissions)) as s:
+        parsed = parse_analysis_response(response.text)
+        s.set(parsed=len(parsed.students), complete=parsed.complete)
+    if not parsed.students:
+        print("Error parsing JSON: no valid student analyses in the response")
+        print(f"Raw response: {response.text[:500]}...")
+        return None
+    if not parsed.complete:
+        print(f"Warning: malformed response, salvaged {len(parsed.students)} "
+              f"of {len(submissions)} student analyses")
 
-def format_submissions(submissions: list[dict]) -> str:
-    """Format submissions for analysis."""
+    # Cache whatever was salvaged; only the missing submissions get re-sent
+    result = parsed.to_dict()
+    default_cache.put(cache_key, json.dumps(result))
+    return result
 
-    formatted = "STUDENT SUBMISSIONS TO ANALYZE:\n\n"
 
-    for idx, sub in enumerate(submissions, 1):
-        code = sub.get('Code', 'NO CODE')
-        student_id = sub.get('SubjectID', 'unknown')
-        problem_id = sub.get('ProblemID', 'unknown')
-        score = sub.get('Score', 0)
-        attempt = sub.get('Attempt', 'unknown')
+def missing_submissions(submissions: list[dict], result: dict | None) -> list[dict]:
+    """Submissions with no entry in result's student_analysis."""
+    returned = {(str(entry.get("student_id")), str(entry.get("problem_id")))
+                for entry in (result or {}).get("student_analysis", [])}
+    return [sub for sub in submissions
+            if (str(sub.get("SubjectID")), str(sub.get("ProblemID"))) not in returned]
 
-        # Include compile result if available
-        compile_result = sub.get('Compile.Result', '')
 
-        formatted += f"""--- Submission {idx} ---
-Student ID: {student_id}
-Problem ID: {problem_id}
-Score: {float(score) * 100:.1f}%
-Attempt #: {attempt}
-Compiled: {compile_result if compile_result else 'Unknown'}
+async def _submission_budget(submissions: list[dict], max_prompt_tokens: int, backend: Backend) -> int:
+    """
+    Tokens left for submission blocks once the fixed prompt parts are counted.
+    The problem context is sized for every problem in submissions, an upper
+    bound for any single batch.
+    """
+    system_instruction = create_system_instruction()
+    problem_context = create_problem_context(batch_problem_ids(submissions))
 
-Code:
-```java
-{code}
-```
+    if not token_estimator.calibrated and submissions:
+        sample = system_instruction + problem_context + format_submissions(submissions[:5])
+        await token_estimator.calibrate(backend, sample)
 
-"""
+    fixed = token_estimator.count(
+        system_instruction + problem_context + SUBMISSIONS_HEADER + SUBMISSIONS_FOOTER)
+    return max_prompt_tokens - fixed
 
-    formatted += "\nAnalyze each student's knowledge state and predict future struggles."
 
-    return formatted
+def analyze_all_submissions(submissions: list[dict], executor: RateLimitedExecutor | None = None,
+                            use_cache: bool = True, max_prompt_tokens: int = MAX_PROMPT_TOKENS,
+                            max_per_request: int = MAX_SUBMISSIONS_PER_REQUEST,
+                            deduplicate: bool = True, workers: int | None = None,
+                            cluster: bool = False, triage: bool = False) -> dict | None:
+    """
+    Analyze every submission, packed into as few requests as fit the token budget.
 
+    Args:
+        submissions: List of submission dicts (best attempts only)
+        executor: Rate-limited executor to send the requests through
+        use_cache: Reuse previous responses for identical requests
+        max_prompt_tokens: Input token budget per request
+        max_per_request: Max submissions per request
+        deduplicate: Send one representative per group of submissions whose
+            normalized code is identical for the same problem, then copy
+            its analysis to the rest of the group
+        workers: Processes used to prepare (format, fingerprint, size) large
+            inputs; defaults to the CPU count, 1 prepares serially
+        cluster: Go further than deduplicate: send only the medoid of each
+            cluster of similar code (same problem and score), and copy its
+            analysis to the members with their similarity as confidence
+        triage: Run the static Java rules first: full scores and failures a
+            decisive rule explains are answered locally, and the rest are
+            sent with their rule hits as hints
+
+    Returns the merged analysis with class_summary recomputed over all
+    batches, or None if every request failed.
+    """
+    return asyncio.run(analyze_all_submissions_async(
+        submissions, executor, use_cache, max_prompt_tokens, max_per_request, deduplicate, workers, cluster, triage))
 
-def clean_json_response(text: str) -> str:
-    """Clean JSON response from markdown formatting."""
-    result = text.strip()
-    if result.startswith("```json"):
-        result = result[7:]
-    if result.startswith("```"):
-        result = result[3:]
-    if result.endswith("```"):
-        result = result[:-3]
-    return result.strip()
+
+async def analyze_all_submissions_async(submissions: list[dict], executor: RateLimitedExecutor | None = None,
+                                        use_cache: bool = True, max_prompt_tokens: int = MAX_PROMPT_TOKENS,
+                                        max_per_request: int = MAX_SUBMISSIONS_PER_REQUEST,
+                                        deduplicate: bool = True, workers: int | None = None,
+                                        cluster: bool = False, triage: bool = False) -> dict | None:
+    """Async version of analyze_all_submissions."""
+    if not submissions:
+        print("No submissions to analyze.")
+        return None
+
+    executor = executor or get_default_executor()
+
+    # Calibrate first so prepared token sizes use the measured ratio
+    budget = await _submission_budget(submissions, max_prompt_tokens, executor.backend)
+    # The CPU-bound steps run in a worker thread so that other analyses
+    # sharing the event loop (run_slices_async) keep sending requests
+    with span("prepare", rows=len(submissions)):
+        prepared = await asyncio.to_thread(
+            prepare_submissions, submissions, token_estimator.chars_per_token, workers, rules=triage)
+
+    clusters = confidence = None
+    bodies, sizes, fingerprints = prepared.bodies, prepared.sizes, prepared.fingerprints
+    triaged = []
+    if triage:
+        with span("triage", rows=len(submissions)) as s:
+            keep, triaged, report = await asyncio.to_thread(triage_submissions, submissions, prepared.hits)
+            s.set(answered=len(triaged))
+        print_triage_report(report)
+        submissions = [submissions[idx] for idx in keep]
+        bodies = [bodies[idx] for idx in keep]
+        sizes = [sizes[idx] for idx in keep]
+        fingerprints = [fingerprints[idx] for idx in keep]
+        if not submissions:
+            return merge_batch_results([{"student_analysis": triaged}])
+
+    if deduplicate or cluster:
+        position = {id(sub): idx for idx, sub in enumerate(submissions)}
+        if cluster:
+            with span("cluster", rows=len(submissions)) as s:
+                submissions, clusters, confidence = await asyncio.to_thread(
+                    cluster_submissions, submissions, fingerprints)
+                s.set(medoids=len(submissions))
+            print_cluster_report(cluster_report(clusters, confidence))
+        else:
+            submissions, clusters = await asyncio.to_thread(
+                deduplicate_submissions, submissions, fingerprints)
+            print_dedup_report(dedup_report(clusters))
+        keep = [position[id(sub)] for sub in submissions]
+        bodies = [bodies[idx] for idx in keep]
+        sizes = [sizes[idx] for idx in keep]
+
+    batches = plan_batches(sizes, budget, max_per_request)
+
+    print(f"Planned {len(batches)} requests for {len(submissions):,} submissions "
+          f"(~{sum(sizes):,} submission tokens, {budget:,} per request)")
+
+    succeeded = []
+    pending = list(range(len(submissions)))
+    for round_ in range(REQUEUE_ROUNDS + 1):
+        if round_:
+            # Re-send only what earlier responses dropped or truncated
+            batches = plan_batches([sizes[i] for i in pending], budget, max_per_request)
+            batches = [[pending[i] for i in batch] for batch in batches]
+            print(f"Re-queueing {len(pending):,} missing submissions in {len(batches)} requests")
+
+        results = await asyncio.gather(*(
+            analyze_student_submissions_async(
+                [submissions[i] for i in batch], len(batch), executor, use_cache,
+                [bodies[i] for i in batch])
+            for batch in batches))
+
+        pending = []
+        for batch, result in zip(batches, results):
+            if result:
+                succeeded.append(result)
+            missing = {id(sub) for sub in missing_submissions(
+                [submissions[i] for i in batch], result)}
+            pending.extend(i for i in batch if id(submissions[i]) in missing)
+
+        if not pending:
+            break
+
+    if pending:
+        print(f"Warning: no analysis for {len(pending):,} of {len(submissions):,} submissions")
+
+    if not succeeded and not triaged:
+        return None
+
+    merged = merge_batch_results(succeeded)
+    if clusters:
+        merged = expand_cluster_results(merged, clusters, confidence)
+    if triaged:
+        merged = merge_batch_results([merged, {"student_analysis": triaged}])
+    return merged
+
+
+def plan_submission_stream(submissions: Iterable[dict], max_prompt_tokens: int = MAX_PROMPT_TOKENS,
+                           max_per_request: int = MAX_SUBMISSIONS_PER_REQUEST) -> Iterator[list[dict]]:
+    """Lazily pack a stream of submissions into batches under the token budget."""
+    # Batches aren't known up front, so size the problem context for every problem
+    all_problems = tuple(sorted(int(k) for k in get_problems()))
+    budget = max_prompt_tokens - token_estimator.count(
+        create_system_instruction() + create_problem_context(all_problems)
+        + SUBMISSIONS_HEADER + SUBMISSIONS_FOOTER)
+
+    return pack_stream(submissions, lambda sub: token_estimator.count(format_submission(0, sub)),
+                       budget, max_per_request)
+
+
+def analyze_submission_batches(batches: Iterable[list[dict]],
+                               executor: RateLimitedExecutor | None = None,
+                               use_cache: bool = True) -> Iterator[dict]:
+    """
+    Analyze a lazy stream of submission batches, one request per batch.
+
+    Up to executor.max_concurrency batches are in flight at once; batches
+    are pulled from the iterable only as slots free up, and results are
+    yielded in input order.
+    """
+    executor = executor or get_default_executor()
+
+    async def wait(task: asyncio.Task) -> dict | None:
+        return await task
+
+    with asyncio.Runner() as runner:
+        loop = runner.get_loop()
+        in_flight: deque[asyncio.Task] = deque()
+
+        for idx, batch in enumerate(batches, 1):
+            print(f"\n--- Batch {idx} ---")
+            in_flight.append(loop.create_task(
+                analyze_student_submissions_async(batch, len(batch), executor, use_cache)))
+
+            if len(in_flight) >= executor.max_concurrency:
+                results = runner.run(wait(in_flight.popleft()))
+                if results:
+                    yield results
+
+        while in_flight:
+            results = runner.run(wait(in_flight.popleft()))
+            if results:
+                yield results
 
 
 def print_student_analysis(results: dict) -> None:
@@ -318,13 +643,14 @@ def print_student_analysis(results: dict) -> None:
 
 
 # Main execution function
-def run_analysis(problem_ids: list[int] = FOCUS_PROBLEMS, max_students: int = 30):
+def run_analysis(problem_ids: list[int] = FOCUS_PROBLEMS, max_students: int = 30, save: bool = True):
     """
     Run the full analysis pipeline.
 
     Args:
         problem_ids: List of problem IDs to focus on
         max_students: Maximum number of students to analyze
+        save: Record the results as a run in the results store
     """
     print(f"Starting analysis for problems: {problem_ids}")
     print(f"Max students: {max_students}")
@@ -345,6 +671,11 @@ def run_analysis(problem_ids: list[int] = FOCUS_PROBLEMS, max_students: int = 30
     # Print results
     print_student_analysis(results)
 
+    if save:
+        from utils.results_store import ResultsStore
+        ResultsStore().save_run("run_analysis", results, get_backend().model,
+                                {"problem_ids": problem_ids, "max_students": max_students})
+
     return results
 
 
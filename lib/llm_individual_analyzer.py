@@ -1,102 +1,288 @@
+import json
+import os
+import time
 
-from time import time
-from typing import Hashable
-from dotenv import load_dotenv
-from google import genai
+from lib.backends import BatchBackend
+from lib.batch_planner import summarize_class
+from lib.llm_batch_analyzer import GENERATION_CONFIG, batch_problem_ids, create_problem_context, create_system_instruction, format_submissions, get_backend
+from lib.results import parse_analysis_response
+from utils.constants import BATCH_JOBS_DIR, BATCH_SIZE
 
-from utils.constants import BATCH_SIZE, GEMINI_API_KEY
+COMPLETED_STATES = {
+    'JOB_STATE_SUCCEEDED',
+    'JOB_STATE_FAILED',
+    'JOB_STATE_CANCELLED',
+    'JOB_STATE_EXPIRED',
+}
 
+# Adaptive polling: start fast, back off while jobs are still running
+POLL_INITIAL_SECONDS = 10.0
+POLL_MAX_SECONDS = 300.0
+POLL_BACKOFF = 1.5
 
-load_dotenv()
 
-client = genai.Client(api_key=GEMINI_API_KEY)
+def _submission_key(submission: dict) -> str:
+    return f"{submission.get('SubjectID')}:{submission.get('ProblemID')}"
 
 
-def analyze_individual_submissions(submissions: list[dict[Hashable, str]]) -> str | None:
-    prompt = """You are an expert code reviewer. Analyze the following code submissions and provide general gaps of knowledge that the authors should focus on to improve their coding skills. Provide a concise list of areas for improvement without going into specific details about each submission."""
+def _run_dir(run_name: str) -> str:
+    return os.path.join(BATCH_JOBS_DIR, run_name)
 
-    formatted_submissions = __format_submissions_for_batch(
-        prompt, submissions[:BATCH_SIZE])
 
-    inline_batch_job = client.batches.create(
-        model="models/gemini-2.5-flash",
-        src=formatted_submissions,
-        config={
-            'display_name': "submission_analysis_batch",
-        },
-    )
+def _manifest_path(run_name: str) -> str:
+    return os.path.join(_run_dir(run_name), "manifest.json")
 
-    print(f"Created batch job: {inline_batch_job.name}")
 
-    return inline_batch_job.name
+def load_manifest(run_name: str) -> dict | None:
+    """Load the saved state of a batch run, or None if it was never started."""
+    try:
+        with open(_manifest_path(run_name), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
 
 
-def get_job_status(batch_job_name: str):
-    batch_job = client.batches.get(name=batch_job_name)
+def save_manifest(manifest: dict) -> None:
+    """Persist the manifest atomically so a crash never leaves it half-written."""
+    path = _manifest_path(manifest["run_name"])
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
 
-    completed_states = set([
-        'JOB_STATE_SUCCEEDED',
-        'JOB_STATE_FAILED',
-        'JOB_STATE_CANCELLED',
-        'JOB_STATE_EXPIRED',
-    ])
 
-    print(f"Polling batch job: {batch_job.name}")
+def write_shards(submissions: list[dict], run_name: str, shard_size: int = BATCH_SIZE) -> list[dict]:
+    """
+    Write one JSONL request file per shard of shard_size submissions.
+    Each line analyzes a single submission, keyed by SubjectID:ProblemID.
+    """
+    run_dir = _run_dir(run_name)
+    os.makedirs(run_dir, exist_ok=True)
 
-    while batch_job.state is not None and batch_job.state.name not in completed_states:
+    shards = []
+    for index, start in enumerate(range(0, len(submissions), shard_size)):
+        shard = submissions[start:start + shard_size]
+        input_file = os.path.join(run_dir, f"shard-{index:03d}.jsonl")
+
+        with open(input_file, 'w') as f:
+            for submission in shard:
+                f.write(json.dumps({
+                    'key': _submission_key(submission),
+                    'request': {
+                        'contents': [{
+                            'parts': [{'text': create_problem_context(batch_problem_ids([submission]))
+                                       + format_submissions([submission])}],
+                            'role': 'user'
+                        }],
+                        'system_instruction': {'parts': [{'text': create_system_instruction()}]},
+                        'generation_config': GENERATION_CONFIG,
+                    },
+                }, default=str) + "\n")
+
+        shards.append({
+            'index': index,
+            'input_file': input_file,
+            'keys': [_submission_key(s) for s in shard],
+            'uploaded_file': None,
+            'job_name': None,
+            'state': None,
+            'result_file': None,
+        })
+
+    return shards
+
+
+def submit_batch_run(submissions: list[dict], run_name: str, shard_size: int = BATCH_SIZE,
+                     backend: BatchBackend | None = None) -> dict:
+    """
+    Start (or resume) a batch run. Shards that already have a job are skipped,
+    so calling this again after a crash never submits the same work twice.
+    """
+    backend = backend or get_backend()
+    manifest = load_manifest(run_name)
+
+    if manifest is None:
+        manifest = {
+            'run_name': run_name,
+            'model': backend.model,
+            'created_at': time.time(),
+            'shards': write_shards(submissions, run_name, shard_size),
+        }
+        save_manifest(manifest)
         print(
-            f"Current state: {batch_job.state.name} - waiting 30 seconds before next check...")
-        time.sleep(30)
-        batch_job = client.batches.get(name=batch_job_name)
-
-    if batch_job.state is not None and batch_job.state.name == 'JOB_STATE_FAILED':
-        print(f"Error: {batch_job.error}")
-
-    if batch_job.state is not None:
-        print(f"Job finished with state: {batch_job.state.name}")
-
-
-def get_batch_results(batch_job_name: str):
-
-    batch_job = client.batches.get(name=batch_job_name)
-
-    if batch_job.state is not None and batch_job.state.name == 'JOB_STATE_SUCCEEDED':
-
-        inlined_responses = batch_job.dest and getattr(
-            batch_job.dest, 'inlined_responses', None)
-
-        if inlined_responses:
-            print("Batch Results:")
-            for i, inline_response in enumerate(inlined_responses):
-                print(f"Result for submission {i + 1}:")
-                response = getattr(inline_response, 'response', None)
-                if response:
-                    try:
-                        text = getattr(response, 'text', None)
-                        if text:
-                            print(text)
-                        else:
-                            print("No text response available.")
-                    except AttributeError:
-                        print("No text response available.", response)
-                    print("\n")
-                else:
-                    print("No response available for this submission.")
-        else:
-            print("No inlined responses found in the batch job destination.")
+            f"Created batch run '{run_name}': {len(submissions)} submissions in {len(manifest['shards'])} shards")
     else:
-        print(
-            f"Batch job not succeeded. Current state: {batch_job.state.name if batch_job.state else 'Unknown'}")
+        print(f"Resuming batch run '{run_name}'")
+        if manifest['model'] != backend.model:
+            print(f"Warning: run '{run_name}' was started with {manifest['model']}, "
+                  f"unsubmitted shards go to {backend.model}")
 
+    for shard in manifest['shards']:
+        if shard['job_name']:
+            continue
 
-def __format_submissions_for_batch(prompt: str, submissions: list[dict[Hashable, str]]) -> list[dict]:
-    batch = []
-    for submission in submissions:
-        batch.append({
-            'contents': [{
-                'parts': [{'text': f"{prompt}\n\n{submission['CodeContent']}"}],
-                'role': 'user'
-            }]
-        })
+        if not shard['uploaded_file']:
+            shard['uploaded_file'] = backend.upload_batch_file(
+                shard['input_file'], os.path.basename(shard['input_file']))
+            save_manifest(manifest)
+
+        shard['job_name'] = backend.create_batch_job(
+            shard['uploaded_file'], f"{run_name}-shard-{shard['index']:03d}")
+        save_manifest(manifest)
+        print(f"Created batch job: {shard['job_name']}")
+
+    return manifest
+
+
+def poll_batch_run(manifest: dict, backend: BatchBackend | None = None, initial_interval: float = POLL_INITIAL_SECONDS,
+                   max_interval: float = POLL_MAX_SECONDS, timeout: float | None = None) -> bool:
+    """
+    Poll every unfinished job until all are done, backing off between checks.
+    Returns True once every shard reached a final state, False on timeout.
+    """
+    backend = backend or get_backend()
+    interval = initial_interval
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    while True:
+        pending = 0
+        for shard in manifest['shards']:
+            if shard['state'] in COMPLETED_STATES or not shard['job_name']:
+                continue
+
+            batch_job = backend.get_batch_job(shard['job_name'])
+            state = batch_job.state
+
+            if state != shard['state']:
+                shard['state'] = state
+                save_manifest(manifest)
+                print(f"{shard['job_name']}: {state}")
+
+            if state == 'JOB_STATE_FAILED':
+                print(f"Error: {batch_job.error}")
+            if state not in COMPLETED_STATES:
+                pending += 1
+
+        if not pending:
+            return True
+        if deadline is not None and time.monotonic() + interval > deadline:
+            print(f"{pending} jobs still running; resume later to collect them.")
+            return False
+
+        print(f"{pending} jobs running - checking again in {interval:.0f}s...")
+        time.sleep(interval)
+        interval = min(max_interval, interval * POLL_BACKOFF)
+
+
+def _download_results(shard: dict, backend: BatchBackend) -> str | None:
+    """Download a finished shard's output once and keep it next to the input."""
+    if shard['result_file'] and os.path.exists(shard['result_file']):
+        return shard['result_file']
+
+    file_name = backend.get_batch_job(shard['job_name']).result_file
+    if not file_name:
+        print(f"No result file for {shard['job_name']}")
+        return None
+
+    result_file = shard['input_file'].replace(".jsonl", ".results.jsonl")
+    with open(result_file, 'wb') as f:
+        f.write(backend.download_file(file_name))
+    shard['result_file'] = result_file
+    return result_file
+
+
+def _response_text(response: dict) -> str | None:
+    for candidate in response.get('candidates', []):
+        parts = candidate.get('content', {}).get('parts', [])
+        text = "".join(part.get('text', '') for part in parts)
+        if text:
+            return text
+    return None
+
+
+def parse_result_line(line: str) -> tuple[str, dict | None]:
+    """
+    Parse one output line into (key, student analysis entry).
+    The entry is None if the request failed or no valid analysis could be
+    salvaged from the response.
+    """
+    record = json.loads(line)
+    key = record.get('key', '')
+
+    text = _response_text(record.get('response') or {})
+    if text is None:
+        print(f"No response for {key}: {record.get('error', 'unknown error')}")
+        return key, None
+
+    parsed = parse_analysis_response(text)
+    if not parsed.students:
+        print(f"Error parsing JSON for {key}: no valid student analysis")
+        return key, None
+
+    # Trust the request key over whatever IDs the model echoed back
+    entry = parsed.students[0]
+    entry.student_id, entry.problem_id = key.split(":", 1)
+    return key, entry.to_dict()
+
+
+def collect_batch_run(manifest: dict, backend: BatchBackend | None = None) -> dict:
+    """
+    Gather every succeeded shard into the analyze_student_submissions schema.
+    Keys that produced no usable analysis are listed under 'missing'.
+    """
+    backend = backend or get_backend()
+    student_analysis = []
+    missing = []
+
+    for shard in manifest['shards']:
+        if shard['state'] != 'JOB_STATE_SUCCEEDED':
+            missing.extend(shard['keys'])
+            continue
+
+        result_file = _download_results(shard, backend)
+        save_manifest(manifest)
+        if result_file is None:
+            missing.extend(shard['keys'])
+            continue
+
+        seen = set()
+        with open(result_file, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                key, entry = parse_result_line(line)
+                if entry is not None:
+                    student_analysis.append(entry)
+                    seen.add(key)
+        missing.extend(key for key in shard['keys'] if key not in seen)
+
+    print(
+        f"Collected {len(student_analysis)} analyses ({len(missing)} missing)")
+
+    return {
+        'student_analysis': student_analysis,
+        'class_summary': summarize_class(student_analysis),
+        'missing': missing,
+    }
+
+
+def run_batch_analysis(submissions: list[dict], run_name: str, shard_size: int = BATCH_SIZE,
+                       wait: bool = True, backend: BatchBackend | None = None) -> dict | None:
+    """
+    Submit (or resume) a batch run, wait for it and collect the results.
+    Returns None if wait is False or the jobs have not finished yet.
+
+    Args:
+        backend: Where the jobs run (default: get_backend(), i.e. Gemini)
+    """
+    backend = backend or get_backend()
+    manifest = submit_batch_run(submissions, run_name, shard_size, backend)
+
+    if not wait:
+        print(f"Jobs submitted. Resume with run name '{run_name}'.")
+        return None
+
+    if not poll_batch_run(manifest, backend):
+        return None
 
-    return batch
+    return collect_batch_run(manifest, backend)
@@ -0,0 +1,288 @@
+import json
+import re
+
+# Structural characters the salvaging scanner cares about
+STRUCTURE_PATTERN = re.compile(r'[{}\[\]"\\]')
+
+
+def _text(value) -> str:
+    return "" if value is None else str(value)
+
+
+class KnowledgeGap:
+    __slots__ = ("gap", "evidence", "missing_concept", "severity")
+
+    def __init__(self, gap: str, evidence: str = "", missing_concept: str = "", severity: str = ""):
+        self.gap = gap
+        self.evidence = evidence
+        self.missing_concept = missing_concept
+        self.severity = severity
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "KnowledgeGap":
+        if not isinstance(data, dict):
+            raise ValueError(f"knowledge gap must be an object, got {type(data).__name__}")
+        # summarize_class matches severity == "critical" exactly
+        return cls(_text(data.get("gap")), _text(data.get("evidence")),
+                   _text(data.get("missing_concept")), _text(data.get("severity")).strip().lower())
+
+    def to_dict(self) -> dict:
+        return {"gap": self.gap, "evidence": self.evidence,
+                "missing_concept": self.missing_concept, "severity": self.severity}
+
+
+class Prediction:
+    __slots__ = ("at_risk_topic", "reason", "prerequisite_gap")
+
+    def __init__(self, at_risk_topic: str, reason: str = "", prerequisite_gap: str = ""):
+        self.at_risk_topic = at_risk_topic
+        self.reason = reason
+        self.prerequisite_gap = prerequisite_gap
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Prediction":
+        if not isinstance(data, dict):
+            raise ValueError(f"prediction must be an object, got {type(data).__name__}")
+        return cls(_text(data.get("at_risk_topic")), _text(data.get("reason")),
+                   _text(data.get("prerequisite_gap")))
+
+    def to_dict(self) -> dict:
+        return {"at_risk_topic": self.at_risk_topic, "reason": self.reason,
+                "prerequisite_gap": self.prerequisite_gap}
+
+
+class StudentAnalysis:
+    """
+    One student_analysis entry. from_dict() raises ValueError if the entry
+    can't be attributed to a submission (no student_id/problem_id); gaps
+    and predictions that aren't objects are dropped individually.
+    """
+    __slots__ = ("student_id", "problem_id", "score", "knowledge_gaps",
+                 "future_predictions", "recommended_intervention", "duplicate_of",
+                 "cluster_of", "confidence")
+
+    def __init__(self, student_id: str, problem_id: str, score: float = 0.0,
+                 knowledge_gaps: list[KnowledgeGap] | None = None,
+                 future_predictions: list[Prediction] | None = None,
+                 recommended_intervention: str = "", duplicate_of: str | None = None,
+                 cluster_of: str | None = None, confidence: float | None = None):
+        self.student_id = student_id
+        self.problem_id = problem_id
+        self.score = score
+        self.knowledge_gaps = knowledge_gaps or []
+        self.future_predictions = future_predictions or []
+        self.recommended_intervention = recommended_intervention
+        self.duplicate_of = duplicate_of
+        self.cluster_of = cluster_of
+        self.confidence = confidence
+
+    @property
+    def key(self) -> tuple[str, str]:
+        return self.student_id, self.problem_id
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "StudentAnalysis":
+        if not isinstance(data, dict):
+            raise ValueError(f"student analysis must be an object, got {type(data).__name__}")
+        if data.get("student_id") in (None, "") or data.get("problem_id") in (None, ""):
+            raise ValueError("student analysis without student_id/problem_id")
+
+        try:
+            score = float(data.get("score") or 0.0)
+        except (TypeError, ValueError):
+            score = 0.0
+
+        gaps = []
+        for gap in data.get("knowledge_gaps") or []:
+            try:
+                gaps.append(KnowledgeGap.from_dict(gap))
+            except ValueError:
+                continue
+        predictions = []
+        for prediction in data.get("future_predictions") or []:
+            try:
+                predictions.append(Prediction.from_dict(prediction))
+            except ValueError:
+                continue
+
+        duplicate_of = data.get("duplicate_of")
+        cluster_of = data.get("cluster_of")
+        try:
+            confidence = None if data.get("confidence") is None else float(data["confidence"])
+        except (TypeError, ValueError):
+            confidence = None
+        return cls(_text(data["student_id"]), _text(data["problem_id"]), score, gaps, predictions,
+                   _text(data.get("recommended_intervention")),
+                   None if duplicate_of is None else _text(duplicate_of),
+                   None if cluster_of is None else _text(cluster_of), confidence)
+
+    def to_dict(self) -> dict:
+        data = {
+            "student_id": self.student_id,
+            "problem_id": self.problem_id,
+            "score": self.score,
+            "knowledge_gaps": [gap.to_dict() for gap in self.knowledge_gaps],
+            "future_predictions": [p.to_dict() for p in self.future_predictions],
+            "recommended_intervention": self.recommended_intervention,
+        }
+        if self.duplicate_of is not None:
+            data["duplicate_of"] = self.duplicate_of
+        if self.cluster_of is not None:
+            data["cluster_of"] = self.cluster_of
+        if self.confidence is not None:
+            data["confidence"] = self.confidence
+        return data
+
+
+class ClassSummary:
+    __slots__ = ("common_gaps", "highest_risk_students", "suggested_review_topics")
+
+    def __init__(self, common_gaps: list[str] | None = None, highest_risk_students: list[str] | None = None,
+                 suggested_review_topics: list[str] | None = None):
+        self.common_gaps = common_gaps or []
+        self.highest_risk_students = highest_risk_students or []
+        self.suggested_review_topics = suggested_review_topics or []
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ClassSummary":
+        if not isinstance(data, dict):
+            raise ValueError(f"class summary must be an object, got {type(data).__name__}")
+
+        def strings(key: str) -> list[str]:
+            values = data.get(key) or []
+            return [_text(v) for v in values] if isinstance(values, list) else []
+
+        return cls(strings("common_gaps"), strings("highest_risk_students"),
+                   strings("suggested_review_topics"))
+
+    def to_dict(self) -> dict:
+        return {"common_gaps": self.common_gaps,
+                "highest_risk_students": self.highest_risk_students,
+                "suggested_review_topics": self.suggested_review_topics}
+
+
+class ParsedResponse:
+    """
+    What could be recovered from one model response.
+
+    Args:
+        students: Every valid student_analysis entry
+        class_summary: The model's class summary, if it parsed
+        complete: True if the whole response was valid JSON
+    """
+    __slots__ = ("students", "class_summary", "complete")
+
+    def __init__(self, students: list[StudentAnalysis], class_summary: ClassSummary | None, complete: bool):
+        self.students = students
+        self.class_summary = class_summary
+        self.complete = complete
+
+    def to_dict(self) -> dict:
+        """The analyze_student_submissions result schema."""
+        return {
+            "student_analysis": [s.to_dict() for s in self.students],
+            "class_summary": (self.class_summary or ClassSummary()).to_dict(),
+        }
+
+
+def clean_json_response(text: str) -> str:
+    """Clean JSON response from markdown formatting."""
+    result = text.strip()
+    if result.startswith("```json"):
+        result = result[7:]
+    if result.startswith("```"):
+        result = result[3:]
+    if result.endswith("```"):
+        result = result[:-3]
+    return result.strip()
+
+
+def _validated(entries) -> list[StudentAnalysis]:
+    students = []
+    for entry in entries if isinstance(entries, list) else []:
+        try:
+            students.append(StudentAnalysis.from_dict(entry))
+        except ValueError:
+            continue
+    return students
+
+
+def _array_elements(text: str, start: int):
+    """
+    Yield the source of each top-level object in the JSON array whose '['
+    is at text[start], tracking strings and nesting only. Objects that never
+    close (a truncated response) are not yielded.
+    """
+    depth = 0
+    element_start = None
+    in_string = False
+    skip_to = 0
+
+    for match in STRUCTURE_PATTERN.finditer(text, start + 1):
+        pos = match.start()
+        if pos < skip_to:
+            continue
+        char = match.group()
+
+        if in_string:
+            if char == "\\":
+                skip_to = pos + 2
+            elif char == '"':
+                in_string = False
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            if depth == 0 and char == "{":
+                element_start = pos
+            depth += 1
+        elif depth == 0 and char == "]":
+            return
+        else:
+            depth -= 1
+            if depth == 0 and element_start is not None:
+                yield text[element_start:pos + 1]
+                element_start = None
+
+
+def _salvage_class_summary(text: str) -> ClassSummary | None:
+    match = re.search(r'"class_summary"\s*:\s*', text)
+    if not match:
+        return None
+    try:
+        data, _ = json.JSONDecoder().raw_decode(text, match.end())
+        return ClassSummary.from_dict(data)
+    except ValueError:
+        return None
+
+
+def parse_analysis_response(text: str) -> ParsedResponse:
+    """
+    Parse a model response, keeping every valid student_analysis entry
+    even when the response as a whole is truncated or malformed.
+    """
+    cleaned = clean_json_response(text)
+
+    try:
+        data = json.loads(cleaned)
+    except json.JSONDecodeError:
+        data = None
+
+    if isinstance(data, dict):
+        try:
+            summary = ClassSummary.from_dict(data.get("class_summary"))
+        except ValueError:
+            summary = None
+        return ParsedResponse(_validated(data.get("student_analysis")), summary, True)
+
+    match = re.search(r'"student_analysis"\s*:\s*\[', cleaned)
+    entries = []
+    if match:
+        for source in _array_elements(cleaned, match.end() - 1):
+            try:
+                entries.append(json.loads(source))
+            except json.JSONDecodeError:
+                continue
+
+    return ParsedResponse(_validated(entries), _salvage_class_summary(cleaned), False)
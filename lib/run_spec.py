@@ -0,0 +1,207 @@
+import asyncio
+import json
+import os
+import re
+import time
+import tomllib
+from typing import NamedTuple
+
+import pandas as pd
+
+from lib.attempts import get_best_attempts
+from lib.batch_planner import merge_batch_results
+from lib.llm_batch_analyzer import SUBMISSION_COLUMNS, analyze_all_submissions_async
+from utils.api_utils import RateLimitedExecutor
+from utils.constants import MAX_CONCURRENT_REQUESTS, MAX_PROMPT_TOKENS, REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE
+from utils.telemetry import span
+
+# Run-wide settings of a spec file and their defaults
+RUN_SETTINGS = {
+    "backend": "gemini",
+    "backend_options": {},  # create_backend() keyword arguments, e.g. {latency = 0.5} for "local"
+    "requests_per_minute": REQUESTS_PER_MINUTE,
+    "tokens_per_minute": TOKENS_PER_MINUTE,
+    "max_concurrency": MAX_CONCURRENT_REQUESTS,
+    "parallel_slices": 4,
+    "use_cache": True,
+    "output_dir": None,
+}
+
+# Per-slice analysis options, set in [defaults] or on each slice
+SLICE_OPTIONS = {
+    "limit": None,
+    "max_prompt_tokens": MAX_PROMPT_TOKENS,
+    "deduplicate": True,
+    "cluster": False,
+    "triage": False,
+}
+
+SLICE_FILTERS = ("terms", "assignments", "problems")
+
+
+class Slice(NamedTuple):
+    name: str
+    terms: list[str] | None  # None keeps every term
+    assignments: list[int] | None
+    problems: list[int] | None
+    options: dict  # SLICE_OPTIONS, defaults applied
+
+
+class RunSpec(NamedTuple):
+    name: str
+    settings: dict  # RUN_SETTINGS, defaults applied
+    slices: list[Slice]
+
+
+def _unknown(keys, allowed, where: str) -> None:
+    unknown = sorted(set(keys) - set(allowed))
+    if unknown:
+        raise ValueError(f"Unknown {where} keys: {', '.join(unknown)} (expected: {', '.join(sorted(allowed))})")
+
+
+def parse_run_spec(spec: dict, default_name: str = "run") -> RunSpec:
+    """
+    Validate a parsed spec file:
+
+        name = "2019"                    # optional, defaults to the file name
+        requests_per_minute = 15         # run-wide settings, see RUN_SETTINGS
+
+        [defaults]                       # options for every slice, see SLICE_OPTIONS
+        triage = true
+
+        [[slice]]
+        name = "spring-early"
+        terms = ["spring-2019"]          # terms, assignments and problems all optional
+        assignments = [439, 487, 492]
+        limit = 500                      # overrides [defaults]
+
+    Raises ValueError describing the first problem found.
+    """
+    _unknown(spec, {"name", "defaults", "slice", *RUN_SETTINGS}, "top-level")
+    defaults = spec.get("defaults", {})
+    _unknown(defaults, SLICE_OPTIONS, "[defaults]")
+
+    slices, names = [], set()
+    for position, entry in enumerate(spec.get("slice", []), 1):
+        _unknown(entry, {"name", *SLICE_FILTERS, *SLICE_OPTIONS}, f"slice {position}")
+        name = str(entry.get("name") or f"slice-{position}")
+        if not re.fullmatch(r"[\w.-]+", name):
+            raise ValueError(f"Slice name '{name}' may only use letters, digits, '.', '_' and '-'")
+        if name in names:
+            raise ValueError(f"Duplicate slice name '{name}'")
+        names.add(name)
+
+        filters = {}
+        for key in SLICE_FILTERS:
+            value = entry.get(key)
+            if value is not None and not isinstance(value, list):
+                value = [value]
+            filters[key] = value
+        slices.append(Slice(
+            name,
+            None if filters["terms"] is None else [str(t) for t in filters["terms"]],
+            None if filters["assignments"] is None else [int(a) for a in filters["assignments"]],
+            None if filters["problems"] is None else [int(p) for p in filters["problems"]],
+            {**SLICE_OPTIONS, **defaults, **{k: entry[k] for k in SLICE_OPTIONS if k in entry}},
+        ))
+
+    if not slices:
+        raise ValueError("The spec has no [[slice]] entries")
+
+    settings = {**RUN_SETTINGS, **{k: spec[k] for k in RUN_SETTINGS if k in spec}}
+    return RunSpec(str(spec.get("name") or default_name), settings, slices)
+
+
+def load_run_spec(path: str) -> RunSpec:
+    """Read and validate a TOML run spec (see parse_run_spec)."""
+    with open(path, "rb") as f:
+        spec = tomllib.load(f)
+    return parse_run_spec(spec, os.path.splitext(os.path.basename(path))[0])
+
+
+def load_slice_data(spec: RunSpec, rebuild_cache: bool = False) -> pd.DataFrame | None:
+    """The joined rows every slice needs, loaded once for the whole run."""
+    from utils.dataset import load_joined_datasets
+
+    terms = None
+    if all(s.terms is not None for s in spec.slices):
+        terms = sorted({t for s in spec.slices for t in s.terms})
+    problems = None
+    if all(s.problems is not None for s in spec.slices):
+        problems = sorted({p for s in spec.slices for p in s.problems})
+
+    return load_joined_datasets(terms=terms, problems=problems, rebuild_cache=rebuild_cache,
+                                columns=SUBMISSION_COLUMNS + ["TermID"])
+
+
+def slice_submissions(data: pd.DataFrame, slice_: Slice) -> list[dict]:
+    """Best attempts of the rows matching the slice's filters, capped at its limit."""
+    mask = pd.Series(True, index=data.index)
+    if slice_.terms is not None:
+        mask &= data["TermID"].isin(slice_.terms)
+    if slice_.assignments is not None:
+        mask &= data["AssignmentID"].isin(slice_.assignments)
+    if slice_.problems is not None:
+        mask &= data["ProblemID"].isin(slice_.problems)
+
+    print(f"\nSlice {slice_.name}:")
+    best = get_best_attempts(data[mask].drop(columns="TermID"))
+    submissions = best.to_dict(orient="records")
+    limit = slice_.options["limit"]
+    return submissions if limit is None else submissions[:limit]
+
+
+async def run_slices_async(spec: RunSpec, submissions: dict[str, list[dict]],
+                           executor: RateLimitedExecutor, workers: int | None = None) -> dict[str, dict]:
+    """
+    Analyze every slice concurrently, at most parallel_slices at a time,
+    all through one executor so they share its request and token quotas.
+
+    Returns per slice name: results (None if every request failed),
+    submissions and wall seconds.
+    """
+    semaphore = asyncio.Semaphore(max(1, int(spec.settings["parallel_slices"])))
+
+    async def run(slice_: Slice) -> dict:
+        async with semaphore:
+            options = slice_.options
+            with span("slice", slice=slice_.name, rows=len(submissions[slice_.name])):
+                start = time.perf_counter()
+                results = await analyze_all_submissions_async(
+                    submissions[slice_.name], executor, spec.settings["use_cache"],
+                    options["max_prompt_tokens"], deduplicate=options["deduplicate"],
+                    workers=workers, cluster=options["cluster"], triage=options["triage"])
+                return {"results": results, "submissions": len(submissions[slice_.name]),
+                        "seconds": time.perf_counter() - start}
+
+    outcomes = await asyncio.gather(*(run(s) for s in spec.slices))
+    return {s.name: outcome for s, outcome in zip(spec.slices, outcomes)}
+
+
+def write_run_report(spec: RunSpec, outcomes: dict[str, dict], out_dir: str, extra: dict | None = None) -> str:
+    """
+    Write <slice>.json with each slice's results and report.json with
+    per-slice counts and a class_summary over every slice. Returns the
+    report path.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    slices = {}
+    for slice_ in spec.slices:
+        outcome = outcomes[slice_.name]
+        results = outcome["results"] or {"student_analysis": []}
+        with open(os.path.join(out_dir, f"{slice_.name}.json"), "w") as f:
+            json.dump(results, f, indent=2, default=str)
+        slices[slice_.name] = {
+            "terms": slice_.terms, "assignments": slice_.assignments, "problems": slice_.problems,
+            "options": slice_.options, "submissions": outcome["submissions"],
+            "analyses": len(results["student_analysis"]), "seconds": round(outcome["seconds"], 3),
+            "class_summary": results.get("class_summary"),
+        }
+
+    merged = merge_batch_results([o["results"] for o in outcomes.values() if o["results"]])
+    report = {"name": spec.name, "settings": spec.settings, **(extra or {}),
+              "slices": slices, "class_summary": merged["class_summary"]}
+    path = os.path.join(out_dir, "report.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    return path
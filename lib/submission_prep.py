@@ -0,0 +1,128 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+from lib.dedup import code_fingerprint
+from lib.java_rules import RuleHit, check_code, format_hints
+
+SUBMISSIONS_HEADER = "STUDENT SUBMISSIONS TO ANALYZE:\n\n"
+SUBMISSIONS_FOOTER = "\nAnalyze each student's knowledge state and predict future struggles."
+
+# Submissions per worker task; small inputs aren't worth the pool startup
+PREP_SHARD_SIZE = 2_000
+PREP_PARALLEL_MIN = 4 * PREP_SHARD_SIZE
+
+
+class PreparedSubmissions(NamedTuple):
+    bodies: list[str]  # format_submission_body() of each submission
+    fingerprints: list[str]  # code_fingerprint() of each submission's code
+    sizes: list[int]  # estimated tokens of each formatted block
+    hits: list[list[RuleHit]]  # check_code() of each submission's code, if rules ran
+
+
+def submission_header(idx: int) -> str:
+    return f"--- Submission {idx} ---\n"
+
+
+def format_submission_body(sub: dict, hits: list[RuleHit] | None = None) -> str:
+    """
+    Format one submission block, without its numbered header.
+    hits (from lib.java_rules) are appended as hints for the model.
+    """
+    code = sub.get('Code', 'NO CODE')
+    student_id = sub.get('SubjectID', 'unknown')
+    problem_id = sub.get('ProblemID', 'unknown')
+    score = sub.get('Score', 0)
+    attempt = sub.get('Attempt', 'unknown')
+
+    # Include compile result if available
+    compile_result = sub.get('Compile.Result', '')
+
+    header = f"""Student ID: {student_id}
+Problem ID: {problem_id}
+Score: {float(score) * 100:.1f}%
+Attempt #: {attempt}
+Compiled: {compile_result if compile_result else 'Unknown'}
+
+"""
+    # Progression mode: the compressed attempt history replaces the code
+    trajectory = sub.get('Trajectory')
+    if trajectory:
+        return f"{header}{trajectory}\n\n"
+
+    hints = f"{format_hints(hits)}\n\n" if hits else ""
+    return f"""{header}Code:
+```java
+{code}
+```
+
+{hints}"""
+
+
+def format_submission(idx: int, sub: dict) -> str:
+    """Format one submission block."""
+    return submission_header(idx) + format_submission_body(sub)
+
+
+def format_submissions(submissions: list[dict], bodies: list[str] | None = None) -> str:
+    """
+    Format submissions for analysis.
+
+    Args:
+        submissions: Submission dicts, numbered in this order
+        bodies: Already formatted bodies of the same submissions (from
+            prepare_submissions), to skip formatting them again
+    """
+    if bodies is None:
+        bodies = [format_submission_body(sub) for sub in submissions]
+    blocks = [submission_header(idx) + body
+              for idx, body in enumerate(bodies, 1)]
+    return SUBMISSIONS_HEADER + "".join(blocks) + SUBMISSIONS_FOOTER
+
+
+def _prepare_shard(shard: list[dict], chars_per_token: float, rules: bool = False) -> PreparedSubmissions:
+    hits = [check_code(sub.get("Code")) if rules else [] for sub in shard]
+    bodies = [format_submission_body(sub, sub_hits) for sub, sub_hits in zip(shard, hits)]
+    header_chars = len(submission_header(0))
+    return PreparedSubmissions(
+        bodies=bodies,
+        fingerprints=[code_fingerprint(sub.get("Code")) for sub in shard],
+        sizes=[int((header_chars + len(body)) / chars_per_token) + 1 for body in bodies],
+        hits=hits,
+    )
+
+
+def prepare_submissions(submissions: list[dict], chars_per_token: float = 4.0,
+                        workers: int | None = None,
+                        shard_size: int = PREP_SHARD_SIZE, rules: bool = False) -> PreparedSubmissions:
+    """
+    Format, fingerprint and size every submission ahead of batching, and
+    with rules, run the static checks of lib.java_rules over its code.
+
+    Large inputs are split into shards of shard_size and prepared in a
+    process pool; results are reassembled in input order, so the output is
+    identical to the serial path.
+
+    Args:
+        submissions: Submission dicts
+        chars_per_token: Token estimate ratio (TokenEstimator.chars_per_token)
+        workers: Pool size (defaults to the CPU count); 1 runs serially
+        shard_size: Submissions per worker task
+        rules: Run the static checks and include their hits as hints
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(submissions) < PREP_PARALLEL_MIN:
+        return _prepare_shard(submissions, chars_per_token, rules)
+
+    shards = [submissions[start:start + shard_size]
+              for start in range(0, len(submissions), shard_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_prepare_shard, shards,
+                                [chars_per_token] * len(shards), [rules] * len(shards)))
+
+    return PreparedSubmissions(
+        bodies=[body for result in results for body in result.bodies],
+        fingerprints=[fp for result in results for fp in result.fingerprints],
+        sizes=[size for result in results for size in result.sizes],
+        hits=[sub_hits for result in results for sub_hits in result.hits],
+    )
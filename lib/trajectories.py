@@ -0,0 +1,164 @@
+import difflib
+
+import numpy as np
+import pandas as pd
+
+from lib.attempts import PAIR_KEYS, classify_submissions
+from utils.constants import PROGRESSION_TOKENS_PER_STUDENT
+from utils.telemetry import span
+
+# Smallest useful history; a student's problems past their budget get none
+MIN_TRAJECTORY_TOKENS = 150
+# Shortest a step is cut to before the history is dropped instead
+MIN_STEP_CHARS = 80
+# Context lines around each change in the diffs
+DIFF_CONTEXT_LINES = 1
+
+
+def key_attempts(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Every code state of every (SubjectID, ProblemID) in attempt order,
+    with a Keep column marking the first and last attempts and those whose
+    score or compile status differs from the attempt before.
+    """
+    states = classify_submissions(df).sort_values(
+        PAIR_KEYS + ["Attempt", "CodeStateID"], kind="stable").reset_index(drop=True)
+
+    pair = states.groupby(PAIR_KEYS, observed=True, sort=False).ngroup().to_numpy()
+    score = states["Score"].to_numpy(dtype="float64")
+    status = states["Status"].to_numpy()
+
+    first = np.r_[True, pair[1:] != pair[:-1]]
+    last = np.r_[pair[1:] != pair[:-1], True]
+    previous_score = np.r_[np.nan, score[:-1]]
+    score_changed = ~((score == previous_score) | (np.isnan(score) & np.isnan(previous_score)))
+    status_changed = np.r_[True, status[1:] != status[:-1]]
+
+    states["Keep"] = first | last | score_changed | status_changed
+    return states
+
+
+def _code_lines(code) -> list[str]:
+    return code.splitlines() if isinstance(code, str) else []
+
+
+def _diff(before, after) -> str:
+    lines = difflib.unified_diff(_code_lines(before), _code_lines(after),
+                                 n=DIFF_CONTEXT_LINES, lineterm="")
+    # Drop the ---/+++ file headers; the hunks are all that matters
+    return "\n".join(line for line in lines if not line.startswith(("---", "+++")))
+
+
+def _step_label(row) -> str:
+    score = row.Score
+    score_text = "not run" if score != score else f"score {float(score) * 100:.0f}%"
+    return f"Attempt {row.Attempt} ({row.Status}, {score_text})"
+
+
+def _shorten(block: str, max_chars: int) -> str:
+    """block cut to at most max_chars, whole lines first, with a note of what was cut."""
+    if len(block) <= max_chars:
+        return block
+    lines, kept, size = block.splitlines(), [], 0
+    # Room for the note, whatever the number of cut lines
+    room = max_chars - len(f"... ({len(lines)} more lines)") - 1
+    for line in lines:
+        if size + len(line) + 1 > room:
+            break
+        kept.append(line)
+        size += len(line) + 1
+    return "\n".join(kept + [f"... ({len(lines) - len(kept)} more lines)"])
+
+
+def format_trajectory(states: pd.DataFrame, max_chars: int) -> str | None:
+    """
+    One pair's history: the first kept attempt in full, then a unified diff
+    to each later kept attempt. Middle steps are dropped, then steps
+    shortened, until the text fits max_chars.
+
+    Returns None if even the first and last steps can't fit.
+    """
+    kept = list(states[states["Keep"]].itertuples(index=False))
+    steps = [f"{_step_label(kept[0])}:\n```java\n{kept[0].Code if isinstance(kept[0].Code, str) else ''}\n```"]
+    for before, after in zip(kept, kept[1:]):
+        diff = _diff(before.Code, after.Code)
+        steps.append(f"{_step_label(after)}, changes:\n```diff\n{diff or '(no code changes)'}\n```")
+
+    header = (f"History: {len(states)} attempts, {len(kept)} shown "
+              f"(first, last, and where the score or compile status changed)")
+
+    omitted = 0
+    while len(steps) > 2 and len(header) + sum(len(s) + 1 for s in steps) > max_chars:
+        steps.pop(len(steps) // 2)
+        omitted += 1
+    if omitted:
+        steps.insert(len(steps) // 2 + len(steps) % 2, f"({omitted} intermediate steps omitted)")
+
+    if len(header) + sum(len(s) + 1 for s in steps) <= max_chars:
+        return "\n".join([header] + steps)
+    per_step = (max_chars - len(header)) // len(steps) - 1
+    if per_step < MIN_STEP_CHARS:
+        return None
+    return "\n".join([header] + [_shorten(step, per_step) for step in steps])
+
+
+def _code_chars(states: pd.DataFrame) -> np.ndarray:
+    return states["Code"].map(lambda code: len(code) if isinstance(code, str) else 0).to_numpy()
+
+
+def compress_trajectories(df: pd.DataFrame, tokens_per_student: int = PROGRESSION_TOKENS_PER_STUDENT,
+                          chars_per_token: float = 4.0) -> tuple[dict[tuple[str, str], str], dict]:
+    """
+    Compact attempt histories of every (SubjectID, ProblemID) in df.
+
+    tokens_per_student caps the history text of each student. What is left
+    of it is shared evenly between the student's remaining problems (at
+    least MIN_TRAJECTORY_TOKENS each), so short histories leave more for
+    the others; once the budget is spent, the remaining problems get no
+    history.
+    Pairs without a history (also those whose history would be no shorter
+    than every attempt's code, e.g. a single attempt) are sent as their
+    best attempt, as outside progression mode.
+
+    Args:
+        df: Joined event rows (SubjectID, ProblemID, Attempt, CodeStateID,
+            EventType, Score, Code), every attempt not just the best
+        tokens_per_student: Prompt token budget per student
+        chars_per_token: Token estimate ratio (TokenEstimator.chars_per_token)
+
+    Returns the trajectory text per (str(SubjectID), str(ProblemID)) with a
+    history and counts of attempts seen and kept and estimated tokens before
+    and after.
+    """
+    with span("trajectories", input_rows=len(df)) as s:
+        states = key_attempts(df)
+        states["CodeChars"] = _code_chars(states)
+        min_chars = int(MIN_TRAJECTORY_TOKENS * chars_per_token)
+
+        trajectories, sent_chars = {}, 0
+        for student, student_states in states.groupby("SubjectID", observed=True, sort=False):
+            remaining = int(tokens_per_student * chars_per_token)
+            pairs = list(student_states.groupby("ProblemID", observed=True, sort=False))
+            for left, (problem, pair_states) in zip(range(len(pairs), 0, -1), pairs):
+                allowance = min(remaining, max(min_chars, remaining // left))
+                text = format_trajectory(pair_states, allowance) if allowance >= min_chars else None
+                full_chars = int(pair_states["CodeChars"].sum())
+                if text is None or len(text) >= full_chars:
+                    # Sent as the best attempt: the highest score, latest on ties
+                    best = pair_states.iloc[::-1]["Score"].fillna(-1.0).idxmax()
+                    sent_chars += int(pair_states.at[best, "CodeChars"])
+                    continue
+                trajectories[(str(student), str(problem))] = text
+                remaining -= len(text)
+                sent_chars += len(text)
+
+        stats = {
+            "pairs": len(trajectories),
+            "attempts": len(states),
+            "kept": int(states["Keep"].sum()),
+            "full_tokens": int(states["CodeChars"].sum() / chars_per_token),
+            "tokens": int(sent_chars / chars_per_token),
+        }
+        s.set(rows=stats["pairs"], kept=stats["kept"])
+
+    return trajectories, stats
@@ -0,0 +1,143 @@
+"""
+Batch runs end to end against the offline LocalBackend: sharding into a
+manifest, resuming after a crash without resubmitting, and collecting
+results with the keys that got no analysis listed under 'missing'.
+
+    python -m unittest discover tests
+"""
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from commands.batch import batch_command
+from lib import backends
+from lib import llm_individual_analyzer as batch
+from lib.backends import Backend, LocalBackend
+
+
+def make_submissions(count: int) -> list[dict]:
+    return [{"SubjectID": 1000 + idx, "ProblemID": [1, 3, 5][idx % 3], "Attempt": 1,
+             "Score": [0.0, 0.5, 1.0][idx % 3], "Compile.Result": "Success",
+             "Code": f"public int solve(int n) {{ return n + {idx}; }}"}
+            for idx in range(count)]
+
+
+class CrashingBackend(LocalBackend):
+    """LocalBackend whose create_batch_job fails after `jobs` jobs."""
+
+    def __init__(self, jobs: int, **options):
+        super().__init__(**options)
+        self.jobs = jobs
+
+    def create_batch_job(self, file_name: str, display_name: str) -> str:
+        if self.jobs == 0:
+            raise ConnectionError("lost connection")
+        self.jobs -= 1
+        return super().create_batch_job(file_name, display_name)
+
+
+class StreamingOnlyBackend(Backend):
+    """Backend without batch jobs."""
+
+    def __init__(self):
+        super().__init__("streaming-only")
+
+    async def generate_async(self, contents, config=None):
+        raise AssertionError("not called")
+
+    async def count_tokens_async(self, contents):
+        return 0
+
+    async def create_cache_async(self, system_instruction, ttl_seconds, display_name):
+        return display_name
+
+
+class BatchRunTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(batch, "BATCH_JOBS_DIR", self.tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp.cleanup)
+        quiet = contextlib.redirect_stdout(io.StringIO())
+        quiet.__enter__()
+        self.addCleanup(quiet.__exit__, None, None, None)
+
+        self.submissions = make_submissions(7)
+        self.keys = [f"{s['SubjectID']}:{s['ProblemID']}" for s in self.submissions]
+
+    def test_shards_are_recorded_in_the_manifest(self):
+        manifest = batch.submit_batch_run(self.submissions, "run", shard_size=3, backend=LocalBackend())
+
+        self.assertEqual(manifest, batch.load_manifest("run"))
+        self.assertEqual(manifest["model"], "local")
+        self.assertEqual([s["keys"] for s in manifest["shards"]],
+                         [self.keys[0:3], self.keys[3:6], self.keys[6:7]])
+        for shard in manifest["shards"]:
+            self.assertTrue(shard["job_name"])
+            with open(shard["input_file"]) as f:
+                requests = [json.loads(line) for line in f]
+            self.assertEqual([r["key"] for r in requests], shard["keys"])
+
+    def test_resume_submits_only_the_remaining_shards(self):
+        with self.assertRaises(ConnectionError):
+            batch.submit_batch_run(self.submissions, "run", shard_size=3, backend=CrashingBackend(jobs=1))
+        crashed = batch.load_manifest("run")
+        self.assertEqual([bool(s["job_name"]) for s in crashed["shards"]], [True, False, False])
+        self.assertTrue(crashed["shards"][1]["uploaded_file"])
+
+        backend = LocalBackend()
+        # A resumed run doesn't need the submissions again
+        manifest = batch.submit_batch_run([], "run", shard_size=3, backend=backend)
+        self.assertEqual(manifest["shards"][0]["job_name"], crashed["shards"][0]["job_name"])
+        self.assertTrue(all(s["job_name"] for s in manifest["shards"]))
+        self.assertEqual(backend.calls, 4)  # Requests of shards 1 and 2 only
+
+        self.assertTrue(batch.poll_batch_run(manifest, backend))
+        results = batch.collect_batch_run(manifest, backend)
+        self.assertEqual(sorted(e["student_id"] + ":" + e["problem_id"] for e in results["student_analysis"]),
+                         sorted(self.keys))
+        self.assertEqual(results["missing"], [])
+
+    def test_collect_lists_failed_requests_and_shards_as_missing(self):
+        backend = LocalBackend(error_rate=0.4, seed=3)
+        manifest = batch.submit_batch_run(self.submissions, "run", shard_size=3, backend=backend)
+        # The last shard's job failed: its output is gone
+        os.remove(backend.get_batch_job(manifest["shards"][2]["job_name"]).result_file)
+        self.assertTrue(batch.poll_batch_run(manifest, backend))
+        self.assertEqual([s["state"] for s in manifest["shards"]],
+                         ["JOB_STATE_SUCCEEDED", "JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED"])
+
+        results = batch.collect_batch_run(manifest, backend)
+
+        failed = []
+        for shard in manifest["shards"][:2]:
+            with open(shard["result_file"]) as f:
+                failed.extend(record["key"] for record in map(json.loads, f) if "error" in record)
+        self.assertTrue(failed)  # The seed makes some requests fail
+        self.assertEqual(sorted(results["missing"]), sorted(failed + self.keys[6:7]))
+        analyzed = {e["student_id"] + ":" + e["problem_id"] for e in results["student_analysis"]}
+        self.assertEqual(analyzed, set(self.keys) - set(results["missing"]))
+        self.assertIn("class_summary", results)
+
+        # Collecting again reuses the downloaded files
+        self.assertEqual(batch.collect_batch_run(manifest, backend), results)
+
+    def test_command_rejects_backends_without_batch_jobs(self):
+        output = io.StringIO()
+        with mock.patch.object(backends, "create_backend", return_value=StreamingOnlyBackend()), \
+                mock.patch("commands.batch.load_best_attempts") as load, \
+                contextlib.redirect_stdout(output):
+            batch_command("run", backend="streaming")
+
+        self.assertIn("doesn't support batch jobs", output.getvalue())
+        load.assert_not_called()
+        self.assertIsNone(batch.load_manifest("run"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""
+SystemInstructionCache falls back to inline instructions when creating the
+cached content fails, and only gives up on caching for permanent errors.
+
+    python -m unittest discover tests
+"""
+import asyncio
+import contextlib
+import io
+import unittest
+from unittest import mock
+
+from google.genai import errors
+
+from lib.backends import LocalBackend
+from utils import api_utils
+from utils.api_utils import SystemInstructionCache
+
+
+class FlakyBackend(LocalBackend):
+    """LocalBackend whose create_cache_async raises the given errors first."""
+
+    def __init__(self, failures: list[Exception]):
+        super().__init__()
+        self.failures = list(failures)
+        self.creates = 0
+
+    async def create_cache_async(self, system_instruction: str, ttl_seconds: int, display_name: str) -> str:
+        self.creates += 1
+        if self.failures:
+            raise self.failures.pop(0)
+        return await super().create_cache_async(system_instruction, ttl_seconds, display_name)
+
+
+def api_error(code: int) -> errors.APIError:
+    cls = errors.ClientError if code < 500 else errors.ServerError
+    return cls(code, {"error": {"code": code, "message": "failed", "status": "FAILED"}})
+
+
+class SystemInstructionCacheTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(api_utils, "backoff_delay", return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        quiet = contextlib.redirect_stdout(io.StringIO())
+        quiet.__enter__()
+        self.addCleanup(quiet.__exit__, None, None, None)
+
+    def config(self, cache: SystemInstructionCache):
+        return asyncio.run(cache.request_config("instruction"))
+
+    def test_retryable_errors_are_retried(self):
+        backend = FlakyBackend([api_error(429), api_error(503)])
+        cache = SystemInstructionCache(backend)
+
+        config = self.config(cache)
+
+        self.assertEqual(backend.creates, 3)
+        self.assertTrue(config.cached_content)
+        self.assertIsNone(config.system_instruction)
+
+    def test_exhausted_retries_send_inline_once(self):
+        backend = FlakyBackend([api_error(503)] * 3)
+        cache = SystemInstructionCache(backend, max_retries=2)
+
+        config = self.config(cache)
+        self.assertEqual(config.system_instruction, "instruction")
+        self.assertTrue(cache.enabled)
+
+        self.assertTrue(self.config(cache).cached_content)
+
+    def test_transport_errors_send_inline_once(self):
+        backend = FlakyBackend([TimeoutError("read timed out")])
+        cache = SystemInstructionCache(backend)
+
+        self.assertEqual(self.config(cache).system_instruction, "instruction")
+        self.assertTrue(cache.enabled)
+        self.assertTrue(self.config(cache).cached_content)
+
+    def test_permanent_errors_disable_caching(self):
+        backend = FlakyBackend([api_error(400)])
+        cache = SystemInstructionCache(backend)
+
+        self.assertEqual(self.config(cache).system_instruction, "instruction")
+        self.assertFalse(cache.enabled)
+        self.assertEqual(self.config(cache).system_instruction, "instruction")
+        self.assertEqual(backend.creates, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+"""
+Each static Java rule on code it should flag and on near-misses it must
+leave alone, since decisive hits skip the model entirely.
+
+    python -m unittest discover tests
+"""
+import unittest
+
+from lib.java_rules import check_code
+
+
+def rules(code: str) -> list[str]:
+    return [hit.rule for hit in check_code(code)]
+
+
+def method(body: str) -> str:
+    return "public boolean solve(String str, int[] nums) {\n" + body + "\n}"
+
+
+class StringLengthPropertyTest(unittest.TestCase):
+    def test_hit(self):
+        self.assertIn("string_length_property", rules(method("int n = str.length; return n > 0;")))
+
+    def test_method_call_is_fine(self):
+        self.assertNotIn("string_length_property", rules(method("int n = str.length(); return n > 0;")))
+
+    def test_array_field_is_fine(self):
+        self.assertNotIn("string_length_property", rules(method("int n = nums.length; return n > 0;")))
+
+
+class ArrayLengthCallTest(unittest.TestCase):
+    def test_hit(self):
+        self.assertIn("array_length_call", rules(method("int n = nums.length(); return n > 0;")))
+
+    def test_array_field_is_fine(self):
+        self.assertNotIn("array_length_call", rules(method("int n = nums.length; return n > 0;")))
+
+
+class PrematureReturnTest(unittest.TestCase):
+    def test_hit(self):
+        code = method("""for (int i = 0; i < str.length(); i++) {
+    if (str.charAt(i) == 'x') return true;
+    else return false;
+}
+return false;""")
+        self.assertIn("premature_return", rules(code))
+
+    def test_hit_with_blocks_and_else_if(self):
+        code = method("""for (int i = 0; i < nums.length; i++) {
+    if (nums[i] > 0) { return true; }
+    else if (nums[i] < 0) { return false; }
+    else { return true; }
+}
+return false;""")
+        self.assertIn("premature_return", rules(code))
+
+    def test_else_of_an_outer_if_is_fine(self):
+        # The return in the if branch is conditional, so the loop can go on
+        code = method("""for (int i = 0; i < nums.length; i++) {
+    if (nums[i] > 0) { if (nums[i] == 3) return true; } else return false;
+}
+return false;""")
+        self.assertNotIn("premature_return", rules(code))
+
+    def test_dangling_else_is_fine(self):
+        code = method("""for (int i = 0; i < nums.length; i++) {
+    if (nums[i] > 0) if (nums[i] == 3) return true; else return false;
+}
+return false;""")
+        self.assertNotIn("premature_return", rules(code))
+
+    def test_return_after_the_loop_is_fine(self):
+        code = method("""for (int i = 0; i < nums.length; i++) {
+    if (nums[i] == 3) return true;
+}
+return false;""")
+        self.assertNotIn("premature_return", rules(code))
+
+    def test_skipped_iterations_are_fine(self):
+        code = method("""for (int i = 0; i < nums.length; i++) {
+    if (nums[i] == 0) continue;
+    if (nums[i] == 3) return true; else return false;
+}
+return false;""")
+        self.assertNotIn("premature_return", rules(code))
+
+
+class UnguardedOffsetIndexTest(unittest.TestCase):
+    def test_hit(self):
+        code = method("""for (int i = 0; i < str.length(); i++) {
+    if (str.charAt(i + 1) == 'x') return true;
+}
+return false;""")
+        self.assertIn("unguarded_offset_index", rules(code))
+
+    def test_shortened_bound_is_fine(self):
+        code = method("""for (int i = 0; i < str.length() - 1; i++) {
+    if (str.charAt(i + 1) == 'x') return true;
+}
+return false;""")
+        self.assertNotIn("unguarded_offset_index", rules(code))
+
+
+class InclusiveLengthBoundTest(unittest.TestCase):
+    def test_hit(self):
+        code = method("""int count = 0;
+for (int i = 0; i <= nums.length; i++) {
+    count += nums[i];
+}
+return count > 0;""")
+        self.assertIn("inclusive_length_bound", rules(code))
+
+    def test_exclusive_bound_is_fine(self):
+        code = method("""int count = 0;
+for (int i = 0; i < nums.length; i++) {
+    count += nums[i];
+}
+return count > 0;""")
+        self.assertNotIn("inclusive_length_bound", rules(code))
+
+    def test_bound_without_indexing_is_fine(self):
+        code = method("""int count = 0;
+for (int i = 0; i <= str.length(); i++) {
+    count++;
+}
+return count > 0;""")
+        self.assertNotIn("inclusive_length_bound", rules(code))
+
+
+class StringReferenceEqualityTest(unittest.TestCase):
+    def test_hit(self):
+        self.assertIn("string_reference_equality", rules(method('return str == "bread";')))
+
+    def test_equals_is_fine(self):
+        self.assertNotIn("string_reference_equality", rules(method('return str.equals("bread");')))
+
+    def test_null_check_is_fine(self):
+        self.assertNotIn("string_reference_equality", rules(method("return str == null;")))
+
+
+class EmptyStatementAfterConditionTest(unittest.TestCase):
+    def test_hit(self):
+        code = method("if (str.isEmpty()); return true;")
+        self.assertIn("empty_statement_after_condition", rules(code))
+
+    def test_do_while_is_fine(self):
+        code = method("int i = 0;\ndo { i++; } while (i < 3);\nreturn i > 0;")
+        self.assertNotIn("empty_statement_after_condition", rules(code))
+
+
+class CheckCodeTest(unittest.TestCase):
+    def test_malformed_code_has_no_hits(self):
+        self.assertEqual(check_code(None), [])
+        self.assertEqual(check_code(""), [])
+        self.assertIsInstance(check_code("for (int i = 0; i < "), list)
+
+
+if __name__ == "__main__":
+    unittest.main()
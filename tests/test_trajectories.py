@@ -0,0 +1,57 @@
+"""
+compress_trajectories keeps every student's histories within the token
+budget and never sends more than the attempts' own code.
+
+    python -m unittest discover tests
+"""
+import unittest
+
+import pandas as pd
+
+from lib.trajectories import compress_trajectories
+
+
+def make_events(students: int, problems: int, attempts: int) -> pd.DataFrame:
+    rows = []
+    for student in range(students):
+        for problem in range(problems):
+            # One attempt of the last problem; several of the others, the score rising each time
+            for attempt in range(1, 2 if problem == problems - 1 else attempts + 1):
+                # Each attempt edits one line
+                body = "\n".join(f"    total += values[{line}] * {attempt if line == 5 else 2};"
+                                 for line in range(12))
+                rows.append({
+                    "SubjectID": f"s{student}", "ProblemID": problem, "Attempt": attempt,
+                    "CodeStateID": f"{student}-{problem}-{attempt}", "EventType": "Run.Program",
+                    "Score": attempt / attempts, "Compile.Result": "Success",
+                    "Code": f"public int solve(int[] values) {{\n    int total = 0;\n{body}\n    return total;\n}}",
+                })
+    return pd.DataFrame(rows)
+
+
+class CompressTrajectoriesTest(unittest.TestCase):
+    def test_students_stay_within_the_budget(self):
+        events = make_events(students=3, problems=12, attempts=6)
+        trajectories, stats = compress_trajectories(events, tokens_per_student=1_000)
+
+        for student in events["SubjectID"].unique():
+            chars = sum(len(text) for (s, _), text in trajectories.items() if s == student)
+            self.assertLessEqual(chars / 4, 1_000)
+        # The budget runs out before the last problems
+        self.assertLess(stats["pairs"], 3 * 11)
+        self.assertTrue(trajectories)
+
+    def test_histories_are_shorter_than_the_code(self):
+        events = make_events(students=2, problems=3, attempts=4)
+        trajectories, stats = compress_trajectories(events, tokens_per_student=100_000)
+
+        # Single attempts are sent as the plain best attempt
+        self.assertEqual(sorted(trajectories), [(s, str(p)) for s in ("s0", "s1") for p in (0, 1)])
+        self.assertLessEqual(stats["tokens"], stats["full_tokens"])
+        for (student, problem), text in trajectories.items():
+            pair = events[(events["SubjectID"] == student) & (events["ProblemID"] == int(problem))]
+            self.assertLess(len(text), pair["Code"].str.len().sum())
+
+
+if __name__ == "__main__":
+    unittest.main()
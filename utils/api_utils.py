@@ -1,8 +1,218 @@
+import asyncio
+import hashlib
+import random
 import time
 
-from utils.constants import RATE_TIME_SECONDS
+from google.genai import errors, types
 
+from utils.constants import CONTEXT_CACHE_TTL_SECONDS, MAX_CONCURRENT_REQUESTS, MAX_RETRIES, REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE
+from utils.telemetry import span
 
-def rate_limit():
-    """Prevent exceeding API rate limits (15 RPM)"""
-    time.sleep(RATE_TIME_SECONDS)
+# Exponential backoff bounds (seconds) for retried requests
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 60.0
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for Gemini models (~4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limit (429) and server-side (5xx) errors are worth retrying."""
+    return isinstance(error, errors.APIError) and (error.code == 429 or error.code >= 500)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter for the given retry attempt."""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def usage_counts(response) -> dict:
+    """Prompt, response and cached token counts from a response's usage metadata."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return {}
+    counts = {
+        "prompt_tokens": usage.prompt_token_count,
+        "response_tokens": usage.candidates_token_count,
+        "cached_tokens": usage.cached_content_token_count,
+    }
+    return {key: value for key, value in counts.items() if value is not None}
+
+
+class TokenBucket:
+    """
+    Token bucket holding up to `capacity` tokens, refilled evenly over `period` seconds.
+
+    Callers reserve tokens immediately (the balance may go negative) and then
+    sleep off their share of the debt, so waiters are served in FIFO order
+    without a lock.
+    """
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens +
+                          (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class RateLimitedExecutor:
+    """
+    Runs generate calls concurrently within RPM/TPM quotas.
+
+    Args:
+        backend: LLM backend (lib.backends) the requests are sent to
+        requests_per_minute: Request quota (RPM)
+        tokens_per_minute: Input token quota (TPM)
+        max_concurrency: Max requests in flight at once
+        max_retries: Retries for 429/5xx responses before giving up
+    """
+
+    def __init__(self, backend, requests_per_minute: int = REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = TOKENS_PER_MINUTE,
+                 max_concurrency: int = MAX_CONCURRENT_REQUESTS, max_retries: int = MAX_RETRIES):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._loop = None
+        self._semaphore = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # asyncio primitives are bound to one loop; recreate per event loop
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def generate_content(self, contents, config=None, estimated_tokens: int = 0):
+        """
+        Send one generate_content request, waiting for quota and retrying
+        rate-limit/server errors with jittered exponential backoff.
+        Returns the response, or None if the request ultimately failed.
+        """
+        with span("api_call", estimated_tokens=estimated_tokens, retries=0) as s:
+            async with self._get_semaphore():
+                for attempt in range(self.max_retries + 1):
+                    await self.requests.acquire()
+                    await self.tokens.acquire(estimated_tokens)
+                    try:
+                        response = await self.backend.generate_async(contents, config)
+                        s.set(**usage_counts(response))
+                        return response
+                    except errors.APIError as e:
+                        if not is_retryable(e) or attempt == self.max_retries:
+                            print(f"Request failed: {e}")
+                            s.set(failed=e.code)
+                            return None
+                        delay = backoff_delay(attempt)
+                        print(
+                            f"Request failed with {e.code}, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+                        s.add("retries")
+                        await asyncio.sleep(delay)
+        return None
+
+
+class SystemInstructionCache:
+    """
+    Registers a system instruction as cached content so requests only send
+    their own contents.
+
+    One handle is kept per instruction and re-created shortly before its TTL
+    runs out. When creating one fails, callers fall back to sending the
+    instruction inline; caching is disabled only if the error is permanent
+    (model unsupported, prompt below the minimum cacheable size, ...).
+
+    Args:
+        backend: LLM backend (lib.backends) the cached content is created on
+        ttl_seconds: Lifetime of each cached content handle
+        max_retries: Retries of a rate-limited or failed create call
+    """
+
+    # Re-create handles this long before they expire
+    REFRESH_MARGIN_SECONDS = 60
+
+    def __init__(self, backend, ttl_seconds: int = CONTEXT_CACHE_TTL_SECONDS, max_retries: int = MAX_RETRIES):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.max_retries = max_retries
+        self.enabled = True
+        self._handles: dict[str, tuple[str, float]] = {}
+        self._creating: dict[str, asyncio.Task] = {}
+
+    async def get(self, system_instruction: str) -> str | None:
+        """Cached content name for system_instruction, or None to send it inline."""
+        if not self.enabled:
+            return None
+
+        digest = hashlib.sha256(system_instruction.encode()).hexdigest()
+        handle = self._handles.get(digest)
+        if handle and handle[1] - self.REFRESH_MARGIN_SECONDS > time.monotonic():
+            return handle[0]
+
+        # Concurrent requests share a single create call
+        task = self._creating.get(digest)
+        if task is None:
+            task = asyncio.ensure_future(self._create(system_instruction, digest))
+            self._creating[digest] = task
+        try:
+            return await task
+        finally:
+            self._creating.pop(digest, None)
+
+    async def _create(self, system_instruction: str, digest: str) -> str | None:
+        """
+        Create the cached content, retrying rate limit and server errors.
+        Any failure sends this request's instruction inline; only permanent
+        client errors (unsupported model, prompt too small, ...) disable
+        caching for the rest of the process.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                cached_name = await self.backend.create_cache_async(
+                    system_instruction, self.ttl_seconds, f"kintsugi-{digest[:12]}")
+                break
+            except errors.APIError as e:
+                if is_retryable(e) and attempt < self.max_retries:
+                    delay = backoff_delay(attempt)
+                    print(f"Caching system instruction failed with {e.code}, "
+                          f"retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+                    await asyncio.sleep(delay)
+                    continue
+                if not is_retryable(e) and 400 <= e.code < 500:
+                    print(f"Context caching unavailable, sending instructions inline: {e}")
+                    self.enabled = False
+                else:
+                    print(f"Caching system instruction failed, sending it inline: {e}")
+                return None
+            except Exception as e:
+                # Transport errors (timeouts, dropped connections) aren't APIErrors
+                print(f"Caching system instruction failed, sending it inline: {e}")
+                return None
+
+        self._handles[digest] = (
+            cached_name, time.monotonic() + self.ttl_seconds)
+        print(f"Cached system instruction as {cached_name}")
+        return cached_name
+
+    async def request_config(self, system_instruction: str, **config) -> types.GenerateContentConfig:
+        """Generation config that references the cached instruction when possible."""
+        cached_name = await self.get(system_instruction)
+        if cached_name:
+            return types.GenerateContentConfig(cached_content=cached_name, **config)
+        return types.GenerateContentConfig(system_instruction=system_instruction, **config)
@@ -0,0 +1,121 @@
+import json
+import os
+import sqlite3
+import time
+
+from utils.constants import CHECKPOINT_PATH
+
+
+class CheckpointStore:
+    """
+    Persisted state of incremental analysis runs.
+
+    Keeps the last processed event, the best attempt behind every
+    (SubjectID, ProblemID) pair and the latest analysis of each pair.
+    Pairs whose best attempt changed but whose analysis hasn't succeeded
+    yet stay pending and are retried on the next run. The SQLite file is
+    opened on first use.
+    """
+
+    def __init__(self, path: str = CHECKPOINT_PATH):
+        self.path = path
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS best_attempts (
+                    subject_id TEXT NOT NULL,
+                    problem_id TEXT NOT NULL,
+                    score REAL,
+                    attempt INTEGER,
+                    submission TEXT NOT NULL,
+                    analyzed INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (subject_id, problem_id)
+                );
+                CREATE TABLE IF NOT EXISTS analyses (
+                    subject_id TEXT NOT NULL,
+                    problem_id TEXT NOT NULL,
+                    analysis TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (subject_id, problem_id)
+                );
+                CREATE INDEX IF NOT EXISTS idx_best_attempts_pending
+                    ON best_attempts (analyzed) WHERE analyzed = 0;
+            """)
+        return self._conn
+
+    def last_event(self) -> tuple[int | None, str | None]:
+        """(EventID, ServerTimestamp) of the last processed event, or (None, None)."""
+        rows = dict(self._connect().execute(
+            "SELECT key, value FROM meta WHERE key IN ('last_event_id', 'last_timestamp')"))
+        event_id = rows.get("last_event_id")
+        return (int(event_id) if event_id is not None else None), rows.get("last_timestamp")
+
+    def best_attempts(self, pairs: list[tuple[str, str]]) -> dict[tuple[str, str], tuple[float | None, int | None]]:
+        """Stored (score, attempt) of the best attempt for each known pair."""
+        conn = self._connect()
+        found = {}
+        for start in range(0, len(pairs), 400):
+            batch = pairs[start:start + 400]
+            clause = " OR ".join(["(subject_id = ? AND problem_id = ?)"] * len(batch))
+            params = [value for pair in batch for value in pair]
+            for subject_id, problem_id, score, attempt in conn.execute(
+                    f"SELECT subject_id, problem_id, score, attempt FROM best_attempts WHERE {clause}", params):
+                found[(subject_id, problem_id)] = (score, attempt)
+        return found
+
+    def pending_submissions(self) -> list[dict]:
+        """Best attempts still waiting for a successful analysis."""
+        return [json.loads(row[0]) for row in self._connect().execute(
+            "SELECT submission FROM best_attempts WHERE analyzed = 0")]
+
+    def record_events(self, submissions: list[dict], last_event_id: int, last_timestamp: str | None) -> None:
+        """
+        Store new best attempts as pending and advance the event cursor,
+        in one transaction so a crash can't skip events.
+        """
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO best_attempts VALUES (?, ?, ?, ?, ?, 0)",
+                [(str(sub["SubjectID"]), str(sub["ProblemID"]), sub.get("Score"), sub.get("Attempt"),
+                  json.dumps(sub, default=str)) for sub in submissions])
+            conn.executemany(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                [("last_event_id", str(last_event_id)), ("last_timestamp", str(last_timestamp))])
+
+    def save_analyses(self, student_analysis: list[dict]) -> None:
+        """Store analyses and mark their pairs as analyzed."""
+        now = time.time()
+        rows = [(str(entry.get("student_id")), str(entry.get("problem_id")), json.dumps(entry), now)
+                for entry in student_analysis]
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?)", rows)
+            conn.executemany(
+                "UPDATE best_attempts SET analyzed = 1 WHERE subject_id = ? AND problem_id = ?",
+                [row[:2] for row in rows])
+
+    def analyses(self) -> list[dict]:
+        return [json.loads(row[0]) for row in self._connect().execute(
+            "SELECT analysis FROM analyses ORDER BY subject_id, problem_id")]
+
+    def clear(self) -> None:
+        conn = self._connect()
+        with conn:
+            conn.executescript(
+                "DELETE FROM meta; DELETE FROM best_attempts; DELETE FROM analyses;")
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -1,21 +1,57 @@
+import functools
 import os
 
-from dotenv import load_dotenv
-
-load_dotenv()
 PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
-print(f"Project Root Folder: {PROJECT_ROOT}")
+# KINTSUGI_DATASET_DIR points every path below at another export, e.g. the
+# synthetic datasets the benchmarks generate
+DATASET_DIR = os.environ.get(
+    "KINTSUGI_DATASET_DIR") or os.path.join(PROJECT_ROOT, "dataset")
 MAINTABLE_PATH = os.path.join(
-    PROJECT_ROOT, "dataset", "CodeWorkout", "MainTable.csv")
+    DATASET_DIR, "CodeWorkout", "MainTable.csv")
 CODESTATES_TABLE_PATH = os.path.join(
-    PROJECT_ROOT, "dataset", "CodeWorkout", "LinkTables", "CodeStates.csv")
+    DATASET_DIR, "CodeWorkout", "LinkTables", "CodeStates.csv")
 SUBJECT_TABLE_PATH = os.path.join(
-    PROJECT_ROOT, "dataset", "CodeWorkout", "LinkTables", "Subject.csv")
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+    DATASET_DIR, "CodeWorkout", "LinkTables", "Subject.csv")
 BATCH_SIZE = 50
-RATE_TIME_SECONDS = 4  # 15 requests per minute => 60/15 = 4 seconds between requests
+REQUESTS_PER_MINUTE = 15  # Gemini free tier quota
+TOKENS_PER_MINUTE = 250_000
+MAX_CONCURRENT_REQUESTS = 4
+MAX_RETRIES = 5
+MAX_PROMPT_TOKENS = 100_000  # Input token budget per analysis request
+MAX_SUBMISSIONS_PER_REQUEST = 100  # Keeps each JSON response under the output limit
+PROGRESSION_TOKENS_PER_STUDENT = 4_000  # Attempt-history budget per student in progression mode
+CONTEXT_CACHE_TTL_SECONDS = 3600  # Lifetime of the cached system instruction
 TOPICS_JSON_PATH = os.path.join(
-    PROJECT_ROOT, "dataset", "Topics", "java_topics.json")
+    DATASET_DIR, "Topics", "java_topics.json")
 
 PROBLEM_PROMPT_PATH = os.path.join(
-    PROJECT_ROOT,  "dataset", "CodeWorkout", "Problem_Prompts", "problem_prompts.csv")
+    DATASET_DIR, "CodeWorkout", "Problem_Prompts", "problem_prompts.csv")
+
+# Course order of the Spring 2019 assignments: the first three are
+# compared with the last two in class summaries
+EARLY_ASSIGNMENTS = [439, 487, 492]
+LATE_ASSIGNMENTS = [494, 502]
+
+CACHE_DIR = os.path.join(DATASET_DIR, ".cache")
+STREAM_CHUNK_SIZE = 100_000  # MainTable rows read per chunk in streaming mode
+RESPONSE_CACHE_PATH = os.path.join(CACHE_DIR, "responses.sqlite")
+RESPONSE_CACHE_MAX_BYTES = 256 * 1024 * 1024  # LRU entries evicted beyond this
+BATCH_JOBS_DIR = os.path.join(CACHE_DIR, "batch_jobs")
+TRACE_DIR = os.path.join(CACHE_DIR, "traces")  # JSONL span traces and profiles
+
+# Persisted analysis state for incremental runs (not a cache: deleting it
+# means re-analyzing the full history)
+STATE_DIR = os.path.join(DATASET_DIR, ".state")
+CHECKPOINT_PATH = os.path.join(STATE_DIR, "checkpoint.sqlite")
+RESULTS_DB_PATH = os.path.join(STATE_DIR, "results.sqlite")
+
+REPORTS_DIR = os.path.join(DATASET_DIR, "reports")  # Class summary plots and JSON
+
+
+@functools.cache
+def get_gemini_api_key() -> str | None:
+    """Read GEMINI_API_KEY, loading .env on first use rather than at import."""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return os.environ.get("GEMINI_API_KEY")
@@ -1,8 +1,26 @@
 
 
-from utils.constants import MAINTABLE_PATH, CODESTATES_TABLE_PATH, PROBLEM_PROMPT_PATH, SUBJECT_TABLE_PATH, TOPICS_JSON_PATH
+from collections.abc import Iterator
+from utils.constants import CACHE_DIR, MAINTABLE_PATH, CODESTATES_TABLE_PATH, PROBLEM_PROMPT_PATH, STREAM_CHUNK_SIZE, SUBJECT_TABLE_PATH, TOPICS_JSON_PATH
+from utils.telemetry import span
 import pandas as pd
+import hashlib
 import json
+import os
+import sqlite3
+
+# Bump when the cached frame layout changes so old cache files are ignored
+CACHE_VERSION = 1
+
+# Low-cardinality text columns stored as categoricals
+CATEGORICAL_COLUMNS = [
+    "EventType", "TermID", "ServerTimezone", "CourseID", "CourseSectionID",
+    "ToolInstances", "CompileMessageType", "Compile.Result",
+]
+
+# Integer identifier columns downcast to int32 when they fit
+INT32_COLUMNS = ["SubjectID", "AssignmentID",
+                 "ProblemID", "CodeStateID", "Attempt", "Order"]
 
 
 def load_data():
@@ -10,13 +28,19 @@ def load_data():
     try:
         print("Loading datasets...")
 
-        main_table = pd.read_csv(MAINTABLE_PATH)
+        with span("read_csv", table="MainTable") as s:
+            main_table = pd.read_csv(MAINTABLE_PATH)
+            s.set(rows=len(main_table))
         print(f"Main table: {len(main_table):,} rows")
 
-        codestate_table = pd.read_csv(CODESTATES_TABLE_PATH)
+        with span("read_csv", table="CodeStates") as s:
+            codestate_table = pd.read_csv(CODESTATES_TABLE_PATH)
+            s.set(rows=len(codestate_table))
         print(f"CodeState table: {len(codestate_table):,} rows")
 
-        subject_table = pd.read_csv(SUBJECT_TABLE_PATH)
+        with span("read_csv", table="Subject") as s:
+            subject_table = pd.read_csv(SUBJECT_TABLE_PATH)
+            s.set(rows=len(subject_table))
         print(f"Subject table: {len(subject_table):,} rows")
 
         return main_table, codestate_table, subject_table
@@ -26,7 +50,77 @@ def load_data():
         return None, None, None
 
 
-def load_joined_datasets():
+# SQLite caps bound parameters per statement (999 on older builds)
+SQLITE_MAX_PARAMS = 900
+
+
+def _source_fingerprint(paths: tuple[str, ...] = (MAINTABLE_PATH, CODESTATES_TABLE_PATH, SUBJECT_TABLE_PATH)) -> str | None:
+    """
+    Hash the size and mtime of every source CSV.
+    Returns None if any of them is missing.
+    """
+    digest = hashlib.sha256(f"v{CACHE_VERSION}".encode())
+
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+
+    return digest.hexdigest()[:16]
+
+
+def _joined_cache_path() -> str | None:
+    fingerprint = _source_fingerprint()
+    if fingerprint is None:
+        return None
+    return os.path.join(CACHE_DIR, f"joined-{fingerprint}.parquet")
+
+
+def optimize_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Shrink the joined frame: categoricals for repeated labels,
+    int32 for integer IDs that have no missing values.
+    """
+    df = df.copy()
+
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+
+    for col in INT32_COLUMNS:
+        if col not in df.columns or not pd.api.types.is_numeric_dtype(df[col]):
+            continue
+        values = df[col]
+        if values.isna().any() or (values % 1 != 0).any():
+            continue
+        if values.min() >= -2**31 and values.max() < 2**31:
+            df[col] = values.astype("int32")
+
+    return df
+
+
+def _write_cache(df: pd.DataFrame, cache_path: str) -> None:
+    """Write the joined frame to cache_path and drop stale cache files."""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        df.to_parquet(tmp_path, index=False, row_group_size=100_000)
+        os.replace(tmp_path, cache_path)
+    except (ImportError, OSError) as e:
+        print(f"Warning: could not write dataset cache: {e}")
+        return
+
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        if name.startswith("joined-") and path != cache_path:
+            os.remove(path)
+
+    print(f"Cached joined dataset at {cache_path}")
+
+
+def _join_tables() -> pd.DataFrame | None:
     main_table, codestate_table, subject_table = load_data()
 
     if main_table is None or codestate_table is None or subject_table is None:
@@ -34,10 +128,18 @@ def load_joined_datasets():
         return None
 
     print("\nJoining datasets...")
-    data = main_table.merge(codestate_table, on="CodeStateID")
+    with span("join") as s:
+        data = main_table.merge(codestate_table, on="CodeStateID")
 
-    full_data = data.merge(subject_table, on="SubjectID")
-    print(f"Joined dataset: {len(full_data):,} rows")
+        full_data = optimize_dtypes(data.merge(subject_table, on="SubjectID"))
+        print(f"Joined dataset: {len(full_data):,} rows")
+
+        # Cluster rows by the common slice keys so Parquet row-group statistics
+        # let filtered reads skip everything outside the slice
+        sort_keys = [c for c in ("TermID", "ProblemID") if c in full_data.columns]
+        full_data = full_data.sort_values(
+            sort_keys, kind="stable").reset_index(drop=True)
+        s.set(rows=len(full_data))
 
     print("Datasets joined successfully.")
 
@@ -47,62 +149,374 @@ def load_joined_datasets():
     return full_data
 
 
-def load_topics_json() -> dict | None:
+def _slice_frame(df: pd.DataFrame, terms: list[str] | None = None, problems: list[int] | None = None,
+                 columns: list[str] | None = None) -> pd.DataFrame:
+    """Apply the term/problem filters and column projection in memory."""
+    mask = pd.Series(True, index=df.index)
+    if terms is not None:
+        mask &= df["TermID"].isin(terms)
+    if problems is not None:
+        mask &= df["ProblemID"].isin(problems)
+
+    sliced = df[mask] if columns is None else df.loc[mask, columns]
+    return sliced.reset_index(drop=True)
+
+
+def _read_cache(cache_path: str, terms: list[str] | None = None, problems: list[int] | None = None,
+                columns: list[str] | None = None) -> pd.DataFrame:
+    """Read only the requested columns and row groups from the Parquet cache."""
+    filters = []
+    if terms is not None:
+        filters.append(("TermID", "in", list(terms)))
+    if problems is not None:
+        filters.append(("ProblemID", "in", [int(p) for p in problems]))
+
+    return pd.read_parquet(cache_path, columns=columns, filters=filters or None)
+
 
+def _scan_csvs(terms: list[str] | None = None, problems: list[int] | None = None,
+               columns: list[str] | None = None, chunk_size: int = 500_000) -> pd.DataFrame | None:
+    """
+    Build a slice straight from the CSVs without materializing the full join.
+
+    MainTable is read in chunks and filtered before the join, so only the
+    CodeStates rows referenced by the slice are kept in memory.
+    """
     try:
-        with open(TOPICS_JSON_PATH, 'r') as f:
-            topics = json.load(f)
-        print(f"Loaded topics from {TOPICS_JSON_PATH}")
-        return topics
-    except FileNotFoundError:
-        print(f"Error: {TOPICS_JSON_PATH} not found.")
+        main_header = pd.read_csv(MAINTABLE_PATH, nrows=0).columns
+        codestate_header = pd.read_csv(CODESTATES_TABLE_PATH, nrows=0).columns
+        subject_header = pd.read_csv(SUBJECT_TABLE_PATH, nrows=0).columns
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
         return None
-    except json.JSONDecodeError as e:
-        print(f"Error decoding JSON from {TOPICS_JSON_PATH}: {e}")
+
+    def wanted(header: pd.Index, keys: set[str]) -> list[str]:
+        return [c for c in header if columns is None or c in columns or c in keys]
+
+    filter_keys = {"SubjectID", "CodeStateID"}
+    if terms is not None:
+        filter_keys.add("TermID")
+    if problems is not None:
+        filter_keys.add("ProblemID")
+
+    print("Scanning MainTable...")
+    chunks = []
+    for chunk in pd.read_csv(MAINTABLE_PATH, usecols=wanted(main_header, filter_keys),
+                             chunksize=chunk_size):
+        chunks.append(_slice_frame(chunk, terms, problems))
+    main_table = pd.concat(chunks, ignore_index=True)
+    print(f"Main table slice: {len(main_table):,} rows")
+
+    needed_ids = set(main_table["CodeStateID"].unique())
+    chunks = []
+    for chunk in pd.read_csv(CODESTATES_TABLE_PATH, usecols=wanted(codestate_header, {"CodeStateID"}),
+                             chunksize=chunk_size):
+        chunks.append(chunk[chunk["CodeStateID"].isin(needed_ids)])
+    codestate_table = pd.concat(chunks, ignore_index=True)
+    print(f"CodeState table slice: {len(codestate_table):,} rows")
+
+    subject_table = pd.read_csv(
+        SUBJECT_TABLE_PATH, usecols=wanted(subject_header, {"SubjectID"}))
+
+    data = main_table.merge(codestate_table, on="CodeStateID")
+    data = optimize_dtypes(data.merge(subject_table, on="SubjectID"))
+    print(f"Joined slice: {len(data):,} rows")
+
+    return data if columns is None else data[columns]
+
+
+def load_joined_datasets(terms: list[str] | None = None, problems: list[int] | None = None,
+                         columns: list[str] | None = None, rebuild_cache: bool = False,
+                         use_cache: bool = True) -> pd.DataFrame | None:
+    """
+    Load MainTable joined with CodeStates and Subject.
+
+    The joined frame is cached as Parquet, keyed by the size and mtime of
+    the source CSVs, so it is rebuilt automatically when any of them change.
+    Slices are read from the cache with column projection and row-group
+    filtering, so unused columns and terms/problems are never loaded.
+
+    Args:
+        terms: Only keep rows with these TermIDs
+        problems: Only keep rows with these ProblemIDs
+        columns: Only return these columns
+        rebuild_cache: Ignore any existing cache and re-join from the CSVs
+        use_cache: Set to False to scan the CSVs directly (never builds the
+            full join in memory, useful for exports that don't fit in RAM)
+    """
+    with span("load", cache_hits=0) as s:
+        data = _load_joined(terms, problems, columns, rebuild_cache, use_cache, s)
+        if data is not None:
+            s.set(rows=len(data))
+        return data
+
+
+def _load_joined(terms: list[str] | None, problems: list[int] | None, columns: list[str] | None,
+                 rebuild_cache: bool, use_cache: bool, load_span) -> pd.DataFrame | None:
+    if not use_cache:
+        return _scan_csvs(terms, problems, columns)
+
+    cache_path = _joined_cache_path()
+
+    if cache_path and not rebuild_cache and os.path.exists(cache_path):
+        try:
+            data = _read_cache(cache_path, terms, problems, columns)
+            print(f"Loaded joined dataset from cache: {len(data):,} rows")
+            load_span.set(cache_hits=1)
+            return data
+        except (ImportError, OSError) as e:
+            print(f"Warning: could not read dataset cache: {e}")
+
+    full_data = _join_tables()
+    if full_data is None:
         return None
 
-# utils/dataset.py or wherever you load data
+    if cache_path:
+        _write_cache(full_data, cache_path)
 
+    if terms is None and problems is None and columns is None:
+        return full_data
+    return _slice_frame(full_data, terms, problems, columns)
 
-def load_problem_descriptions() -> dict[str, str]:
+
+def _codestate_index_path() -> str | None:
+    fingerprint = _source_fingerprint((CODESTATES_TABLE_PATH,))
+    if fingerprint is None:
+        return None
+    return os.path.join(CACHE_DIR, f"codestates-{fingerprint}.sqlite")
+
+
+def build_codestate_index(rebuild: bool = False, chunk_size: int = STREAM_CHUNK_SIZE) -> str | None:
     """
-    Load problem descriptions from LinkTable.csv or wherever they're stored.
-    Returns dict mapping problem_id -> problem_description
+    Build an on-disk SQLite lookup of CodeStates keyed by CodeStateID.
+
+    CodeStates.csv is streamed in chunks, so the index can be built for
+    exports whose code text doesn't fit in memory. Like the joined cache,
+    it is keyed by the CSV's size and mtime.
+
+    Returns the index path, or None if CodeStates.csv is missing.
     """
-    # Adjust path/column names based on your actual data
-    problems_df = pd.read_csv(PROBLEM_PROMPT_PATH)
+    index_path = _codestate_index_path()
+    if index_path is None:
+        print(f"Error: {CODESTATES_TABLE_PATH} not found.")
+        return None
+
+    if os.path.exists(index_path) and not rebuild:
+        return index_path
+
+    print("Building CodeState index...")
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = index_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    header = pd.read_csv(CODESTATES_TABLE_PATH, nrows=0).columns.tolist()
+    others = [c for c in header if c != "CodeStateID"]
+    column_sql = ", ".join(f'"{c}"' for c in others)
+    placeholders = ", ".join("?" * len(header))
+
+    rows = 0
+    with sqlite3.connect(tmp_path) as conn:
+        conn.execute(
+            f'CREATE TABLE code_states ("CodeStateID" PRIMARY KEY, {column_sql})')
+        for chunk in pd.read_csv(CODESTATES_TABLE_PATH, chunksize=chunk_size):
+            chunk = chunk[["CodeStateID"] + others].astype(object)
+            chunk = chunk.where(chunk.notna(), None)
+            conn.executemany(
+                f"INSERT OR REPLACE INTO code_states VALUES ({placeholders})",
+                chunk.itertuples(index=False, name=None))
+            rows += len(chunk)
+    conn.close()
+    os.replace(tmp_path, index_path)
+
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        if name.startswith("codestates-") and path != index_path:
+            os.remove(path)
+
+    print(f"CodeState index: {rows:,} rows at {index_path}")
+    return index_path
+
+
+def lookup_code_states(conn: sqlite3.Connection, code_state_ids) -> pd.DataFrame:
+    """Fetch the CodeStates rows for code_state_ids from the SQLite index."""
+    ids = [v.item() if hasattr(v, "item") else v for v in pd.unique(
+        pd.Series(code_state_ids))]
+
+    frames = []
+    for start in range(0, len(ids), SQLITE_MAX_PARAMS):
+        batch = ids[start:start + SQLITE_MAX_PARAMS]
+        query = f'SELECT * FROM code_states WHERE "CodeStateID" IN ({", ".join("?" * len(batch))})'
+        frames.append(pd.read_sql_query(query, conn, params=batch))
+
+    if not frames:
+        columns = [row[1]
+                   for row in conn.execute("PRAGMA table_info(code_states)")]
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+
+def iter_event_chunks(terms: list[str] | None = None, problems: list[int] | None = None,
+                      columns: list[str] | None = None,
+                      chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    Stream MainTable alone, filtered, one chunk at a time. No code states
+    are looked up, so a pass over the event log stays cheap.
+    """
+    try:
+        main_header = pd.read_csv(MAINTABLE_PATH, nrows=0).columns
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        return
 
-    problem_map = {}
-    for _, row in problems_df.iterrows():
-        problem_id = str(row['ProblemID'])
-        description = row['Requirement']  # or whatever column has it
-        problem_map[problem_id] = description
+    keys = {"TermID", "ProblemID"}
+    usecols = [c for c in main_header if columns is None or c in columns or c in keys]
+    for chunk in pd.read_csv(MAINTABLE_PATH, usecols=usecols, chunksize=chunk_size):
+        chunk = _slice_frame(chunk, terms, problems, columns)
+        if not chunk.empty:
+            yield chunk
 
-    return problem_map
 
+def iter_joined_chunks(terms: list[str] | None = None, problems: list[int] | None = None,
+                       columns: list[str] | None = None,
+                       chunk_size: int = STREAM_CHUNK_SIZE,
+                       event_ids: set[int] | None = None) -> Iterator[pd.DataFrame]:
+    """
+    Stream the joined dataset one MainTable chunk at a time.
 
-def get_best_attempts(df: pd.DataFrame) -> pd.DataFrame:
+    Each chunk is filtered, then joined against the on-disk CodeState index
+    and the (small) Subject table, so peak memory is bounded by chunk_size
+    rather than by the size of the export. Given event_ids, only those
+    MainTable events are kept, before any code state is looked up.
     """
-    Returns a DataFrame with only the best attempt (highest Score) 
-    for each student-problem pair.
+    index_path = build_codestate_index(chunk_size=chunk_size)
+    if index_path is None:
+        return
+
+    try:
+        main_header = pd.read_csv(MAINTABLE_PATH, nrows=0).columns
+        subject_table = pd.read_csv(SUBJECT_TABLE_PATH)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        return
+
+    keys = {"SubjectID", "CodeStateID", "TermID", "ProblemID", "EventID"}
+    usecols = [c for c in main_header if columns is None or c in columns or c in keys]
 
-    If there are ties, takes the latest attempt (highest Attempt number).
+    conn = sqlite3.connect(index_path)
+    try:
+        for chunk in pd.read_csv(MAINTABLE_PATH, usecols=usecols, chunksize=chunk_size):
+            chunk = _slice_frame(chunk, terms, problems)
+            if event_ids is not None:
+                chunk = chunk[chunk["EventID"].isin(event_ids)]
+            if chunk.empty:
+                continue
+
+            code_states = lookup_code_states(conn, chunk["CodeStateID"])
+            code_states["CodeStateID"] = code_states["CodeStateID"].astype(
+                chunk["CodeStateID"].dtype)
+
+            data = chunk.merge(code_states, on="CodeStateID")
+            data = optimize_dtypes(data.merge(subject_table, on="SubjectID"))
+            yield data if columns is None else data[columns]
+    finally:
+        conn.close()
+
+
+def iter_submissions(terms: list[str] | None = None, problems: list[int] | None = None,
+                     columns: list[str] | None = None,
+                     chunk_size: int = STREAM_CHUNK_SIZE,
+                     event_ids: set[int] | None = None) -> Iterator[dict]:
+    """Lazily yield one submission dict per row of the streamed join (see iter_joined_chunks)."""
+    for chunk in iter_joined_chunks(terms, problems, columns, chunk_size, event_ids):
+        yield from chunk.to_dict(orient="records")
+
+
+def iter_submission_batches(batch_size: int, terms: list[str] | None = None,
+                            problems: list[int] | None = None, columns: list[str] | None = None,
+                            chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[list[dict]]:
+    """
+    Lazily yield lists of batch_size submission dicts from the streamed join.
+    The last batch may be smaller.
     """
-    # Filter to only Run.Program events (these have the Score)
-    run_events = df[df['EventType'] == 'Run.Program'].copy()
+    batch: list[dict] = []
+    for submission in iter_submissions(terms, problems, columns, chunk_size):
+        batch.append(submission)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
 
-    # Sort by Score (desc) then Attempt (desc) to handle ties
-    run_events = run_events.sort_values(
-        by=['SubjectID', 'ProblemID', 'Score', 'Attempt'],
-        ascending=[True, True, False, False]
-    )
+    if batch:
+        yield batch
 
-    # Keep first row for each student-problem pair (which is now the best)
-    best_attempts = run_events.groupby(
-        ['SubjectID', 'ProblemID']).first().reset_index()
 
-    print(f"Best attempts: {len(best_attempts):,} rows")
-    print(f"  Unique students: {best_attempts['SubjectID'].nunique()}")
-    print(f"  Unique problems: {best_attempts['ProblemID'].nunique()}")
+def load_new_events(since_event_id: int | None = None, terms: list[str] | None = None,
+                    columns: list[str] | None = None,
+                    chunk_size: int = STREAM_CHUNK_SIZE) -> pd.DataFrame | None:
+    """
+    Joined rows for MainTable events with EventID > since_event_id.
+
+    Built for incremental runs: the CSVs are scanned in chunks, but only
+    the new events are kept and only their code states are looked up, so
+    nothing is joined, cached or indexed for the rest of the history.
+    Assumes exports are append-only, i.e. new events get higher EventIDs.
+    Returns None if a source CSV is missing.
+    """
+    keys = {"SubjectID", "CodeStateID", "TermID", "EventID"}
+
+    try:
+        main_header = pd.read_csv(MAINTABLE_PATH, nrows=0).columns
+        usecols = [c for c in main_header if columns is None or c in columns or c in keys]
+
+        events = []
+        for chunk in pd.read_csv(MAINTABLE_PATH, usecols=usecols, chunksize=chunk_size):
+            if since_event_id is not None:
+                chunk = chunk[chunk["EventID"] > since_event_id]
+            chunk = _slice_frame(chunk, terms, None)
+            if not chunk.empty:
+                events.append(chunk)
+        if not events:
+            return pd.DataFrame(columns=usecols)
+        events = pd.concat(events, ignore_index=True)
+
+        wanted = set(events["CodeStateID"].dropna().unique())
+        code_states = pd.concat(
+            (chunk[chunk["CodeStateID"].isin(wanted)]
+             for chunk in pd.read_csv(CODESTATES_TABLE_PATH, chunksize=chunk_size)),
+            ignore_index=True)
+        subject_table = pd.read_csv(SUBJECT_TABLE_PATH)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        return None
+
+    data = events.merge(code_states, on="CodeStateID").merge(
+        subject_table, on="SubjectID")
+    print(f"Loaded {len(data):,} new events"
+          + (f" after EventID {since_event_id}" if since_event_id is not None else ""))
+    data = optimize_dtypes(data)
+    return data if columns is None else data[columns]
+
+
+def load_topics_json() -> dict | None:
+
+    try:
+        with open(TOPICS_JSON_PATH, 'r') as f:
+            topics = json.load(f)
+        print(f"Loaded topics from {TOPICS_JSON_PATH}")
+        return topics
+    except FileNotFoundError:
+        print(f"Error: {TOPICS_JSON_PATH} not found.")
+        return None
+    except json.JSONDecodeError as e:
+        print(f"Error decoding JSON from {TOPICS_JSON_PATH}: {e}")
+        return None
+
+def load_problem_descriptions() -> dict[str, str]:
+    """
+    Load problem descriptions from problem_prompts.csv.
+    Returns dict mapping problem_id -> problem_description
+    """
+    problems_df = pd.read_csv(PROBLEM_PROMPT_PATH, usecols=[
+                              "ProblemID", "Requirement"])
+    return dict(zip(problems_df["ProblemID"].astype(str), problems_df["Requirement"]))
 
-    return best_attempts
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from utils.constants import RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_PATH
+
+
+class ResponseCache:
+    """
+    On-disk LLM response cache keyed by a hash of everything that affects
+    the output: model, system instruction, generation config and contents.
+
+    Entries are evicted least-recently-used first once the stored text
+    exceeds max_bytes. The SQLite file is opened on first use.
+    """
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._conn = None
+
+    @staticmethod
+    def make_key(model: str, system_instruction: str, config: dict, contents: str) -> str:
+        payload = json.dumps({
+            "model": model,
+            "system_instruction": system_instruction,
+            "config": config,
+            "contents": contents,
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )""")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+        return self._conn
+
+    def get(self, key: str) -> str | None:
+        """Return the cached response text for key, or None on a miss."""
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT text FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        with conn:
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?",
+                         (time.time(), key))
+        return row[0]
+
+    def put(self, key: str, text: str) -> None:
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, text, len(text.encode()), now, now))
+        self.evict()
+
+    def evict(self) -> int:
+        """Drop least recently used entries beyond max_bytes. Returns rows removed."""
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute("""
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(size) OVER (ORDER BY last_access DESC, key) AS running
+                        FROM responses
+                    ) WHERE running > ?
+                )""", (self.max_bytes,))
+        return cursor.rowcount
+
+    def clear(self) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM responses")
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,230 @@
+import json
+import os
+import sqlite3
+import time
+
+from utils.constants import RESULTS_DB_PATH
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    command TEXT NOT NULL,
+    model TEXT,
+    params TEXT,
+    class_summary TEXT
+);
+CREATE TABLE IF NOT EXISTS student_analyses (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    subject_id TEXT NOT NULL,
+    problem_id TEXT NOT NULL,
+    score REAL,
+    recommended_intervention TEXT,
+    duplicate_of TEXT,
+    cluster_of TEXT,
+    confidence REAL
+);
+CREATE TABLE IF NOT EXISTS gaps (
+    analysis_id INTEGER NOT NULL REFERENCES student_analyses (id),
+    run_id INTEGER NOT NULL,
+    subject_id TEXT NOT NULL,
+    problem_id TEXT NOT NULL,
+    gap TEXT,
+    evidence TEXT,
+    missing_concept TEXT,
+    severity TEXT
+);
+CREATE TABLE IF NOT EXISTS predictions (
+    analysis_id INTEGER NOT NULL REFERENCES student_analyses (id),
+    run_id INTEGER NOT NULL,
+    subject_id TEXT NOT NULL,
+    problem_id TEXT NOT NULL,
+    at_risk_topic TEXT,
+    reason TEXT,
+    prerequisite_gap TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_analyses_subject ON student_analyses (run_id, subject_id);
+CREATE INDEX IF NOT EXISTS idx_analyses_problem ON student_analyses (run_id, problem_id);
+CREATE INDEX IF NOT EXISTS idx_gaps_problem_severity ON gaps (run_id, problem_id, severity);
+CREATE INDEX IF NOT EXISTS idx_gaps_severity ON gaps (run_id, severity);
+CREATE INDEX IF NOT EXISTS idx_gaps_concept ON gaps (run_id, missing_concept COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_gaps_subject ON gaps (run_id, subject_id);
+CREATE INDEX IF NOT EXISTS idx_predictions_subject ON predictions (run_id, subject_id);
+-- Substring topic matches (students_at_risk) can't use an index on the topic
+DROP INDEX IF EXISTS idx_predictions_topic;
+"""
+
+# Columns added to student_analyses after the first release, for older files
+ADDED_COLUMNS = {"cluster_of": "TEXT", "confidence": "REAL"}
+
+
+class ResultsStore:
+    """
+    SQLite store of analysis results, one row set per run, so results can
+    be queried later without calling the LLM again.
+
+    Gaps and predictions repeat their student and problem IDs so the
+    common filters are single-table index lookups. The file is opened on
+    first use.
+    """
+
+    def __init__(self, path: str = RESULTS_DB_PATH):
+        self.path = path
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(student_analyses)")}
+            with self._conn:
+                for column, kind in ADDED_COLUMNS.items():
+                    if column not in existing:
+                        self._conn.execute(f"ALTER TABLE student_analyses ADD COLUMN {column} {kind}")
+        return self._conn
+
+    def start_run(self, command: str, model: str | None = None, params: dict | None = None) -> int:
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO runs (started_at, command, model, params) VALUES (?, ?, ?, ?)",
+                (time.time(), command, model, json.dumps(params or {}, default=str)))
+        return cursor.lastrowid
+
+    def add_results(self, run_id: int, results: dict) -> int:
+        """
+        Bulk insert a results dict (analyze_student_submissions schema) into
+        run_id and store its class_summary. Returns analyses inserted.
+        """
+        conn = self._connect()
+        students = results.get("student_analysis", [])
+
+        with conn:
+            first_id = (conn.execute("SELECT MAX(id) FROM student_analyses").fetchone()[0] or 0) + 1
+            analyses, gaps, predictions = [], [], []
+            for analysis_id, student in enumerate(students, first_id):
+                subject_id = str(student.get("student_id"))
+                problem_id = str(student.get("problem_id"))
+                analyses.append((analysis_id, run_id, subject_id, problem_id, student.get("score"),
+                                 student.get("recommended_intervention"), student.get("duplicate_of"),
+                                 student.get("cluster_of"), student.get("confidence")))
+                gaps.extend((analysis_id, run_id, subject_id, problem_id, gap.get("gap"), gap.get("evidence"),
+                             gap.get("missing_concept"), gap.get("severity"))
+                            for gap in student.get("knowledge_gaps", []))
+                predictions.extend((analysis_id, run_id, subject_id, problem_id, pred.get("at_risk_topic"),
+                                    pred.get("reason"), pred.get("prerequisite_gap"))
+                                   for pred in student.get("future_predictions", []))
+
+            conn.executemany(
+                "INSERT INTO student_analyses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", analyses)
+            conn.executemany("INSERT INTO gaps VALUES (?, ?, ?, ?, ?, ?, ?, ?)", gaps)
+            conn.executemany("INSERT INTO predictions VALUES (?, ?, ?, ?, ?, ?, ?)", predictions)
+            if "class_summary" in results:
+                conn.execute("UPDATE runs SET class_summary = ? WHERE id = ?",
+                             (json.dumps(results["class_summary"]), run_id))
+
+        return len(analyses)
+
+    def save_run(self, command: str, results: dict, model: str | None = None, params: dict | None = None) -> int:
+        """Record a finished run and all of its results. Returns the run id."""
+        run_id = self.start_run(command, model, params)
+        count = self.add_results(run_id, results)
+        print(f"Saved {count:,} analyses as run {run_id} in {self.path}")
+        return run_id
+
+    def latest_run(self, commands: list[str] | None = None, exclude_models: list[str] | None = None) -> int | None:
+        """Newest run, optionally only of these commands and not by these models."""
+        clauses, params = [], []
+        if commands is not None:
+            clauses.append(f"command IN ({', '.join('?' * len(commands))})")
+            params.extend(commands)
+        if exclude_models:
+            clauses.append(f"model IS NOT NULL AND model NOT IN ({', '.join('?' * len(exclude_models))})")
+            params.extend(exclude_models)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        row = self._connect().execute(f"SELECT MAX(id) FROM runs{where}", params).fetchone()
+        return row[0]
+
+    def get_run(self, run_id: int) -> dict | None:
+        row = self._connect().execute(
+            "SELECT id, started_at, command, model, params FROM runs WHERE id = ?", (run_id,)).fetchone()
+        return dict(row) if row else None
+
+    def runs(self) -> list[dict]:
+        return [dict(row) for row in self._connect().execute("""
+            SELECT r.id, r.started_at, r.command, r.model,
+                   (SELECT COUNT(*) FROM student_analyses a WHERE a.run_id = r.id) AS analyses
+            FROM runs r ORDER BY r.id DESC""")]
+
+    def query_gaps(self, run_id: int, problem_id: str | None = None, severity: str | None = None,
+                   concept: str | None = None, subject_id: str | None = None) -> list[dict]:
+        """Knowledge gaps of run_id matching every given filter."""
+        clauses, params = ["run_id = ?"], [run_id]
+        for column, value in (("problem_id", problem_id), ("severity", severity), ("subject_id", subject_id)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(str(value))
+        if concept is not None:
+            clauses.append("missing_concept = ? COLLATE NOCASE")
+            params.append(concept)
+
+        return [dict(row) for row in self._connect().execute(
+            f"SELECT subject_id, problem_id, severity, missing_concept, gap, evidence FROM gaps "
+            f"WHERE {' AND '.join(clauses)} ORDER BY problem_id, subject_id", params)]
+
+    def students_at_risk(self, run_id: int, topic: str) -> list[dict]:
+        """
+        Students predicted to struggle with topic, or already missing it,
+        matched case-insensitively as a substring.
+        """
+        pattern = f"%{topic}%"
+        return [dict(row) for row in self._connect().execute("""
+            SELECT subject_id, COUNT(*) AS mentions,
+                   GROUP_CONCAT(DISTINCT problem_id) AS problems,
+                   GROUP_CONCAT(DISTINCT topic) AS topics
+            FROM (
+                SELECT subject_id, problem_id, at_risk_topic AS topic FROM predictions
+                WHERE run_id = ? AND at_risk_topic LIKE ?
+                UNION ALL
+                SELECT subject_id, problem_id, missing_concept AS topic FROM gaps
+                WHERE run_id = ? AND missing_concept LIKE ?
+            )
+            GROUP BY subject_id ORDER BY mentions DESC, subject_id""",
+            (run_id, pattern, run_id, pattern))]
+
+    def student_results(self, run_id: int, subject_id: str) -> list[dict]:
+        """
+        Every stored analysis of one student in run_id, with gaps and
+        predictions. One query per table, each on its (run_id, subject_id)
+        index.
+        """
+        conn = self._connect()
+        params = (run_id, str(subject_id))
+        analyses = [dict(row) for row in conn.execute(
+            "SELECT * FROM student_analyses WHERE run_id = ? AND subject_id = ? ORDER BY problem_id", params)]
+        by_id = {}
+        for analysis in analyses:
+            analysis["knowledge_gaps"], analysis["future_predictions"] = [], []
+            by_id[analysis["id"]] = analysis
+
+        for row in conn.execute(
+                "SELECT analysis_id, gap, evidence, missing_concept, severity FROM gaps "
+                "WHERE run_id = ? AND subject_id = ? ORDER BY rowid", params):
+            gap = dict(row)
+            by_id[gap.pop("analysis_id")]["knowledge_gaps"].append(gap)
+        for row in conn.execute(
+                "SELECT analysis_id, at_risk_topic, reason, prerequisite_gap FROM predictions "
+                "WHERE run_id = ? AND subject_id = ? ORDER BY rowid", params):
+            prediction = dict(row)
+            by_id[prediction.pop("analysis_id")]["future_predictions"].append(prediction)
+        return analyses
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,212 @@
+import contextlib
+import contextvars
+import itertools
+import json
+import os
+import resource
+import sys
+import time
+
+# Span attributes summed per span name in the summary table
+SUMMED_ATTRIBUTES = ["rows", "prompt_tokens", "response_tokens", "cached_tokens",
+                     "retries", "cache_hits"]
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and KiB elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class Span:
+    """
+    One timed stage. Use as a context manager; attach counts with set()
+    or add() while it runs.
+    """
+    __slots__ = ("tracer", "id", "parent", "name", "attributes", "_start", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: dict):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.id = None
+        self.parent = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def add(self, name: str, amount: int = 1) -> None:
+        self.attributes[name] = self.attributes.get(name, 0) + amount
+
+    def __enter__(self) -> "Span":
+        parent = _current_span.get()
+        self.parent = parent.id if parent else None
+        self.id = next(self.tracer._ids)
+        self._token = _current_span.set(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        wall = time.perf_counter() - self._start
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.tracer._finish(self, wall)
+
+
+class _NullSpan:
+    """Stand-in returned while tracing is off, so instrumented code costs ~nothing."""
+    __slots__ = ()
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def add(self, name: str, amount: int = 1) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    Collects spans, appending each one to a JSONL trace file as it finishes
+    and keeping per-name totals for summary().
+
+    Args:
+        path: JSONL file to write, or None to only keep the totals
+    """
+
+    def __init__(self, path: str | None = None):
+        self.path = path
+        self._ids = itertools.count(1)
+        self._file = None
+        self._totals: dict[str, dict] = {}
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._file = open(path, "a", buffering=1)
+
+    def span(self, name: str, **attributes) -> Span:
+        return Span(self, name, attributes)
+
+    def _finish(self, span: Span, wall: float) -> None:
+        rss = peak_rss_mb()
+        if self._file:
+            self._file.write(json.dumps({
+                "id": span.id, "parent": span.parent, "name": span.name,
+                "wall_s": round(wall, 6), "peak_rss_mb": round(rss, 1),
+                **span.attributes,
+            }, default=str) + "\n")
+
+        totals = self._totals.setdefault(span.name, {"count": 0, "wall_s": 0.0, "max_s": 0.0})
+        totals["count"] += 1
+        totals["wall_s"] += wall
+        totals["max_s"] = max(totals["max_s"], wall)
+        totals["peak_rss_mb"] = rss
+        for key in SUMMED_ATTRIBUTES:
+            value = span.attributes.get(key)
+            if isinstance(value, (int, float)):
+                totals[key] = totals.get(key, 0) + value
+
+    def summary(self) -> dict[str, dict]:
+        """Per span name: count, total and max wall time, peak RSS and summed counts."""
+        return self._totals
+
+    def print_summary(self) -> None:
+        if not self._totals:
+            return
+        columns = ["rows", "prompt_tokens", "response_tokens", "retries", "cache_hits"]
+        print(f"\n{'stage':<24}{'count':>7}{'total s':>10}{'max s':>9}{'rss MB':>9}"
+              + "".join(f"{c.replace('_tokens', ' tok'):>14}" for c in columns))
+        for name, totals in self._totals.items():
+            print(f"{name:<24}{totals['count']:>7}{totals['wall_s']:>10.3f}{totals['max_s']:>9.3f}"
+                  f"{totals['peak_rss_mb']:>9.0f}"
+                  + "".join(f"{totals[c]:>14,}" if c in totals else f"{'-':>14}" for c in columns))
+        if self.path:
+            print(f"Trace written to {self.path}")
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+_tracer: Tracer | None = None
+
+
+def start_tracing(path: str | None = None) -> Tracer:
+    """Send every span() from now on to a new tracer writing to path."""
+    global _tracer
+    stop_tracing()
+    _tracer = Tracer(path)
+    return _tracer
+
+
+def stop_tracing() -> Tracer | None:
+    """Stop tracing and close the trace file. Returns the finished tracer."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer:
+        tracer.close()
+    return tracer
+
+
+def span(name: str, **attributes) -> Span | _NullSpan:
+    """
+    Time a stage of the pipeline:
+
+        with span("join") as s:
+            ...
+            s.set(rows=len(df))
+
+    A no-op unless start_tracing() was called.
+    """
+    if _tracer is None:
+        return NULL_SPAN
+    return _tracer.span(name, **attributes)
+
+
+def current_span() -> Span | _NullSpan:
+    """The innermost running span, to attach counts from deeper code."""
+    return (_current_span.get() if _tracer is not None else None) or NULL_SPAN
+
+
+@contextlib.contextmanager
+def profiled(path_prefix: str, top: int = 25):
+    """
+    Run the block under cProfile and tracemalloc, then save the profile to
+    <path_prefix>.prof and print the hottest functions and allocation sites.
+    """
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        profile_path = f"{path_prefix}.prof"
+        os.makedirs(os.path.dirname(profile_path) or ".", exist_ok=True)
+        profiler.dump_stats(profile_path)
+        print(f"\nProfile written to {profile_path} (view with `python -m pstats {profile_path}`)")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(top)
+
+        print(f"Peak traced memory: {traced_peak / (1024 * 1024):,.1f} MB. Top allocation sites:")
+        for stat in snapshot.statistics("lineno")[:top // 2]:
+            print(f"  {stat}")